@@ -0,0 +1,302 @@
+"""
+Process-wide gateway to the LLM provider.
+
+One backend client is created per process and reused, so connections and
+their TLS sessions stay alive between calls. Every call goes through a
+per-model concurrency limit under a deadline that covers both the wait for
+a slot and the call itself, and queue and call times are recorded per model.
+
+The backend is pluggable through ``EDUSIMPLIFY_LLM_BACKEND``: ``"genai"``
+(the default) calls Google Gemini, ``"fake"`` answers locally for tests and
+development, and any other value is imported as a dotted path.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_CONCURRENCY = 8
+ASYNC_POLL_INTERVAL = 0.01
+
+_lock = threading.Lock()
+_gateway = None
+
+
+class GatewayTimeout(RuntimeError):
+    """Raised when a call misses its deadline, waiting for a slot or in flight."""
+
+
+def _response_text(response):
+    # Different genai client versions may expose the text differently.
+    # Try common accessors then fall back to str(response).
+    if hasattr(response, "text"):
+        return getattr(response, "text")
+    if isinstance(response, dict):
+        return response.get("text") or response.get("responseText")
+    return str(response)
+
+
+class GenAIBackend:
+    """Google Gemini through one shared ``genai.Client``."""
+
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google import genai
+
+                    api_key = getattr(settings, "GEMINI_API_KEY", None) or os.environ.get("GEMINI_API_KEY")
+                    if not api_key:
+                        raise RuntimeError("Gemini API key not configured (GEMINI_API_KEY)")
+                    self._client = genai.Client(api_key=api_key)
+        return self._client
+
+    @staticmethod
+    def _config(timeout):
+        from google.genai import types
+
+        return types.GenerateContentConfig(http_options=types.HttpOptions(timeout=max(1, int(timeout * 1000))))
+
+    def generate(self, model, prompt, timeout):
+        response = self.client.models.generate_content(model=model, contents=prompt, config=self._config(timeout))
+        return _response_text(response)
+
+    async def agenerate(self, model, prompt, timeout):
+        response = await self.client.aio.models.generate_content(
+            model=model, contents=prompt, config=self._config(timeout)
+        )
+        return _response_text(response)
+
+    def stream(self, model, prompt, timeout):
+        for chunk in self.client.models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(timeout)
+        ):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+class FakeBackend:
+    """Answers locally after ``EDUSIMPLIFY_FAKE_LLM_DELAY`` seconds, without any network access."""
+
+    def __init__(self, delay=None):
+        self.delay = getattr(settings, "EDUSIMPLIFY_FAKE_LLM_DELAY", 0.0) if delay is None else delay
+
+    @staticmethod
+    def _answer(model, prompt):
+        return f"[{model}] Simplified explanation for: {prompt[-200:]}"
+
+    def generate(self, model, prompt, timeout):
+        time.sleep(min(self.delay, timeout))
+        return self._answer(model, prompt)
+
+    async def agenerate(self, model, prompt, timeout):
+        await asyncio.sleep(self.delay)
+        return self._answer(model, prompt)
+
+    def stream(self, model, prompt, timeout):
+        words = self._answer(model, prompt).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.delay / len(words))
+            yield word if i == 0 else f" {word}"
+
+
+BACKENDS = {"genai": GenAIBackend, "fake": FakeBackend}
+
+
+class _ModelStats:
+    __slots__ = (
+        "calls", "errors", "timeouts", "overruns", "in_flight", "queue_total", "queue_max", "call_total", "call_max"
+    )
+
+    def __init__(self):
+        self.calls = self.errors = self.timeouts = self.overruns = self.in_flight = 0
+        self.queue_total = self.queue_max = self.call_total = self.call_max = 0.0
+
+
+class LLMGateway:
+    """
+    Concurrency-limited, instrumented access to an LLM backend.
+
+    ``concurrency`` maps model names to their maximum number of calls in
+    flight, with ``"default"`` for unlisted models.
+    """
+
+    def __init__(self, backend, concurrency=None, timeout=DEFAULT_TIMEOUT):
+        self.backend = backend
+        self.concurrency = {"default": DEFAULT_CONCURRENCY, **(concurrency or {})}
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._stats = {}
+
+    def _slot(self, model):
+        with self._lock:
+            slot = self._slots.get(model)
+            if slot is None:
+                limit = self.concurrency.get(model, self.concurrency["default"])
+                slot = self._slots[model] = threading.BoundedSemaphore(limit)
+                self._stats[model] = _ModelStats()
+            return slot, self._stats[model]
+
+    def _record(self, stats, queued=None, called=None, outcome=None):
+        with self._lock:
+            if queued is not None:
+                stats.in_flight += 1
+                stats.queue_total += queued
+                stats.queue_max = max(stats.queue_max, queued)
+            if called is not None:
+                stats.in_flight -= 1
+                stats.calls += 1
+                stats.call_total += called
+                stats.call_max = max(stats.call_max, called)
+            if outcome == "timeout":
+                stats.timeouts += 1
+            elif outcome == "overrun":
+                stats.overruns += 1
+            elif outcome == "error":
+                stats.errors += 1
+
+    def _queue_timeout(self, stats, model):
+        self._record(stats, outcome="timeout")
+        return GatewayTimeout(f"timed out waiting for a free {model} slot")
+
+    def generate(self, prompt, model=DEFAULT_MODEL, timeout=None):
+        """
+        Generate a complete answer, blocking the calling thread.
+
+        An answer that arrives after the deadline is still returned (the call
+        has already been paid for) and counted as an overrun.
+        """
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout)
+        slot, stats = self._slot(model)
+        if not slot.acquire(timeout=max(0.0, deadline - started)):
+            raise self._queue_timeout(stats, model)
+
+        call_started = time.monotonic()
+        self._record(stats, queued=call_started - started)
+        outcome = None
+        try:
+            text = self.backend.generate(model, prompt, max(0.001, deadline - call_started))
+            if time.monotonic() > deadline:
+                outcome = "overrun"
+            return text
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            slot.release()
+            self._record(stats, called=time.monotonic() - call_started, outcome=outcome)
+
+    async def agenerate(self, prompt, model=DEFAULT_MODEL, timeout=None):
+        """Generate a complete answer without blocking the event loop."""
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout)
+        slot, stats = self._slot(model)
+        # The slot is shared with synchronous callers, so poll rather than block the loop
+        while not slot.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise self._queue_timeout(stats, model)
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+        call_started = time.monotonic()
+        self._record(stats, queued=call_started - started)
+        outcome = None
+        remaining = max(0.001, deadline - call_started)
+        try:
+            return await asyncio.wait_for(self.backend.agenerate(model, prompt, remaining), remaining)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise GatewayTimeout(f"{model} call exceeded its deadline")
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            slot.release()
+            self._record(stats, called=time.monotonic() - call_started, outcome=outcome)
+
+    def stream(self, prompt, model=DEFAULT_MODEL, timeout=None):
+        """Yield the answer in chunks; the slot is held until the stream ends."""
+        started = time.monotonic()
+        deadline = started + (timeout or self.timeout)
+        slot, stats = self._slot(model)
+        if not slot.acquire(timeout=max(0.0, deadline - started)):
+            raise self._queue_timeout(stats, model)
+
+        call_started = time.monotonic()
+        self._record(stats, queued=call_started - started)
+        outcome = None
+        try:
+            for text in self.backend.stream(model, prompt, max(0.001, deadline - call_started)):
+                if time.monotonic() > deadline:
+                    outcome = "timeout"
+                    raise GatewayTimeout(f"{model} stream exceeded its deadline")
+                yield text
+        except GatewayTimeout:
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            slot.release()
+            self._record(stats, called=time.monotonic() - call_started, outcome=outcome)
+
+    def metrics(self):
+        """
+        Per-model call counts, slots in use and queue/call times in milliseconds.
+
+        ``overruns`` counts answers returned after their deadline.
+        """
+        with self._lock:
+            result = {}
+            for model, stats in self._stats.items():
+                calls = stats.calls or 1
+                result[model] = {
+                    "limit": self.concurrency.get(model, self.concurrency["default"]),
+                    "in_flight": stats.in_flight,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "timeouts": stats.timeouts,
+                    "overruns": stats.overruns,
+                    "queue_ms_avg": round(stats.queue_total / calls * 1000, 2),
+                    "queue_ms_max": round(stats.queue_max * 1000, 2),
+                    "call_ms_avg": round(stats.call_total / calls * 1000, 2),
+                    "call_ms_max": round(stats.call_max * 1000, 2),
+                }
+            return result
+
+
+def get_gateway():
+    """Return this process's gateway, building it from settings on first use."""
+    global _gateway
+
+    if _gateway is None:
+        with _lock:
+            if _gateway is None:
+                backend = getattr(settings, "EDUSIMPLIFY_LLM_BACKEND", "genai")
+                backend_class = BACKENDS.get(backend) or import_string(backend)
+                _gateway = LLMGateway(
+                    backend_class(),
+                    concurrency=getattr(settings, "EDUSIMPLIFY_LLM_CONCURRENCY", None),
+                    timeout=getattr(settings, "EDUSIMPLIFY_LLM_TIMEOUT", DEFAULT_TIMEOUT),
+                )
+    return _gateway
+
+
+def reset_gateway():
+    """Drop the process gateway so the next call rebuilds it (after settings change)."""
+    global _gateway
+
+    with _lock:
+        _gateway = None
@@ -0,0 +1,131 @@
+"""
+Bounded conversation history for follow-up questions.
+
+The most recent turns of a conversation are read through the (context,
+created_at) index and added to the prompt verbatim, newest first, until the
+token budget is spent. Older turns are condensed into a short extractive
+summary (the opening of each turn) kept in ``Conversation.metadata``, so the
+summary is extended only with the turns that have just aged out of the window
+and the prompt stays the same size however long the chat runs.
+"""
+import re
+
+from django.conf import settings
+
+from .models import Conversation, Message, stored_parts
+
+SUMMARY_KEY = "history_summary"
+DEFAULT_WINDOW = 10
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_SUMMARY_TOKENS = 300
+# Rough size of a token for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+GIST_CHARS = 160
+
+ROLE_LABELS = {"user": "Student", "agent": "EduSimplify"}
+_sentence_end = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _truncate(text, tokens):
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[: max(0, limit - 1)].rstrip() + "…"
+
+
+def _parts_text(parts):
+    return "\n".join(p.get("text", "") for p in parts or [] if p.get("kind") == "text").strip()
+
+
+def _gist(role, text):
+    """The first sentence of a turn, capped at GIST_CHARS"""
+    first = _sentence_end.split(" ".join(text.split()), 1)[0]
+    if len(first) > GIST_CHARS:
+        first = first[: GIST_CHARS - 1].rstrip() + "…"
+    return f"{ROLE_LABELS[role]}: {first}"
+
+
+def _summary_lines(conv, before_id):
+    """
+    Summary lines for every turn older than message ``before_id``, extending the cached summary.
+
+    The cache stores ``[message id, line]`` pairs, so a window starting
+    before the cached end gets only the lines older than it. Call with the
+    conversation row locked: the metadata is read and written back here.
+    """
+    metadata = conv.metadata or {}
+    cached = metadata.get(SUMMARY_KEY) or {}
+    if not all(isinstance(line, list) for line in cached.get("lines", [])):
+        # Written before lines carried their message id; rebuild it
+        cached = {}
+    through = cached.get("through", 0)
+    lines = [tuple(line) for line in cached.get("lines", [])]
+    if through >= before_id - 1:
+        return [line for pk, line in lines if pk < before_id]
+
+    aged = (
+        Message.objects.filter(
+            context=conv, role__in=ROLE_LABELS, id__gt=through, id__lt=before_id
+        )
+        .order_by("id")
+        .values_list("id", "role", "parts", "blob__data")
+    )
+    extended = False
+    for pk, role, parts, blob_data in aged:
+        text = _parts_text(stored_parts(parts, blob_data))
+        if text:
+            lines.append((pk, _gist(role, text)))
+        through = pk
+        extended = True
+    if not extended:
+        return [line for _, line in lines]
+
+    # Keep the newest lines that fit the summary budget
+    budget = getattr(settings, "EDUSIMPLIFY_HISTORY_SUMMARY_TOKENS", DEFAULT_SUMMARY_TOKENS)
+    while lines and sum(estimate_tokens(line) for _, line in lines) > budget:
+        lines.pop(0)
+
+    metadata[SUMMARY_KEY] = {"through": through, "lines": [list(line) for line in lines]}
+    conv.metadata = metadata
+    Conversation.objects.filter(pk=conv.pk).update(metadata=metadata)
+    return [line for _, line in lines]
+
+
+def conversation_context(conv, before_id=None):
+    """
+    Return the turns of ``conv`` before message ``before_id`` as prompt text, within the token budget.
+
+    ``before_id`` is the message being answered; '' is returned for a new chat.
+    """
+    if conv is None:
+        return ""
+
+    window = getattr(settings, "EDUSIMPLIFY_HISTORY_MESSAGES", DEFAULT_WINDOW)
+    budget = getattr(settings, "EDUSIMPLIFY_HISTORY_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)
+    recent = Message.objects.filter(context=conv, role__in=ROLE_LABELS)
+    if before_id is not None:
+        recent = recent.filter(id__lt=before_id)
+    recent = list(recent.order_by("-created_at", "-id").values_list("id", "role", "parts", "blob__data")[:window])
+    if not recent:
+        return ""
+
+    turns = []
+    for pk, role, parts, blob_data in recent:
+        line = f"{ROLE_LABELS[role]}: {_parts_text(stored_parts(parts, blob_data))}"
+        cost = estimate_tokens(line)
+        if cost > budget:
+            if not turns:
+                # Always keep the latest turn, cut down to what fits
+                turns.append((pk, _truncate(line, budget)))
+            break
+        turns.append((pk, line))
+        budget -= cost
+
+    summary = _summary_lines(conv, before_id=turns[-1][0])
+    sections = []
+    if summary:
+        sections.append("Earlier in this conversation:\n" + "\n".join(summary))
+    sections.append("Recent messages:\n" + "\n".join(line for _, line in reversed(turns)))
+    return "\n\n".join(sections)
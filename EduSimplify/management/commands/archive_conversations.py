@@ -0,0 +1,149 @@
+"""
+Move conversations idle for longer than the retention period out of the database.
+
+Each batch of conversations is locked, re-checked as still idle, written
+with its messages and artifacts as gzip-compressed JSON lines to an archive
+file, flushed, and only then deleted in the same transaction. Only the rows
+written are deleted, so an interrupted run or a late message loses nothing.
+Content blobs no longer referenced by any message or artifact, and older
+than a grace period, are deleted at the end.
+"""
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError
+from django.utils import timezone
+
+from EduSimplify.models import Artifact, ContentBlob, Conversation, Message
+
+DEFAULT_RETENTION_DAYS = 90
+# Blobs younger than this are left alone; they may be about to be referenced
+BLOB_GRACE_PERIOD = timedelta(hours=1)
+
+
+def _archived(conv, messages, artifacts):
+    return {
+        "contextId": conv.context_id,
+        "createdAt": conv.created_at.isoformat(),
+        "updatedAt": conv.updated_at.isoformat(),
+        "metadata": conv.metadata,
+        "messages": [
+            {
+                "messageId": m.message_id,
+                "role": m.role,
+                "parts": m.content_parts,
+                "taskId": m.task_id,
+                "createdAt": m.created_at.isoformat(),
+            }
+            for m in messages
+        ],
+        "artifacts": [
+            {
+                "artifactId": a.artifact_id,
+                "name": a.name,
+                "parts": a.content_parts,
+                "taskId": a.task_id,
+                "createdAt": a.created_at.isoformat(),
+            }
+            for a in artifacts
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Archive EduSimplify conversations idle for longer than the retention period and delete them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int,
+            default=getattr(settings, "EDUSIMPLIFY_RETENTION_DAYS", DEFAULT_RETENTION_DAYS),
+            help="Archive conversations not updated for this many days",
+        )
+        parser.add_argument("--batch-size", type=int, default=200, help="Conversations per transaction")
+        parser.add_argument(
+            "--output-dir", default=os.path.join(settings.BASE_DIR, "archive"),
+            help="Directory for the .jsonl.gz archive",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        cutoff = timezone.now() - timedelta(days=options["older_than"])
+        stale = Conversation.objects.filter(updated_at__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"{stale.count()} conversations older than {cutoff.isoformat()} would be archived")
+            return
+
+        os.makedirs(options["output_dir"], exist_ok=True)
+        path = os.path.join(options["output_dir"], f"conversations-{timezone.now():%Y%m%dT%H%M%S}.jsonl.gz")
+        archived = 0
+        with gzip.open(path, "wt", encoding="utf-8") as fh:
+            last_pk = 0
+            while True:
+                ids = list(
+                    stale.filter(pk__gt=last_pk).order_by("id").values_list("pk", flat=True)[: options["batch_size"]]
+                )
+                if not ids:
+                    break
+                last_pk = ids[-1]
+                archived += self._archive_batch(ids, cutoff, fh)
+                self.stderr.write(f"archived {archived} conversations")
+
+        if not archived:
+            os.remove(path)
+        blobs = self._delete_orphan_blobs(options["batch_size"])
+        self.stdout.write(
+            f"Archived {archived} conversations to {path if archived else '(nothing)'}; "
+            f"deleted {blobs} unreferenced blobs"
+        )
+
+    def _archive_batch(self, ids, cutoff, fh):
+        with transaction.atomic():
+            # Locked, a conversation cannot gain messages until it is deleted; one
+            # that became active since it was selected is left alone
+            batch = list(
+                Conversation.objects.select_for_update().filter(pk__in=ids, updated_at__lt=cutoff).order_by("id")
+            )
+            if not batch:
+                return 0
+            ids = [conv.pk for conv in batch]
+            messages, artifacts = {}, {}
+            for m in Message.objects.filter(context_id__in=ids).select_related("blob").order_by("created_at", "id"):
+                messages.setdefault(m.context_id, []).append(m)
+            for a in Artifact.objects.filter(context_id__in=ids).select_related("blob").order_by("created_at", "id"):
+                artifacts.setdefault(a.context_id, []).append(a)
+
+            for conv in batch:
+                fh.write(json.dumps(_archived(conv, messages.get(conv.pk, []), artifacts.get(conv.pk, []))) + "\n")
+            # The batch must be on disk before its rows are deleted
+            fh.flush()
+            os.fsync(fh.fileno())
+
+            Message.objects.filter(pk__in=[m.pk for rows in messages.values() for m in rows]).delete()
+            Artifact.objects.filter(pk__in=[a.pk for rows in artifacts.values() for a in rows]).delete()
+            Conversation.objects.filter(pk__in=ids).delete()
+        return len(batch)
+
+    def _delete_orphan_blobs(self, batch_size):
+        orphans = ContentBlob.objects.filter(
+            messages__isnull=True, artifacts__isnull=True, created_at__lt=timezone.now() - BLOB_GRACE_PERIOD
+        ).order_by("pk")
+        deleted, last_pk = 0, 0
+        while True:
+            pks = list(orphans.filter(pk__gt=last_pk).values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            last_pk = pks[-1]
+            try:
+                with transaction.atomic():
+                    deleted += ContentBlob.objects.filter(pk__in=pks).delete()[0]
+            except (IntegrityError, ProtectedError):
+                # A blob of this batch was reused meanwhile; the rest go in a later run
+                self.stderr.write(f"skipped {len(pks)} blobs that were referenced again")
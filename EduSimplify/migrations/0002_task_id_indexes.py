@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EduSimplify', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artifact',
+            name='task_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='task_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
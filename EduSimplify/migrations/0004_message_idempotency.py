@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:44
+
+import uuid
+
+from django.db import migrations, models
+
+
+def rename_duplicate_message_ids(apps, schema_editor):
+    """Give repeated (context, message_id) pairs fresh ids so the constraint can be added"""
+    Message = apps.get_model("EduSimplify", "Message")
+    duplicates = (
+        Message.objects.exclude(context=None)
+        .values("context_id", "message_id")
+        .annotate(copies=models.Count("id"))
+        .filter(copies__gt=1)
+    )
+    for pair in duplicates:
+        pks = Message.objects.filter(context_id=pair["context_id"], message_id=pair["message_id"]).order_by("id")
+        for pk in list(pks.values_list("id", flat=True))[1:]:
+            Message.objects.filter(pk=pk).update(message_id=str(uuid.uuid4()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EduSimplify', '0003_prompt_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_message_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('context', 'message_id'), name='uniq_message_per_context'),
+        ),
+    ]
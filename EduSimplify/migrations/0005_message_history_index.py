@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EduSimplify', '0004_message_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['context', 'created_at'], name='message_context_created_idx'),
+        ),
+    ]
@@ -1,12 +1,21 @@
 # agent/models.py
 from django.db import models
+import hashlib
 import uuid
+import zlib
 
 
 def gen_uuid():
     return str(uuid.uuid4())
 
 
+def stored_parts(parts, blob_data=None):
+    """The parts of a message or artifact, with text kept in a ContentBlob put back first"""
+    if blob_data is None:
+        return parts
+    return [{"kind": "text", "text": ContentBlob.decompress(blob_data)}, *parts]
+
+
 class Conversation(models.Model):
     context_id = models.CharField(max_length=64, unique=True, default=gen_uuid)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -30,9 +39,27 @@ class Message(models.Model):
     parts = (
         models.JSONField()
     )  # list of parts: [{kind: text/data/file, text:..., data:...}]
-    task_id = models.CharField(max_length=64, null=True, blank=True)
+    task_id = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Agent replies keep their text here, shared with the artifact, and leave it out of parts
+    blob = models.ForeignKey(
+        "ContentBlob", null=True, blank=True, on_delete=models.PROTECT, related_name="messages"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # A client retrying a message in the same conversation gets the stored result back
+            models.UniqueConstraint(fields=["context", "message_id"], name="uniq_message_per_context"),
+        ]
+        indexes = [
+            # Latest messages of a conversation, for prompt history
+            models.Index(fields=["context", "created_at"], name="message_context_created_idx"),
+        ]
+
+    @property
+    def content_parts(self):
+        return stored_parts(self.parts, self.blob.data if self.blob_id else None)
+
     def __str__(self):
         return f"{self.role}:{self.message_id}"
 
@@ -48,7 +75,69 @@ class Artifact(models.Model):
     )
     name = models.CharField(max_length=128)
     parts = models.JSONField()
+    task_id = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    blob = models.ForeignKey(
+        "ContentBlob", null=True, blank=True, on_delete=models.PROTECT, related_name="artifacts"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @property
+    def content_parts(self):
+        return stored_parts(self.parts, self.blob.data if self.blob_id else None)
+
     def __str__(self):
         return f"{self.name}:{self.artifact_id}"
+
+
+class PromptCacheEntry(models.Model):
+    # sha256 of the prompt template version, model and normalized user prompt
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=64)
+    prompt = models.TextField()
+    response = models.TextField()
+    latency_ms = models.PositiveIntegerField(default=0)  # what the original LLM call took
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.model}:{self.prompt[:50]}"
+
+
+class ContentBlob(models.Model):
+    """Text stored once, zlib-compressed, under the sha256 of its content."""
+
+    hash = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()  # uncompressed bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def store(cls, text):
+        """
+        Return the blob holding ``text``, creating it if needed.
+
+        Call inside the transaction that stores the rows referring to it: an
+        existing blob is locked so the orphan sweep cannot delete it first.
+        """
+        raw = text.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        blob = cls.objects.select_for_update().filter(hash=digest).first()
+        if blob is None:
+            blob, _ = cls.objects.get_or_create(
+                hash=digest,
+                defaults={"data": zlib.compress(raw), "size": len(raw)},
+            )
+        return blob
+
+    @staticmethod
+    def decompress(data):
+        return zlib.decompress(data).decode("utf-8")
+
+    @property
+    def text(self):
+        return self.decompress(self.data)
+
+    def __str__(self):
+        return self.hash
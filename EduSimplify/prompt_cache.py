@@ -0,0 +1,227 @@
+"""
+Cache of LLM explanations keyed by what the student asked.
+
+The key is the normalized user prompt together with the prompt template
+version and model, so rewording the template or switching models never
+serves a stale answer. Lookups try a per-process LRU first, then the
+``PromptCacheEntry`` table shared by all workers. Database entries expire
+after ``EDUSIMPLIFY_PROMPT_CACHE_TTL`` seconds and the table is trimmed to
+``EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES`` rows, least recently hit first, at
+most once every ``EDUSIMPLIFY_PROMPT_CACHE_PRUNE_INTERVAL`` seconds per
+process. Database hits are counted in memory and written in batches.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PromptCacheEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MEMORY_SIZE = 256
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_PRUNE_INTERVAL = 5 * 60
+DEFAULT_HIT_FLUSH_SIZE = 100
+DEFAULT_HIT_FLUSH_INTERVAL = 60
+
+_lock = threading.Lock()
+# key -> (response, latency_ms, expires_at)
+_memory = OrderedDict()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "latency_saved_ms": 0.0}
+# key -> [hits not yet written, last hit time]
+_pending_hits = {}
+_last_flush = time.monotonic()
+_last_prune = None
+
+
+def enabled():
+    return getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE", True)
+
+
+def normalize_prompt(user_prompt):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return " ".join(user_prompt.casefold().split()).rstrip(" ?!.")
+
+
+def cache_key(user_prompt, model, template_version):
+    raw = f"{template_version}\0{model}\0{normalize_prompt(user_prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remember(key, response, latency_ms, expires_at):
+    with _lock:
+        _memory[key] = (response, latency_ms, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE_MEMORY_SIZE", DEFAULT_MEMORY_SIZE):
+            _memory.popitem(last=False)
+
+
+def _hit(tier, latency_ms, started):
+    with _lock:
+        _stats[tier] += 1
+        _stats["latency_saved_ms"] += max(0.0, latency_ms - (time.monotonic() - started) * 1000)
+
+
+def lookup(user_prompt, model, template_version):
+    """
+    Return the cached explanation for this prompt, or None on a miss
+    """
+    if not enabled():
+        return None
+
+    started = time.monotonic()
+    key = cache_key(user_prompt, model, template_version)
+    now = timezone.now()
+
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            if entry[2] > now:
+                _memory.move_to_end(key)
+            else:
+                del _memory[key]
+                entry = None
+    if entry is not None:
+        _hit("memory_hits", entry[1], started)
+        return entry[0]
+
+    try:
+        row = (
+            PromptCacheEntry.objects.filter(key=key, expires_at__gt=now)
+            .values_list("response", "latency_ms", "expires_at")
+            .first()
+        )
+    except DatabaseError:
+        logger.exception("Prompt cache lookup failed")
+        row = None
+
+    if row is None:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    _remember(key, *row)
+    _hit("db_hits", row[1], started)
+    _count_hit(key, now)
+    return row[0]
+
+
+def _count_hit(key, now):
+    with _lock:
+        pending = _pending_hits.setdefault(key, [0, now])
+        pending[0] += 1
+        pending[1] = now
+        due = (
+            len(_pending_hits) >= getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE_HIT_FLUSH_SIZE", DEFAULT_HIT_FLUSH_SIZE)
+            or time.monotonic() - _last_flush
+            >= getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE_HIT_FLUSH_INTERVAL", DEFAULT_HIT_FLUSH_INTERVAL)
+        )
+    if due:
+        flush_hits()
+
+
+def flush_hits():
+    """
+    Write the database hits counted since the last flush. Failures are logged, not raised.
+    """
+    global _last_flush
+
+    with _lock:
+        pending = list(_pending_hits.items())
+        _pending_hits.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        with transaction.atomic():
+            for key, (hits, last_hit_at) in pending:
+                PromptCacheEntry.objects.filter(key=key).update(hits=F("hits") + hits, last_hit_at=last_hit_at)
+    except DatabaseError:
+        logger.exception("Prompt cache hit counters were not written")
+
+
+def store(user_prompt, model, template_version, response, latency):
+    """
+    Cache ``response``, which took ``latency`` seconds to generate. Failures are logged, not raised.
+    """
+    if not enabled() or not response:
+        return
+
+    key = cache_key(user_prompt, model, template_version)
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE_TTL", DEFAULT_TTL))
+    latency_ms = int(latency * 1000)
+    _remember(key, response, latency_ms, expires_at)
+
+    try:
+        PromptCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                "model": model,
+                "prompt": normalize_prompt(user_prompt),
+                "response": response,
+                "latency_ms": latency_ms,
+                "last_hit_at": now,
+                "expires_at": expires_at,
+            },
+        )
+        if _prune_due():
+            prune(now)
+    except DatabaseError:
+        logger.exception("Prompt cache store failed")
+
+
+def _prune_due():
+    global _last_prune
+
+    interval = getattr(settings, "EDUSIMPLIFY_PROMPT_CACHE_PRUNE_INTERVAL", DEFAULT_PRUNE_INTERVAL)
+    with _lock:
+        if _last_prune is not None and time.monotonic() - _last_prune < interval:
+            return False
+        _last_prune = time.monotonic()
+        return True
+
+
+def prune(now=None):
+    """
+    Delete expired entries, then the least recently hit ones beyond the size limit
+    """
+    # Recent hits decide which entries are least recently used
+    flush_hits()
+    PromptCacheEntry.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    excess = PromptCacheEntry.objects.count() - getattr(
+        settings, "EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES
+    )
+    if excess > 0:
+        stale = list(PromptCacheEntry.objects.order_by("last_hit_at").values_list("pk", flat=True)[:excess])
+        PromptCacheEntry.objects.filter(pk__in=stale).delete()
+
+
+def stats():
+    """
+    Hits per tier, misses, hit ratio and LLM time saved by this worker process
+    """
+    with _lock:
+        hits = _stats["memory_hits"] + _stats["db_hits"]
+        lookups = hits + _stats["misses"]
+        return {
+            **_stats,
+            "latency_saved_ms": round(_stats["latency_saved_ms"], 2),
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "memory_entries": len(_memory),
+        }
+
+
+def clear_memory():
+    """Empty this process's LRU tier (the database tier is left alone)"""
+    with _lock:
+        _memory.clear()
@@ -0,0 +1,25 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def sse_event(payload):
+    """Encode one JSON-RPC payload as a Server-Sent Events message."""
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients that only accept text/event-stream reach the agent.
+
+    Streams are written by the view itself; this only renders one-off
+    payloads such as JSON-RPC errors, as a single event.
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return sse_event(data).encode("utf-8")
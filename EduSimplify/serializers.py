@@ -16,6 +16,7 @@ class A2AMessageSerializer(serializers.Serializer):
     parts = MessagePartSerializer(many=True)
     messageId = serializers.CharField(required=False, allow_blank=True)
     taskId = serializers.CharField(required=False, allow_blank=True)
+    contextId = serializers.CharField(required=False, allow_blank=True)
     metadata = serializers.JSONField(required=False)
 
 
@@ -36,8 +37,13 @@ class ExecuteParamsSerializer(serializers.Serializer):
     messages = A2AMessageSerializer(many=True)
 
 
+class TaskQueryParamsSerializer(serializers.Serializer):
+    id = serializers.CharField()
+    historyLength = serializers.IntegerField(required=False, min_value=0)
+
+
 class JSONRPCRequestSerializer(serializers.Serializer):
     jsonrpc = serializers.CharField()
     id = serializers.CharField()
-    method = serializers.ChoiceField(choices=["message/send", "execute"])
+    method = serializers.ChoiceField(choices=["message/send", "message/stream", "execute", "tasks/get"])
     params = serializers.JSONField()  # validate manually depending on method
@@ -0,0 +1,506 @@
+"""
+Task lifecycle for the EduSimplify A2A agent.
+
+A task starts when the incoming message is stored, runs the LLM call either
+inline or on a bounded background pool, and ends with the agent reply and
+artifact (or a system message describing the failure). A task's state is
+always derived from what is stored, so any worker can answer ``tasks/get``.
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import prompt_cache
+from .gateway import DEFAULT_MODEL, DEFAULT_TIMEOUT
+from .history import conversation_context
+from .models import Artifact, ContentBlob, Conversation, Message, gen_uuid
+from .utils import ask_gemini, stream_gemini
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_NAME = "EduSimplifyResponse"
+# Bump whenever build_prompt changes so cached answers to the old prompt are not reused
+PROMPT_TEMPLATE_VERSION = 1
+# Seconds after which a task with no reply is taken to have been lost with its worker
+DEFAULT_TASK_TIMEOUT = 600
+
+_lock = threading.Lock()
+_executor = None
+_pending = 0
+# prompt cache key -> Future of the LLM call answering it
+_flights = {}
+_coalesced = 0
+
+# Single-flight across worker processes, through the shared cache
+FLIGHT_KEY_PREFIX = "edusimplify:flight"
+FLIGHT_POLL_INTERVAL = 0.05
+# How long the leader's answer stays available to waiting processes
+FLIGHT_ANSWER_TTL = 60
+
+
+class AgentBusy(Exception):
+    """Raised when the background pool already has as many tasks as it may queue."""
+
+
+class DuplicateMessage(Exception):
+    """Raised when a message id was already received in the same conversation."""
+
+
+def build_prompt(user_prompt, history=""):
+    """
+    The LLM prompt for ``user_prompt``, with earlier turns of the conversation when there are any
+    """
+    if history:
+        history = f"{history}\n\nAnswer the student's new question, using the conversation above for context.\n\n"
+    return (
+        "You are EduSimplify — a friendly tutor. Answer concisely.\n\n"
+        f"{history}"
+        "Task: Explain the following concept in details, give one real-world example, "
+        "and a one-line formula or note if applicable.\n\n"
+        "if its requires solution, provide step by step solution."
+        f"Concept: {user_prompt}\n\nAnswer:"
+    )
+
+
+def explain(user_prompt, model=DEFAULT_MODEL, history=""):
+    """
+    Answer ``user_prompt``, from the prompt cache when it has been asked before.
+
+    Concurrent calls for the same prompt share a single LLM call: the first
+    caller in a process makes it and the others wait for its answer (or its
+    error), and that caller in turn waits for another process already
+    making the call (see ``_shared_call``). A follow-up with conversation
+    ``history`` depends on that history, so it always gets its own call.
+    """
+    global _coalesced
+
+    if history:
+        release_connection()
+        return ask_gemini(build_prompt(user_prompt, history), model=model)
+
+    cached = prompt_cache.lookup(user_prompt, model, PROMPT_TEMPLATE_VERSION)
+    if cached is not None:
+        return cached
+
+    key = prompt_cache.cache_key(user_prompt, model, PROMPT_TEMPLATE_VERSION)
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Future()
+        else:
+            _coalesced += 1
+    if not leader:
+        # Waiting on the leader can take as long as the call itself
+        release_connection()
+        return flight.result()
+
+    try:
+        # A leader that finished just before this call took over has cached its answer
+        explanation = prompt_cache.lookup(user_prompt, model, PROMPT_TEMPLATE_VERSION)
+        if explanation is None:
+            release_connection()
+            explanation = _shared_call(key, user_prompt, model)
+    except Exception as exc:
+        flight.set_exception(exc)
+        raise
+    else:
+        flight.set_result(explanation)
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+    return explanation
+
+
+def _shared_call(key, user_prompt, model):
+    """
+    Make the LLM call for prompt cache ``key`` unless another process is making it.
+
+    The caller holding the ``cache.add`` lock makes the call and leaves its
+    answer in the cache; the others poll for it, and take the lock over if
+    the holder releases it without an answer (its call failed). Without a
+    working cache every process makes its own call.
+    """
+    global _coalesced
+
+    lock_key = f"{FLIGHT_KEY_PREFIX}:{key}:lock"
+    answer_key = f"{FLIGHT_KEY_PREFIX}:{key}:answer"
+    timeout = getattr(settings, "EDUSIMPLIFY_LLM_TIMEOUT", DEFAULT_TIMEOUT)
+    try:
+        locked = cache.add(lock_key, 1, timeout=int(timeout) + 1)
+        deadline = time.monotonic() + timeout
+        while not locked and time.monotonic() < deadline:
+            time.sleep(FLIGHT_POLL_INTERVAL)
+            answer = cache.get(answer_key)
+            if answer is not None:
+                with _lock:
+                    _coalesced += 1
+                return answer
+            locked = cache.add(lock_key, 1, timeout=int(timeout) + 1)
+    except Exception:
+        logger.exception("Single-flight lock unavailable, calling the LLM directly")
+        locked = False
+
+    explanation = None
+    try:
+        started = time.monotonic()
+        explanation = ask_gemini(build_prompt(user_prompt), model=model)
+        prompt_cache.store(user_prompt, model, PROMPT_TEMPLATE_VERSION, explanation, time.monotonic() - started)
+    finally:
+        if locked:
+            try:
+                if explanation is not None:
+                    cache.set(answer_key, explanation, timeout=FLIGHT_ANSWER_TTL)
+                cache.delete(lock_key)
+            except Exception:
+                logger.exception("Could not release single-flight lock %s", lock_key)
+    return explanation
+
+
+def single_flight_stats():
+    """Calls answered by another caller's in-flight LLM call, and calls currently in flight"""
+    with _lock:
+        return {"coalesced": _coalesced, "in_flight": len(_flights)}
+
+
+def _timestamp():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _text_parts(text):
+    return [{"kind": "text", "text": text}]
+
+
+def start_task(context_id, incoming):
+    """
+    Store the conversation and incoming message in one transaction; ``incoming`` is the parsed last message.
+
+    Returns the conversation and the prompt history preceding the message.
+    The history (and the summary cached on the conversation) is read in the
+    same transaction with the conversation row locked, so this is the only
+    transaction before the LLM call and concurrent messages cannot overwrite
+    each other's summary.
+    """
+    try:
+        with transaction.atomic():
+            if context_id:
+                conv, created = Conversation.objects.select_for_update().get_or_create(context_id=context_id)
+                if not created:
+                    # Keeps a conversation with a task in progress out of archive_conversations
+                    Conversation.objects.filter(pk=conv.pk).update(updated_at=timezone.now())
+            else:
+                conv = Conversation.objects.create()
+            message = Message.objects.create(
+                message_id=incoming["messageId"],
+                context=conv,
+                role=incoming["role"],
+                parts=_text_parts(incoming["text"]),
+                task_id=incoming["taskId"],
+            )
+            history = conversation_context(conv, before_id=message.pk)
+    except IntegrityError as exc:
+        raise DuplicateMessage(incoming["messageId"]) from exc
+    return conv, history
+
+
+def release_connection():
+    """
+    Close the database connection ahead of a long LLM call.
+
+    Nothing is written between the pre- and post-LLM transactions, so the
+    connection would only sit idle for the length of the call. It is closed
+    even when ``CONN_MAX_AGE`` keeps connections for reuse: a persistent
+    connection held through every call would tie up one database
+    connection per request in flight. The post-LLM write reconnects.
+    """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+def find_replay(context_id, message_id):
+    """
+    Return the task answering a message already received in this conversation, or None.
+
+    Each message has its own task, so this is the reply to that message:
+    completed, or still working when the first delivery is in progress. A
+    failed message is deleted by fail_task, and one whose task was lost is
+    deleted here, so a retry of either runs again.
+    """
+    message = (
+        Message.objects.filter(context__context_id=context_id, message_id=message_id)
+        .values("pk", "task_id")
+        .first()
+    )
+    if message is None:
+        return None
+    task = get_task(message["task_id"])
+    if task["status"]["state"] == "failed":
+        Message.objects.filter(pk=message["pk"]).delete()
+        return None
+    return task
+
+
+def complete_task(conv, task_id, explanation, artifact_id=None):
+    """
+    Store the agent reply and its artifact in one transaction; returns (agent message id, artifact)
+
+    Both refer to one ContentBlob holding the explanation, so it is stored
+    once (and shared with every other identical answer).
+    """
+    agent_message_id = gen_uuid()
+    with transaction.atomic():
+        blob = ContentBlob.store(explanation)
+        artifact = Artifact(
+            artifact_id=artifact_id or gen_uuid(),
+            context=conv,
+            name=ARTIFACT_NAME,
+            parts=[],
+            task_id=task_id,
+            blob=blob,
+        )
+        Message.objects.bulk_create([
+            Message(
+                message_id=agent_message_id,
+                context=conv,
+                role="agent",
+                parts=[],
+                task_id=task_id,
+                blob=blob,
+            )
+        ])
+        Artifact.objects.bulk_create([artifact])
+        Conversation.objects.filter(pk=conv.pk).update(updated_at=timezone.now())
+    return agent_message_id, artifact
+
+
+def fail_task(conv, task_id, error):
+    """
+    Record a failed task as a system message carrying the error.
+
+    The incoming message is deleted so that a retry with the same messageId
+    runs again instead of replaying the failure.
+    """
+    with transaction.atomic():
+        Message.objects.filter(context=conv, task_id=task_id, role="user").delete()
+        Message.objects.create(
+            context=conv,
+            role="system",
+            parts=[{"kind": "text", "text": "Internal error contacting LLM"}, {"kind": "data", "data": {"error": error}}],
+            task_id=task_id,
+        )
+        Conversation.objects.filter(pk=conv.pk).update(updated_at=timezone.now())
+
+
+def _run_in_background(conv, task_id, user_prompt, history):
+    global _pending
+
+    try:
+        try:
+            explanation = explain(user_prompt, history=history)
+        except Exception as exc:
+            fail_task(conv, task_id, str(exc))
+        else:
+            complete_task(conv, task_id, explanation)
+    except Exception:
+        logger.exception("EduSimplify task %s failed", task_id)
+    finally:
+        with _lock:
+            _pending -= 1
+        connection.close()
+
+
+def submit_task(conv, task_id, user_prompt, history=""):
+    """
+    Run the LLM call for a task on the background pool.
+
+    The pool has ``EDUSIMPLIFY_WORKERS`` threads and accepts at most
+    ``EDUSIMPLIFY_MAX_PENDING`` unfinished tasks; beyond that AgentBusy is
+    raised so the caller can shed load instead of queueing without bound.
+    """
+    global _executor, _pending
+
+    with _lock:
+        if _pending >= getattr(settings, "EDUSIMPLIFY_MAX_PENDING", 32):
+            raise AgentBusy("Too many tasks in progress")
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "EDUSIMPLIFY_WORKERS", 4),
+                thread_name_prefix="edusimplify",
+            )
+        _pending += 1
+    _executor.submit(_run_in_background, conv, task_id, user_prompt, history)
+
+
+def message_payload(message_id, role, text, task_id):
+    return {
+        "kind": "message",
+        "role": role,
+        "parts": _text_parts(text),
+        "messageId": message_id,
+        "taskId": task_id,
+    }
+
+
+def task_result(conv, task_id, state, history, status_message=None, artifacts=()):
+    """
+    Build an A2A task object
+    """
+    task_status = {"state": state, "timestamp": _timestamp()}
+    if status_message is not None:
+        task_status["message"] = {
+            "messageId": status_message["messageId"],
+            "role": status_message["role"],
+            "parts": status_message["parts"],
+            "kind": "message",
+        }
+    return {
+        "id": task_id,
+        "contextId": conv.context_id,
+        "status": task_status,
+        "artifacts": [
+            {"artifactId": artifact.artifact_id, "name": artifact.name, "parts": artifact.content_parts}
+            for artifact in artifacts
+        ],
+        "history": history,
+        "kind": "task",
+    }
+
+
+def _status_update(conv, task_id, state, final, message=None):
+    task_status = {"state": state, "timestamp": _timestamp()}
+    if message is not None:
+        task_status["message"] = message
+    return {
+        "kind": "status-update",
+        "taskId": task_id,
+        "contextId": conv.context_id,
+        "status": task_status,
+        "final": final,
+    }
+
+
+def stream_task(conv, incoming, user_prompt, history=""):
+    """
+    Run a task with a streaming LLM call, yielding A2A events as they happen.
+
+    Yields the submitted task, a working status-update, one artifact-update
+    per generated chunk and a final status-update. A cached answer is sent as
+    a single chunk. The reply and artifact are stored once the stream
+    completes; a failure is stored and reported as a final failed status-update,
+    and a client disconnecting part-way is stored as a failure.
+    """
+    task_id = incoming["taskId"]
+    stream = None
+    finished = False
+    try:
+        yield task_result(conv, task_id, "submitted", [incoming])
+        yield _status_update(conv, task_id, "working", final=False)
+
+        artifact_id = gen_uuid()
+        chunks = []
+        cached = None if history else prompt_cache.lookup(user_prompt, DEFAULT_MODEL, PROMPT_TEMPLATE_VERSION)
+        if cached is None:
+            release_connection()
+        started = time.monotonic()
+        stream = iter([cached]) if cached is not None else stream_gemini(build_prompt(user_prompt, history))
+        try:
+            for text in stream:
+                yield {
+                    "kind": "artifact-update",
+                    "taskId": task_id,
+                    "contextId": conv.context_id,
+                    "artifact": {"artifactId": artifact_id, "name": ARTIFACT_NAME, "parts": _text_parts(text)},
+                    "append": bool(chunks),
+                    "lastChunk": False,
+                }
+                chunks.append(text)
+        except Exception as exc:
+            fail_task(conv, task_id, str(exc))
+            finished = True
+            yield _status_update(
+                conv, task_id, "failed", final=True,
+                message={"role": "agent", "parts": _text_parts("Internal error contacting LLM"), "kind": "message"},
+            )
+            return
+
+        explanation = "".join(chunks)
+        if cached is None and not history:
+            prompt_cache.store(user_prompt, DEFAULT_MODEL, PROMPT_TEMPLATE_VERSION, explanation, time.monotonic() - started)
+        agent_message_id, _ = complete_task(conv, task_id, explanation, artifact_id=artifact_id)
+        finished = True
+        yield {
+            "kind": "artifact-update",
+            "taskId": task_id,
+            "contextId": conv.context_id,
+            "artifact": {"artifactId": artifact_id, "name": ARTIFACT_NAME, "parts": []},
+            "append": True,
+            "lastChunk": True,
+        }
+        yield _status_update(
+            conv, task_id, "completed", final=True,
+            message={
+                "messageId": agent_message_id,
+                "role": "agent",
+                "parts": _text_parts(explanation),
+                "kind": "message",
+            },
+        )
+    except GeneratorExit:
+        # The client disconnected: stop generating (freeing the gateway slot) and
+        # record the task as failed so tasks/get does not report it working
+        if not finished:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            fail_task(conv, task_id, "Client disconnected before the answer was complete")
+        raise
+
+
+def get_task(task_id, history_length=None):
+    """
+    Describe a stored task, or return None if no message belongs to it.
+
+    The state follows from the last stored message: an agent reply means
+    completed, a system message means failed, otherwise the call is still
+    working. A task still working after ``EDUSIMPLIFY_TASK_TIMEOUT`` seconds
+    was lost (e.g. with a restarted process) and is reported as failed.
+    """
+    messages = list(
+        Message.objects.filter(task_id=task_id).select_related("context", "blob").order_by("created_at", "id")
+    )
+    if not messages:
+        return None
+
+    history = [
+        {"kind": "message", "role": m.role, "parts": m.content_parts, "messageId": m.message_id, "taskId": m.task_id}
+        for m in messages
+    ]
+    state = {"agent": "completed", "system": "failed"}.get(messages[-1].role, "working")
+    status_message = history[-1] if state != "working" else None
+    timeout = getattr(settings, "EDUSIMPLIFY_TASK_TIMEOUT", DEFAULT_TASK_TIMEOUT)
+    if state == "working" and messages[-1].created_at < timezone.now() - timedelta(seconds=timeout):
+        state = "failed"
+        status_message = {
+            # Stable across polls, as nothing is stored for a lost task
+            "messageId": str(uuid.uuid5(uuid.NAMESPACE_URL, f"edusimplify:{task_id}:lost")),
+            "role": "system",
+            "parts": _text_parts("Task did not finish; please try again"),
+        }
+    if history_length is not None:
+        history = history[-history_length:] if history_length else []
+
+    return task_result(
+        messages[0].context or Conversation(context_id=None),
+        task_id,
+        state,
+        history,
+        status_message=status_message,
+        artifacts=Artifact.objects.filter(task_id=task_id).select_related("blob").order_by("created_at", "id") if state == "completed" else (),
+    )
@@ -1,3 +1,629 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import prompt_cache, services
+from .gateway import DEFAULT_MODEL, FakeBackend, GatewayTimeout, LLMGateway
+from .history import SUMMARY_KEY, conversation_context
+from .models import Artifact, ContentBlob, Conversation, Message, PromptCacheEntry
+
+
+class TaskStateTests(TestCase):
+
+    def setUp(self):
+        self.conv = Conversation.objects.create()
+        self.message = Message.objects.create(
+            message_id="m1", context=self.conv, role="user", parts=[{"kind": "text", "text": "gravity"}], task_id="t1"
+        )
+
+    def test_unanswered_task_is_working(self):
+        self.assertEqual(services.get_task("t1")["status"]["state"], "working")
+
+    @override_settings(EDUSIMPLIFY_TASK_TIMEOUT=60)
+    def test_task_lost_past_the_timeout_is_failed(self):
+        Message.objects.filter(pk=self.message.pk).update(created_at=timezone.now() - timedelta(seconds=61))
+        task = services.get_task("t1")
+        self.assertEqual(task["status"]["state"], "failed")
+        self.assertEqual(task["status"]["message"]["messageId"], services.get_task("t1")["status"]["message"]["messageId"])
+
+
+class StreamDisconnectTests(TestCase):
+
+    def test_disconnect_mid_stream_fails_the_task(self):
+        closed = []
+
+        def chunks(prompt, **kwargs):
+            try:
+                yield "Gravity "
+                yield "pulls."
+            finally:
+                closed.append(True)
+
+        conv = Conversation.objects.create()
+        Message.objects.create(message_id="m1", context=conv, role="user", parts=[], task_id="t1")
+        incoming = services.message_payload("m1", "user", "gravity", "t1")
+        with mock.patch.object(services, "stream_gemini", chunks), \
+                mock.patch.object(services.prompt_cache, "lookup", return_value=None):
+            events = services.stream_task(conv, incoming, "gravity")
+            for _ in range(3):
+                next(events)
+            events.close()
+
+        self.assertEqual(closed, [True])
+        self.assertEqual(services.get_task("t1")["status"]["state"], "failed")
+
+
+class SlowBackend(FakeBackend):
+    """Takes ``delay`` seconds whatever the timeout it is given"""
+
+    def generate(self, model, prompt, timeout):
+        time.sleep(self.delay)
+        return self._answer(model, prompt)
+
+
+class LLMGatewayTests(SimpleTestCase):
+
+    def test_answers_through_the_backend(self):
+        gateway = LLMGateway(FakeBackend(delay=0))
+        self.assertEqual(gateway.generate("gravity", model="m"), "[m] Simplified explanation for: gravity")
+        self.assertEqual(list(gateway.stream("a b", model="m")), ["[m]", " Simplified", " explanation", " for:", " a", " b"])
+
+    def test_slot_limit_caps_calls_in_flight(self):
+        gateway = LLMGateway(FakeBackend(delay=0.05), concurrency={"default": 2})
+        threads = [threading.Thread(target=gateway.generate, args=("q",), kwargs={"model": "m"}) for _ in range(6)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Six calls two at a time take at least three rounds
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        metrics = gateway.metrics()["m"]
+        self.assertEqual((metrics["limit"], metrics["calls"], metrics["in_flight"]), (2, 6, 0))
+        self.assertGreater(metrics["queue_ms_max"], 0)
+
+    def test_wait_for_a_slot_times_out(self):
+        gateway = LLMGateway(FakeBackend(delay=0.3), concurrency={"default": 1})
+        holder = threading.Thread(target=gateway.generate, args=("q",), kwargs={"model": "m"})
+        holder.start()
+        time.sleep(0.05)
+        with self.assertRaises(GatewayTimeout):
+            gateway.generate("q", model="m", timeout=0.05)
+        holder.join()
+
+        metrics = gateway.metrics()["m"]
+        self.assertEqual((metrics["calls"], metrics["timeouts"]), (1, 1))
+
+    def test_late_answer_is_returned_and_counted_as_overrun(self):
+        gateway = LLMGateway(SlowBackend(delay=0.1))
+        self.assertTrue(gateway.generate("q", model="m", timeout=0.01))
+        metrics = gateway.metrics()["m"]
+        self.assertEqual((metrics["calls"], metrics["overruns"], metrics["timeouts"]), (1, 1, 0))
+        self.assertGreaterEqual(metrics["call_ms_max"], 100)
+
+    def test_backend_errors_are_counted(self):
+        gateway = LLMGateway(FakeBackend(delay=0))
+        with mock.patch.object(FakeBackend, "generate", side_effect=ValueError("boom")):
+            with self.assertRaises(ValueError):
+                gateway.generate("q", model="m")
+        self.assertEqual(gateway.metrics()["m"]["errors"], 1)
+
+
+@override_settings(EDUSIMPLIFY_PROMPT_CACHE=True, EDUSIMPLIFY_PROMPT_CACHE_PRUNE_INTERVAL=0)
+class PromptCacheTests(TestCase):
+
+    def setUp(self):
+        prompt_cache.clear_memory()
+        prompt_cache.flush_hits()
+
+    def test_lookup_matches_normalized_prompt(self):
+        prompt_cache.store("What is  Gravity?", "m", 1, "A pull.", 1.5)
+        self.assertEqual(prompt_cache.lookup("what is gravity", "m", 1), "A pull.")
+        self.assertIsNone(prompt_cache.lookup("what is gravity", "m", 2))
+        self.assertIsNone(prompt_cache.lookup("what is gravity", "other", 1))
+
+    def test_database_tier_serves_other_processes(self):
+        prompt_cache.store("gravity", "m", 1, "A pull.", 1.5)
+        prompt_cache.clear_memory()
+        with self.assertNumQueries(1):
+            self.assertEqual(prompt_cache.lookup("gravity", "m", 1), "A pull.")
+        # Now in this process's memory tier
+        with self.assertNumQueries(0):
+            self.assertEqual(prompt_cache.lookup("gravity", "m", 1), "A pull.")
+
+    def test_expired_entries_are_misses(self):
+        prompt_cache.store("gravity", "m", 1, "A pull.", 1.5)
+        prompt_cache.clear_memory()
+        PromptCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(prompt_cache.lookup("gravity", "m", 1))
+
+    @override_settings(EDUSIMPLIFY_PROMPT_CACHE_HIT_FLUSH_SIZE=2)
+    def test_hits_are_written_in_batches(self):
+        prompt_cache.store("gravity", "m", 1, "A pull.", 1.5)
+        prompt_cache.store("light", "m", 1, "A wave.", 1.5)
+        prompt_cache.clear_memory()
+        prompt_cache.lookup("gravity", "m", 1)
+        self.assertEqual(PromptCacheEntry.objects.get(prompt="gravity").hits, 0)
+
+        prompt_cache.lookup("light", "m", 1)
+        self.assertEqual(
+            dict(PromptCacheEntry.objects.values_list("prompt", "hits")), {"gravity": 1, "light": 1}
+        )
+
+    @override_settings(EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES=1)
+    def test_prune_keeps_most_recently_hit(self):
+        prompt_cache.store("gravity", "m", 1, "A pull.", 1.5)
+        prompt_cache.store("light", "m", 1, "A wave.", 1.5)
+        self.assertEqual(list(PromptCacheEntry.objects.values_list("prompt", flat=True)), ["light"])
+
+    @override_settings(EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES=1, EDUSIMPLIFY_PROMPT_CACHE_PRUNE_INTERVAL=3600)
+    def test_prune_runs_at_most_once_per_interval(self):
+        with mock.patch.object(prompt_cache, "_last_prune", time.monotonic()):
+            prompt_cache.store("gravity", "m", 1, "A pull.", 1.5)
+            prompt_cache.store("light", "m", 1, "A wave.", 1.5)
+            self.assertEqual(PromptCacheEntry.objects.count(), 2)
+        prompt_cache.prune()
+        self.assertEqual(PromptCacheEntry.objects.count(), 1)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "edusimplify-tests"}
+}
+
+
+@override_settings(EDUSIMPLIFY_PROMPT_CACHE=False, CACHES=LOCMEM_CACHES)
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def flight_keys(self, user_prompt):
+        key = prompt_cache.cache_key(user_prompt, DEFAULT_MODEL, services.PROMPT_TEMPLATE_VERSION)
+        return f"{services.FLIGHT_KEY_PREFIX}:{key}:lock", f"{services.FLIGHT_KEY_PREFIX}:{key}:answer"
+
+    def test_concurrent_calls_share_one_llm_call(self):
+        release = threading.Event()
+
+        def answer(prompt, **kwargs):
+            release.wait(1)
+            return "A pull."
+
+        results = []
+        coalesced = services.single_flight_stats()["coalesced"]
+        with mock.patch.object(services, "ask_gemini", side_effect=answer) as ask:
+            threads = [threading.Thread(target=lambda: results.append(services.explain("gravity"))) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            wait_for(lambda: services.single_flight_stats()["coalesced"] >= coalesced + 3)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(ask.call_count, 1)
+        self.assertEqual(results, ["A pull."] * 4)
+        self.assertEqual(services.single_flight_stats()["in_flight"], 0)
+
+    def test_followers_receive_the_leaders_error(self):
+        release = threading.Event()
+
+        def fail(prompt, **kwargs):
+            release.wait(1)
+            raise RuntimeError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                services.explain("gravity")
+            except RuntimeError as exc:
+                errors.append(str(exc))
+
+        coalesced = services.single_flight_stats()["coalesced"]
+        with mock.patch.object(services, "ask_gemini", side_effect=fail) as ask:
+            threads = [threading.Thread(target=call) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            wait_for(lambda: services.single_flight_stats()["coalesced"] >= coalesced + 1)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(ask.call_count, 1)
+        self.assertEqual(errors, ["boom", "boom"])
+
+    def test_new_leader_uses_answer_cached_by_the_previous_one(self):
+        # The first lookup misses, then the previous leader stores its answer before this call leads
+        with mock.patch.object(services.prompt_cache, "lookup", side_effect=[None, "A pull."]), \
+                mock.patch.object(services, "ask_gemini") as ask:
+            self.assertEqual(services.explain("gravity"), "A pull.")
+        ask.assert_not_called()
+
+    def test_followers_release_the_connection_before_waiting(self):
+        key = prompt_cache.cache_key("gravity", DEFAULT_MODEL, services.PROMPT_TEMPLATE_VERSION)
+        flight = services._flights[key] = Future()
+        self.addCleanup(services._flights.pop, key, None)
+
+        def release():
+            self.assertFalse(flight.done())
+            flight.set_result("A pull.")
+
+        with mock.patch.object(services, "release_connection", side_effect=release) as released, \
+                mock.patch.object(services, "ask_gemini") as ask:
+            self.assertEqual(services.explain("gravity"), "A pull.")
+        released.assert_called_once_with()
+        ask.assert_not_called()
+
+    def test_waits_for_the_call_made_by_another_process(self):
+        lock_key, answer_key = self.flight_keys("gravity")
+        cache.add(lock_key, 1)
+        threading.Timer(0.1, cache.set, (answer_key, "A pull.")).start()
+        with mock.patch.object(services, "ask_gemini") as ask:
+            self.assertEqual(services.explain("gravity"), "A pull.")
+        ask.assert_not_called()
+
+    def test_takes_over_when_the_other_process_fails(self):
+        lock_key, _ = self.flight_keys("gravity")
+        cache.add(lock_key, 1)
+        threading.Timer(0.1, cache.delete, (lock_key,)).start()
+        with mock.patch.object(services, "ask_gemini", return_value="A pull.") as ask:
+            self.assertEqual(services.explain("gravity"), "A pull.")
+        ask.assert_called_once()
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_leader_shares_its_answer_and_releases_the_lock(self):
+        lock_key, answer_key = self.flight_keys("gravity")
+        with mock.patch.object(services, "ask_gemini", return_value="A pull."):
+            services.explain("gravity")
+        self.assertEqual(cache.get(answer_key), "A pull.")
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_failed_leader_releases_the_lock_without_an_answer(self):
+        lock_key, answer_key = self.flight_keys("gravity")
+        with mock.patch.object(services, "ask_gemini", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                services.explain("gravity")
+        self.assertIsNone(cache.get(lock_key))
+        self.assertIsNone(cache.get(answer_key))
+
+
+def rpc(client, method, params):
+    return client.post(
+        "/a2a/agent/edusimplify",
+        {"jsonrpc": "2.0", "id": "1", "method": method, "params": params},
+        content_type="application/json",
+    ).json()
+
+
+def user_message(text, **extra):
+    return {"kind": "message", "role": "user", "parts": [{"kind": "text", "text": text}], **extra}
+
+
+@override_settings(EDUSIMPLIFY_PROMPT_CACHE=False)
+class ReplayTests(TestCase):
+
+    def test_resent_message_replays_the_stored_task(self):
+        message = user_message("gravity", messageId="m1", contextId="c1")
+        with mock.patch.object(services, "ask_gemini", return_value="A pull.") as ask:
+            first = rpc(self.client, "message/send", {"message": message})["result"]
+            second = rpc(self.client, "message/send", {"message": message})["result"]
+
+        self.assertEqual(ask.call_count, 1)
+        self.assertEqual(second["id"], first["id"])
+        self.assertEqual(second["status"]["state"], "completed")
+        self.assertEqual(second["artifacts"][0]["parts"][0]["text"], "A pull.")
+        self.assertEqual(Message.objects.filter(message_id="m1").count(), 1)
+
+    def test_same_message_id_in_another_conversation_is_new(self):
+        with mock.patch.object(services, "ask_gemini", return_value="A pull.") as ask:
+            rpc(self.client, "message/send", {"message": user_message("gravity", messageId="m1", contextId="c1")})
+            rpc(self.client, "message/send", {"message": user_message("gravity", messageId="m1", contextId="c2")})
+        self.assertEqual(ask.call_count, 2)
+
+    def test_retry_gets_the_reply_to_its_own_message(self):
+        first = user_message("gravity", messageId="m1", contextId="c1", taskId="shared")
+        with mock.patch.object(services, "ask_gemini", side_effect=["A pull.", "A wave."]):
+            rpc(self.client, "message/send", {"message": first})
+            rpc(self.client, "message/send", {"message": user_message("light", messageId="m2", contextId="c1",
+                                                                       taskId="shared")})
+            replay = rpc(self.client, "message/send", {"message": first})["result"]
+        self.assertEqual(replay["artifacts"][0]["parts"][0]["text"], "A pull.")
+
+    def test_retry_after_llm_error_calls_the_llm_again(self):
+        message = user_message("gravity", messageId="m1", contextId="c1")
+        with mock.patch.object(services, "ask_gemini", side_effect=[RuntimeError("boom"), "A pull."]) as ask:
+            failed = rpc(self.client, "message/send", {"message": message})
+            retried = rpc(self.client, "message/send", {"message": message})["result"]
+
+        self.assertEqual(failed["error"]["message"], "Internal error contacting LLM")
+        self.assertEqual(ask.call_count, 2)
+        self.assertEqual(retried["status"]["state"], "completed")
+        self.assertEqual(retried["artifacts"][0]["parts"][0]["text"], "A pull.")
+
+    def test_retry_after_busy_runs_again(self):
+        message = user_message("gravity", messageId="m1", contextId="c1")
+        with mock.patch.object(services, "submit_task", side_effect=services.AgentBusy("full")):
+            busy = self.client.post(
+                "/a2a/agent/edusimplify",
+                {"jsonrpc": "2.0", "id": "1", "method": "message/send",
+                 "params": {"message": message, "configuration": {"blocking": False}}},
+                content_type="application/json",
+            )
+        self.assertEqual(busy.status_code, 503)
+
+        with mock.patch.object(services, "ask_gemini", return_value="A pull."):
+            retried = rpc(self.client, "message/send", {"message": message})["result"]
+        self.assertEqual(retried["status"]["state"], "completed")
+
+    @override_settings(EDUSIMPLIFY_TASK_TIMEOUT=60)
+    def test_retry_of_a_lost_task_runs_again(self):
+        conv = Conversation.objects.create(context_id="c1")
+        Message.objects.create(message_id="m1", context=conv, role="user", parts=[], task_id="lost")
+        Message.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+
+        with mock.patch.object(services, "ask_gemini", return_value="A pull.") as ask:
+            retried = rpc(self.client, "message/send", {"message": user_message("gravity", messageId="m1",
+                                                                                 contextId="c1")})["result"]
+        ask.assert_called_once()
+        self.assertEqual(retried["status"]["state"], "completed")
+        self.assertNotEqual(retried["id"], "lost")
+
+
+class ReleaseConnectionTests(TestCase):
+
+    def test_closes_persistent_connections_outside_transactions(self):
+        connection = connections["default"]
+        with mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=600), \
+                mock.patch.object(connection, "in_atomic_block", False), \
+                mock.patch.object(connection, "close") as close:
+            services.release_connection()
+        close.assert_called_once_with()
+
+    def test_keeps_connection_inside_a_transaction(self):
+        with mock.patch.object(connections["default"], "close") as close:
+            services.release_connection()
+        close.assert_not_called()
+
+
+@override_settings(EDUSIMPLIFY_HISTORY_MESSAGES=2, EDUSIMPLIFY_HISTORY_TOKEN_BUDGET=1500)
+class ConversationContextTests(TestCase):
+
+    def setUp(self):
+        self.conv = Conversation.objects.create()
+
+    def say(self, role, text):
+        return Message.objects.create(
+            context=self.conv, role=role, parts=[{"kind": "text", "text": text}], task_id="t"
+        ).pk
+
+    def context(self, before_id):
+        self.conv.refresh_from_db()
+        return conversation_context(self.conv, before_id=before_id)
+
+    def test_first_message_has_no_history(self):
+        self.assertEqual(self.context(self.say("user", "What is gravity?")), "")
+
+    def test_window_is_verbatim_and_older_turns_are_summarized(self):
+        self.say("user", "What is gravity? Tell me.")
+        self.say("agent", "A pull. Between masses.")
+        self.say("user", "And mass?")
+        self.say("agent", "Amount of matter.")
+        current = self.say("user", "And weight?")
+
+        self.assertEqual(
+            self.context(current),
+            "Earlier in this conversation:\nStudent: What is gravity?\nEduSimplify: A pull.\n\n"
+            "Recent messages:\nStudent: And mass?\nEduSimplify: Amount of matter.",
+        )
+
+    def test_other_messages_of_the_same_task_stay_in_history(self):
+        self.say("user", "What is gravity?")
+        self.say("agent", "A pull.")
+        self.assertIn("Student: What is gravity?", self.context(self.say("user", "Why?")))
+
+    @override_settings(EDUSIMPLIFY_HISTORY_TOKEN_BUDGET=20)
+    def test_budget_limits_verbatim_turns(self):
+        self.say("user", "What is gravity?")
+        self.say("agent", "word " * 100)
+        context = self.context(self.say("user", "Why?"))
+
+        recent = context.split("Recent messages:\n")[1]
+        self.assertTrue(recent.startswith("EduSimplify: word") and recent.endswith("…"))
+        self.assertLessEqual(len(recent), 20 * 4)
+        self.assertIn("Earlier in this conversation:\nStudent: What is gravity?", context)
+
+    def test_summary_is_cached_and_extended(self):
+        first = self.say("user", "What is gravity?")
+        self.say("agent", "A pull.")
+        self.say("user", "And mass?")
+        self.context(self.say("agent", "Amount of matter."))
+        self.assertEqual(self.conv.metadata[SUMMARY_KEY]["through"], first)
+
+        # Cached lines are reused rather than read again
+        Message.objects.filter(pk=first).update(parts=[{"kind": "text", "text": "Changed."}])
+        context = self.context(self.say("user", "And weight?"))
+        self.assertIn("Student: What is gravity?\nEduSimplify: A pull.", context)
+        self.assertEqual(len(self.conv.metadata[SUMMARY_KEY]["lines"]), 2)
+
+    def test_cached_summary_is_trimmed_for_an_earlier_window(self):
+        self.say("user", "What is gravity?")
+        self.say("agent", "A pull.")
+        earlier = self.say("user", "And mass?")
+        self.say("agent", "Amount of matter.")
+        self.say("user", "And weight?")
+        self.context(self.say("agent", "Mass times gravity."))
+
+        context = self.context(earlier)
+        self.assertEqual(
+            context,
+            "Recent messages:\nStudent: What is gravity?\nEduSimplify: A pull.",
+        )
+
+    def test_summary_written_before_lines_had_ids_is_rebuilt(self):
+        self.say("user", "What is gravity?")
+        self.say("agent", "A pull.")
+        self.say("user", "And mass?")
+        current = self.say("agent", "Amount of matter.")
+        Conversation.objects.filter(pk=self.conv.pk).update(
+            metadata={SUMMARY_KEY: {"through": current, "lines": ["Student: stale"]}}
+        )
+
+        context = self.context(current)
+        self.assertNotIn("stale", context)
+        self.assertIn("Student: What is gravity?", context)
+
+
+class ContentBlobTests(TestCase):
+
+    def test_identical_answers_share_one_blob(self):
+        conv = Conversation.objects.create()
+        answer = "Gravity is a pull. " * 50
+        services.complete_task(conv, "t1", answer)
+        services.complete_task(conv, "t2", answer)
+
+        blob = ContentBlob.objects.get()
+        self.assertEqual((blob.text, blob.size), (answer, len(answer)))
+        self.assertLess(len(bytes(blob.data)), blob.size)
+        self.assertEqual(Message.objects.filter(blob=blob, parts=[]).count(), 2)
+        self.assertEqual(services.get_task("t2")["artifacts"][0]["parts"], [{"kind": "text", "text": answer}])
+
+    def test_rows_stored_inline_keep_their_parts(self):
+        conv = Conversation.objects.create()
+        parts = [{"kind": "text", "text": "Legacy answer"}]
+        message = Message.objects.create(context=conv, role="agent", parts=parts, task_id="t1")
+        artifact = Artifact.objects.create(context=conv, name=services.ARTIFACT_NAME, parts=parts, task_id="t1")
+
+        self.assertEqual(message.content_parts, parts)
+        self.assertEqual(artifact.content_parts, parts)
+        self.assertEqual(services.get_task("t1")["artifacts"][0]["parts"], parts)
+
+
+class ArchiveConversationsTests(TestCase):
+
+    def setUp(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = output_dir.name
+
+    def conversation(self, context_id, days_idle):
+        conv = Conversation.objects.create(context_id=context_id)
+        Message.objects.create(
+            context=conv, role="user", parts=[{"kind": "text", "text": f"{context_id}?"}], task_id=context_id
+        )
+        services.complete_task(conv, context_id, f"Answer to {context_id}")
+        Conversation.objects.filter(pk=conv.pk).update(updated_at=timezone.now() - timedelta(days=days_idle))
+        return conv
+
+    def archive(self, *args):
+        call_command("archive_conversations", "--output-dir", self.output_dir, *args, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+        rows = []
+        for name in sorted(os.listdir(self.output_dir)):
+            with gzip.open(os.path.join(self.output_dir, name), "rt", encoding="utf-8") as fh:
+                rows.extend(json.loads(line) for line in fh)
+        return rows
+
+    def test_archives_and_deletes_idle_conversations(self):
+        self.conversation("old", days_idle=100)
+        self.conversation("recent", days_idle=1)
+
+        rows = self.archive("--older-than", "90", "--batch-size", "1")
+
+        self.assertEqual([row["contextId"] for row in rows], ["old"])
+        self.assertEqual(
+            [m["parts"][0]["text"] for m in rows[0]["messages"]], ["old?", "Answer to old"]
+        )
+        self.assertEqual(rows[0]["artifacts"][0]["parts"][0]["text"], "Answer to old")
+        self.assertEqual(list(Conversation.objects.values_list("context_id", flat=True)), ["recent"])
+        self.assertFalse(Message.objects.filter(task_id="old").exists())
+        self.assertFalse(Artifact.objects.filter(task_id="old").exists())
+
+    def test_dry_run_changes_nothing(self):
+        self.conversation("old", days_idle=100)
+        self.assertEqual(self.archive("--dry-run"), [])
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_new_message_keeps_a_conversation_out_of_the_archive(self):
+        conv = self.conversation("old", days_idle=100)
+        services.start_task("old", {"messageId": "m2", "role": "user", "text": "And mass?", "taskId": "t2"})
+        self.assertEqual(self.archive(), [])
+        self.assertTrue(Conversation.objects.filter(pk=conv.pk).exists())
+
+    def test_orphan_blobs_are_deleted_after_the_grace_period(self):
+        self.conversation("old", days_idle=100)
+        self.conversation("older", days_idle=200)
+        fresh = ContentBlob.store("Not yet referenced")
+        ContentBlob.objects.exclude(pk=fresh.pk).update(created_at=timezone.now() - timedelta(days=1))
+
+        self.archive()
+
+        self.assertEqual(list(ContentBlob.objects.all()), [fresh])
+
+
+@override_settings(EDUSIMPLIFY_PROMPT_CACHE=False)
+class NonBlockingTaskTests(TransactionTestCase):
+
+    def test_submitted_task_is_answered_in_the_background(self):
+        release = threading.Event()
+
+        def answer(prompt, **kwargs):
+            release.wait(2)
+            return "A pull."
+
+        with mock.patch.object(services, "ask_gemini", side_effect=answer):
+            task = rpc(self.client, "message/send", {
+                "message": user_message("gravity", taskId="client-task"),
+                "configuration": {"blocking": False},
+            })["result"]
+            self.assertEqual(task["status"]["state"], "submitted")
+            self.assertNotEqual(task["id"], "client-task")
+            self.assertEqual(rpc(self.client, "tasks/get", {"id": task["id"]})["result"]["status"]["state"], "working")
+
+            release.set()
+            # Polled without touching the database, which the worker is writing to
+            wait_for(lambda: services._pending == 0)
+
+        result = rpc(self.client, "tasks/get", {"id": task["id"], "historyLength": 1})["result"]
+        self.assertEqual(result["status"]["state"], "completed")
+        self.assertEqual(result["artifacts"][0]["parts"][0]["text"], "A pull.")
+        self.assertEqual([m["role"] for m in result["history"]], ["agent"])
+
+    def test_tasks_of_other_conversations_do_not_merge(self):
+        with mock.patch.object(services, "ask_gemini", side_effect=["A pull.", "A wave."]):
+            first = rpc(self.client, "message/send", {"message": user_message("gravity", taskId="t", contextId="c1")})
+            second = rpc(self.client, "message/send", {"message": user_message("light", taskId="t", contextId="c2")})
+
+        self.assertNotEqual(first["result"]["id"], second["result"]["id"])
+        task = rpc(self.client, "tasks/get", {"id": first["result"]["id"]})["result"]
+        self.assertEqual(task["contextId"], "c1")
+        self.assertEqual([m["parts"][0]["text"] for m in task["history"]], ["gravity", "A pull."])
+
+    def test_unknown_task_is_not_found(self):
+        response = self.client.post(
+            "/a2a/agent/edusimplify",
+            {"jsonrpc": "2.0", "id": "1", "method": "tasks/get", "params": {"id": "missing"}},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["error"]["code"], -32001)
@@ -1,7 +1,8 @@
 # agent/urls.py
 from django.urls import path
-from .views import A2AAgentView
+from .views import A2AAgentView, A2AMetricsView
 
 urlpatterns = [
     path("edusimplify", A2AAgentView.as_view(), name="edusimplify-a2a"),
+    path("edusimplify/metrics", A2AMetricsView.as_view(), name="edusimplify-metrics"),
 ]
@@ -1,48 +1,49 @@
-import os
-from google import genai
-from django.conf import settings
 from rest_framework import status
 
+from .gateway import DEFAULT_MODEL, GatewayTimeout, get_gateway
 
-def _get_genai_client():
-    """Lazily create and return a genai client with explicit error when missing config."""
-    api_key = getattr(settings, "GEMINI_API_KEY", None) or os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Gemini API key not configured (GEMINI_API_KEY)")
-    return genai.Client(api_key=api_key)
 
-
-def ask_gemini(prompt, model="gemini-2.5-flash"):
-    """Call Google's GenAI client to generate a text response.
+def ask_gemini(prompt, model=DEFAULT_MODEL, timeout=None):
+    """Generate a text response through the process-wide LLM gateway.
 
     Returns a plain string on success. Raises RuntimeError on known problems so
-    callers can catch and convert into appropriate HTTP errors.
+    callers can catch and convert into appropriate HTTP errors; a missed
+    deadline raises GatewayTimeout, a RuntimeError subclass.
     """
-    client = _get_genai_client()
     try:
-        response = client.models.generate_content(model=model, contents=prompt)
+        text = get_gateway().generate(prompt, model=model, timeout=timeout)
+    except GatewayTimeout:
+        raise
     except Exception as exc:
         # Surface a clear error that the view can handle
         raise RuntimeError(f"genai request failed: {exc}") from exc
 
-    # Different genai client versions may expose the text differently.
-    # Try common accessors then fall back to str(response).
-    text = None
-    if hasattr(response, "text"):
-        text = getattr(response, "text")
-    elif isinstance(response, dict):
-        # try to extract from dict structure
-        text = response.get("text") or response.get("responseText")
-    else:
-        # last resort
-        text = str(response)
-
     if not text:
         raise RuntimeError("genai returned empty response")
 
     return text
 
 
+def stream_gemini(prompt, model=DEFAULT_MODEL, timeout=None):
+    """Stream a response through the LLM gateway, yielding text chunks as they arrive.
+
+    Raises RuntimeError like ``ask_gemini``, either before the first chunk or
+    part-way through the stream.
+    """
+    received = False
+    try:
+        for text in get_gateway().stream(prompt, model=model, timeout=timeout):
+            received = True
+            yield text
+    except GatewayTimeout:
+        raise
+    except Exception as exc:
+        raise RuntimeError(f"genai request failed: {exc}") from exc
+
+    if not received:
+        raise RuntimeError("genai returned empty response")
+
+
 def make_a2a_success(request_id, result_obj):
     """Return a JSON-RPC 2.0 + A2A-style success payload dict.
 
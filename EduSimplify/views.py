@@ -1,29 +1,44 @@
 # agent/views.py
+import logging
 import uuid
-from datetime import datetime
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 from .serializers import (
     JSONRPCRequestSerializer,
     MessageParamsSerializer,
     ExecuteParamsSerializer,
+    TaskQueryParamsSerializer,
     A2AMessageSerializer,
 )
-from .utils import ask_gemini, make_a2a_success, make_a2a_error
-from .models import Conversation, Message, Artifact
+from .gateway import get_gateway
+from .utils import make_a2a_success, make_a2a_error
+from .renderers import EventStreamRenderer, sse_event
+from . import prompt_cache, services
+
+logger = logging.getLogger(__name__)
 
 
 def gen_uuid():
     return str(uuid.uuid4())
 
 
+# Writes are grouped into their own short transactions around the LLM call,
+# so a request-wide transaction (ATOMIC_REQUESTS) would only hold locks through it
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
 class A2AAgentView(APIView):
     """
     POST /a2a/agent/edusimplify/
     Accepts JSON-RPC 2.0 A2A messages and returns JSON-RPC 2.0 responses.
+    ``message/stream`` answers with a stream of Server-Sent Events instead.
     """
 
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
     def post(self, request, *args, **kwargs):
         raw = request.data or {}
         # Validate top-level JSON-RPC fields
@@ -42,20 +57,24 @@ class A2AAgentView(APIView):
         params = raw.get("params", {}) or {}
         messages_list = []
         context_id = None
-        task_id = None
+        blocking = True
+
+        if method == "tasks/get":
+            return self.get_task(request_id, params)
 
         try:
-            if method == "message/send":
+            if method in ("message/send", "message/stream"):
                 pser = MessageParamsSerializer(data=params)
                 pser.is_valid(raise_exception=True)
                 msg = pser.validated_data["message"]
                 # Wrap single message into list
                 messages_list = [msg]
+                context_id = msg.get("contextId")
+                blocking = pser.validated_data["configuration"].get("blocking", True)
             elif method == "execute":
                 pser = ExecuteParamsSerializer(data=params)
                 pser.is_valid(raise_exception=True)
                 context_id = pser.validated_data.get("contextId")
-                task_id = pser.validated_data.get("taskId")
                 messages_list = pser.validated_data.get("messages", [])
             else:
                 payload, http_status = make_a2a_error(request_id, -32601, "Method not found")
@@ -79,7 +98,9 @@ class A2AAgentView(APIView):
                         "role": msg.get("role", "user"),
                         "text": text,
                         "messageId": msg.get("messageId") or gen_uuid(),
-                        "taskId": msg.get("taskId") or task_id or gen_uuid(),
+                        # Task ids are issued here, never taken from the client: tasks/get
+                        # looks a task up by id alone, so ids must be unique and unguessable
+                        "taskId": gen_uuid(),
                     }
                 )
             if not user_texts:
@@ -92,47 +113,62 @@ class A2AAgentView(APIView):
             )
             return Response(payload, status=http_status)
 
-        # Persist conversation & incoming message
-        conv = None
-        try:
-            if context_id:
-                conv, _ = Conversation.objects.get_or_create(context_id=context_id)
-            else:
-                conv = Conversation.objects.create()
-        except Exception as exc:
-            payload, http_status = make_a2a_error(
-                request_id, -32603, "Database error creating conversation", data=str(exc)
-            )
-            return Response(payload, status=http_status)
+        # A retried messageId in a known conversation gets the stored result, not a second LLM call
+        if context_id and messages_list[-1].get("messageId"):
+            try:
+                replay = services.find_replay(context_id, last["messageId"])
+            except Exception as exc:
+                payload, http_status = make_a2a_error(
+                    request_id, -32603, "Database error loading task", data=str(exc)
+                )
+                return Response(payload, status=http_status)
+            if replay is not None:
+                return self.replay(request_id, method, replay)
 
-        # Save incoming user message
+        # Persist conversation & incoming message
         try:
-            incoming_msg = Message.objects.create(
-                message_id=last["messageId"],
-                context=conv,
-                role=last["role"],
-                parts=[{"kind": "text", "text": user_prompt}],
-                task_id=last["taskId"],
-            )
+            conv, history = services.start_task(context_id, last)
+        except services.DuplicateMessage:
+            # The same message arrived concurrently and the other request stored it first
+            replay = services.find_replay(context_id, last["messageId"])
+            if replay is None:
+                payload, http_status = make_a2a_error(
+                    request_id, -32000, "Message is being retried, retry later",
+                    http_status=status.HTTP_409_CONFLICT,
+                )
+                return Response(payload, status=http_status)
+            return self.replay(request_id, method, replay)
         except Exception as exc:
             payload, http_status = make_a2a_error(
                 request_id, -32603, "Database error saving incoming message", data=str(exc)
             )
             return Response(payload, status=http_status)
 
-        # Build Gemini prompt
-        prompt = (
-            "You are EduSimplify — a friendly tutor. Answer concisely.\n\n"
-            "Task: Explain the following concept in details, give one real-world example, "
-            "and a one-line formula or note if applicable.\n\n"
-            "if its requires solution, provide step by step solution."
-            f"Concept: {user_prompt}\n\nAnswer:"
-        )
+        incoming = services.message_payload(last["messageId"], last["role"], user_prompt, last["taskId"])
+
+        if method == "message/stream":
+            return self.stream(request_id, services.stream_task(conv, incoming, user_prompt, history))
+
+        if not blocking:
+            # Hand the LLM call to the background pool; the client polls tasks/get
+            try:
+                services.submit_task(conv, last["taskId"], user_prompt, history)
+            except services.AgentBusy as exc:
+                services.fail_task(conv, last["taskId"], str(exc))
+                payload, http_status = make_a2a_error(
+                    request_id, -32000, "Agent busy, retry later", data=str(exc),
+                    http_status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+                return Response(payload, status=http_status)
+            result = services.task_result(conv, last["taskId"], "submitted", [incoming])
+            payload, http_status = make_a2a_success(request_id, result)
+            return Response(payload, status=http_status)
 
         # Call Gemini
         try:
-            explanation = ask_gemini(prompt)
+            explanation = services.explain(user_prompt, history=history)
         except Exception as exc:
+            self.fail_task(conv, last["taskId"], exc)
             payload, http_status = make_a2a_error(
                 request_id, -32603, "Internal error contacting LLM", data=str(exc),
             )
@@ -140,70 +176,94 @@ class A2AAgentView(APIView):
             return Response(payload, status=http_status)
 
         # Save agent reply message & artifact
-        agent_message_id = gen_uuid()
         agent_task_id = last["taskId"]
         try:
-            Message.objects.create(
-                message_id=agent_message_id,
-                context=conv,
-                role="agent",
-                parts=[{"kind": "text", "text": explanation}],
-                task_id=agent_task_id,
+            agent_message_id, artifact = services.complete_task(conv, agent_task_id, explanation)
+        except Exception as exc:
+            self.fail_task(conv, agent_task_id, exc)
+            payload, http_status = make_a2a_error(
+                request_id, -32603, "Database error saving agent response", data=str(exc)
             )
-            artifact = Artifact.objects.create(
-                artifact_id=gen_uuid(),
-                context=conv,
-                name="EduSimplifyResponse",
-                parts=[{"kind": "text", "text": explanation}],
+            return Response(payload, status=http_status)
+
+        # Build history (incoming + agent) and the result per A2A sample
+        reply = services.message_payload(agent_message_id, "agent", explanation, agent_task_id)
+        result = services.task_result(
+            conv, agent_task_id, "completed", [incoming, reply], status_message=reply, artifacts=[artifact]
+        )
+
+        payload, http_status = make_a2a_success(request_id, result)
+        return Response(payload, status=http_status)
+
+    def fail_task(self, conv, task_id, exc):
+        """
+        Record a failed task so a retry of the message runs again; the error response is sent regardless
+        """
+        try:
+            services.fail_task(conv, task_id, str(exc))
+        except Exception:
+            logger.exception("Could not record failure of EduSimplify task %s", task_id)
+
+    def stream(self, request_id, events):
+        """
+        Send A2A events as Server-Sent Events, each wrapped in a JSON-RPC response
+        """
+        response = StreamingHttpResponse(
+            (sse_event(make_a2a_success(request_id, event)[0]) for event in events),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def replay(self, request_id, method, result):
+        """
+        Answer a repeated message with the task stored for its first delivery
+        """
+        if method == "message/stream":
+            return self.stream(request_id, [result])
+        payload, http_status = make_a2a_success(request_id, result)
+        return Response(payload, status=http_status)
+
+    def get_task(self, request_id, params):
+        """
+        tasks/get: report the state of a task started earlier
+        """
+        pser = TaskQueryParamsSerializer(data=params)
+        if not pser.is_valid():
+            payload, http_status = make_a2a_error(
+                request_id, -32602, "Invalid params", data=pser.errors
             )
+            return Response(payload, status=http_status)
+
+        try:
+            result = services.get_task(pser.validated_data["id"], pser.validated_data.get("historyLength"))
         except Exception as exc:
             payload, http_status = make_a2a_error(
-                request_id, -32603, "Database error saving agent response", data=str(exc)
+                request_id, -32603, "Database error loading task", data=str(exc)
             )
             return Response(payload, status=http_status)
 
-        # Build history (incoming + agent)
-        history = [
-            {
-                "kind": "message",
-                "role": last["role"],
-                "parts": [{"kind": "text", "text": user_prompt}],
-                "messageId": last["messageId"],
-                "taskId": last["taskId"],
-            },
-            {
-                "kind": "message",
-                "role": "agent",
-                "parts": [{"kind": "text", "text": explanation}],
-                "messageId": agent_message_id,
-                "taskId": agent_task_id,
-            },
-        ]
-
-        # Build result per A2A sample
-        result = {
-            "id": agent_task_id,
-            "contextId": conv.context_id,
-            "status": {
-                "state": "completed",
-                "timestamp": datetime.utcnow().isoformat() + "Z",
-                "message": {
-                    "messageId": agent_message_id,
-                    "role": "agent",
-                    "parts": [{"kind": "text", "text": explanation}],
-                    "kind": "message",
-                },
-            },
-            "artifacts": [
-                {
-                    "artifactId": artifact.artifact_id,
-                    "name": artifact.name,
-                    "parts": artifact.parts,
-                }
-            ],
-            "history": history,
-            "kind": "task",
-        }
+        if result is None:
+            payload, http_status = make_a2a_error(
+                request_id, -32001, "Task not found", http_status=status.HTTP_404_NOT_FOUND
+            )
+            return Response(payload, status=http_status)
 
         payload, http_status = make_a2a_success(request_id, result)
         return Response(payload, status=http_status)
+
+
+class A2AMetricsView(APIView):
+    """
+    GET /a2a/agent/edusimplify/metrics
+    LLM gateway, prompt cache and request coalescing metrics for this worker process.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            "llm": get_gateway().metrics(),
+            "prompt_cache": prompt_cache.stats(),
+            "single_flight": services.single_flight_stats(),
+        })
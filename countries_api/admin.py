@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Country, RefreshMetadata
+from .models import Country, CountryAggregate, RefreshMetadata
 
 
 @admin.register(Country)
@@ -49,14 +49,44 @@ class RefreshMetadataAdmin(admin.ModelAdmin):
     ]
     list_filter = ['refresh_status', 'last_refreshed_at']
     ordering = ['-last_refreshed_at']
-    readonly_fields = ['created_at']
+    readonly_fields = [
+        'created_at',
+        'finished_at',
+        'stage_timings',
+        'bytes_downloaded',
+        'rows_created',
+        'rows_updated',
+        'rows_unchanged',
+    ]
 
     fieldsets = (
         ('Refresh Information', {
-            'fields': ('total_countries', 'last_refreshed_at', 'refresh_status')
+            'fields': ('total_countries', 'last_refreshed_at', 'refresh_status', 'finished_at')
+        }),
+        ('Instrumentation', {
+            'fields': ('stage_timings', 'bytes_downloaded', 'rows_created', 'rows_updated', 'rows_unchanged')
         }),
         ('Metadata', {
             'fields': ('created_at',),
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(CountryAggregate)
+class CountryAggregateAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for CountryAggregate model
+    """
+    list_display = [
+        'dimension',
+        'key',
+        'country_count',
+        'total_population',
+        'total_estimated_gdp',
+        'rate_mean',
+        'computed_at'
+    ]
+    list_filter = ['dimension']
+    ordering = ['dimension', 'key']
+    readonly_fields = ['computed_at']
@@ -0,0 +1,112 @@
+"""
+Streaming export of the countries table as CSV or NDJSON.
+
+Rows are read through a server-side cursor and encoded a chunk at a time, so
+memory use does not grow with the table and the first bytes leave as soon
+as the first chunk is read. Output can be gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from rest_framework.renderers import BaseRenderer
+
+from .serializers import CountrySerializer
+
+EXPORT_FIELDS = CountrySerializer.Meta.fields
+CHUNK_SIZE = 2000
+GZIP_LEVEL = 6
+
+
+class _ExportRenderer(BaseRenderer):
+    """
+    Selects the export format through DRF content negotiation (``?format=``).
+
+    Export rows are streamed by the view; only error payloads pass through
+    ``render``, and those are sent as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, default=str).encode()
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_chunks(rows, fields=EXPORT_FIELDS, chunk_size=CHUNK_SIZE):
+    """
+    Encode ``rows`` (tuples in ``fields`` order) as CSV, yielding one string per chunk
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    pending = 1
+    for row in rows:
+        writer.writerow([_value(value) for value in row])
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, fields=EXPORT_FIELDS, chunk_size=CHUNK_SIZE):
+    """
+    Encode ``rows`` as newline-delimited JSON objects, yielding one string per chunk
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, map(_value, row))), ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """
+    Gzip-compress a stream of strings incrementally
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    """
+    Whether the client's Accept-Encoding allows gzip (and does not refuse it with q=0)
+    """
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            quality = params.strip().lower()
+            if not quality.startswith('q='):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
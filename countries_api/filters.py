@@ -0,0 +1,57 @@
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+# sort param -> (field, descending); every ordering ends with ``id`` as a tiebreaker
+SORT_FIELDS = {
+    'gdp_desc': ('estimated_gdp', True),
+    'gdp_asc': ('estimated_gdp', False),
+    'population_desc': ('population', True),
+    'population_asc': ('population', False),
+    'name_asc': ('name', False),
+    'name_desc': ('name', True),
+}
+DEFAULT_SORT_FIELD = ('last_refreshed_at', True)
+
+SORT_OPTIONS = list(SORT_FIELDS)
+
+
+def sort_key(sort_param=None):
+    """
+    Return the (field, descending) pair that orders rows for ``sort_param``
+    """
+    return SORT_FIELDS.get(sort_param, DEFAULT_SORT_FIELD)
+
+
+def iexact(field, value):
+    """
+    Build a case-insensitive equality lookup on ``field``.
+
+    Unlike ``__iexact`` this compiles to ``LOWER(field) = LOWER(%s)``, which
+    can use the functional indexes declared on Country.
+    """
+    return {f'{field}__lower': Lower(Value(value))}
+
+
+def filter_countries(queryset, region=None, currency=None):
+    """
+    Apply the case-insensitive region and currency filters used by the list endpoints
+    """
+    if region:
+        queryset = queryset.filter(**iexact('region', region))
+
+    if currency:
+        queryset = queryset.filter(**iexact('currency_code', currency))
+
+    return queryset
+
+
+def sort_countries(queryset, sort_param=None):
+    """
+    Apply one of the SORT_OPTIONS to a Country queryset; unknown values keep the default ordering
+    """
+    field, descending = sort_key(sort_param)
+    if field == 'estimated_gdp':
+        queryset = queryset.exclude(estimated_gdp__isnull=True)
+
+    prefix = '-' if descending else ''
+    return queryset.order_by(f'{prefix}{field}', f'{prefix}id')
@@ -0,0 +1,193 @@
+"""
+Local mirror of the country flag images.
+
+After each refresh the flags are downloaded concurrently, revalidated with
+the upstream ETag/Last-Modified and skipped when their content hash is
+unchanged. Every new flag is stored as resized PNG and WebP thumbnails named
+by that hash, so a URL carrying the hash can be cached by clients forever.
+A manifest maps each upstream URL to its hash and validators.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from PIL import Image
+
+from .utils import IMAGE_FORMATS, save_image_atomic
+
+logger = logging.getLogger(__name__)
+
+FLAG_WIDTHS = (80, 160, 320)
+DEFAULT_FLAG_WIDTH = 160
+MANIFEST_NAME = 'manifest.json'
+DOWNLOAD_TIMEOUT = 10
+
+# flagcdn serves SVG by default; Pillow cannot decode SVG but the CDN has PNG renditions
+_FLAGCDN_SVG = re.compile(r'^https?://flagcdn\.com/([a-z-]+)\.svg$', re.IGNORECASE)
+
+_manifest_lock = threading.Lock()
+_manifest = None
+_manifest_key = None
+
+
+def get_flag_dir():
+    return getattr(
+        settings,
+        'COUNTRIES_FLAG_DIR',
+        os.path.join(settings.BASE_DIR, 'cache', 'flags'),
+    )
+
+
+def raster_url(flag_url):
+    """
+    Return a URL for a raster rendition of ``flag_url``, or None if there is none
+    """
+    match = _FLAGCDN_SVG.match(flag_url)
+    if match:
+        return f'https://flagcdn.com/w{max(FLAG_WIDTHS)}/{match.group(1).lower()}.png'
+    if flag_url.lower().endswith('.svg'):
+        return None
+    return flag_url
+
+
+def flag_path(digest, image_format, width):
+    return os.path.join(get_flag_dir(), f'{digest}-{width}.{image_format}')
+
+
+def load_manifest():
+    """
+    Return the mirror manifest ({flag_url: entry}), reloading it when the file changes
+    """
+    global _manifest, _manifest_key
+
+    path = os.path.join(get_flag_dir(), MANIFEST_NAME)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+
+    key = (stat.st_ino, stat.st_mtime_ns)
+    if key == _manifest_key:
+        return _manifest
+
+    with _manifest_lock:
+        if key != _manifest_key:
+            try:
+                with open(path, encoding='utf-8') as fh:
+                    manifest = json.load(fh)
+            except (OSError, ValueError):
+                logger.exception("Could not load flag manifest from %s", path)
+                return {}
+            _manifest, _manifest_key = manifest, key
+        return _manifest
+
+
+def _write_manifest(manifest):
+    flag_dir = get_flag_dir()
+    fd, tmp_path = tempfile.mkstemp(dir=flag_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp_path, os.path.join(flag_dir, MANIFEST_NAME))
+
+
+def _store_thumbnails(digest, content):
+    with Image.open(io.BytesIO(content)) as source:
+        source = source.convert('RGBA')
+        for width in FLAG_WIDTHS:
+            height = max(1, round(source.height * width / source.width))
+            thumbnail = source.resize((width, height), Image.LANCZOS) if width < source.width else source
+            for image_format, (pil_format, _) in IMAGE_FORMATS.items():
+                save_image_atomic(thumbnail, flag_path(digest, image_format, width), pil_format)
+
+
+def _mirror_one(session, flag_url, previous):
+    """
+    Fetch one flag and return its manifest entry; ``previous`` is the old entry, if any
+    """
+    url = raster_url(flag_url)
+    if url is None:
+        return None
+
+    headers = {}
+    if previous and all(os.path.exists(flag_path(previous['sha1'], 'png', w)) for w in FLAG_WIDTHS):
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    response = session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 304:
+        return previous
+    response.raise_for_status()
+
+    digest = hashlib.sha1(response.content).hexdigest()
+    if not (previous and previous['sha1'] == digest and headers):
+        _store_thumbnails(digest, response.content)
+
+    return {
+        'sha1': digest,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+
+
+def mirror_flags(flag_urls, max_workers=None):
+    """
+    Bring the local mirror up to date with ``flag_urls``.
+
+    Downloads run on a bounded thread pool sharing one connection pool; a
+    failed flag keeps its previous entry. Thumbnails no longer referenced by
+    the manifest are removed. Returns counts of fetched, unchanged and failed flags.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'COUNTRIES_FLAG_WORKERS', 8)
+
+    os.makedirs(get_flag_dir(), exist_ok=True)
+    previous = load_manifest()
+    urls = sorted(set(url for url in flag_urls if url))
+    stats = {'fetched': 0, 'unchanged': 0, 'failed': 0}
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    manifest = {}
+    with session, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='flag-mirror') as pool:
+        futures = {url: pool.submit(_mirror_one, session, url, previous.get(url)) for url in urls}
+        for url, future in futures.items():
+            try:
+                entry = future.result()
+            except Exception as exc:
+                logger.warning("Could not mirror flag %s: %s", url, exc)
+                stats['failed'] += 1
+                entry = previous.get(url)
+            else:
+                if entry is None:
+                    continue
+                stats['unchanged' if entry == previous.get(url) else 'fetched'] += 1
+            if entry is not None:
+                manifest[url] = entry
+
+    _write_manifest(manifest)
+    _prune(manifest)
+    return stats
+
+
+def _prune(manifest):
+    live = {entry['sha1'] for entry in manifest.values()}
+    for entry in os.scandir(get_flag_dir()):
+        digest = entry.name.split('-', 1)[0]
+        if entry.name != MANIFEST_NAME and digest not in live and not entry.name.endswith('.tmp'):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,103 @@
+"""
+Conditional, proxy-friendly delivery of generated images.
+
+Responses carry an ETag and Last-Modified so clients revalidate with a 304
+instead of downloading the image again. Versioned URLs (``?v=``) are cached
+for a year. Depending on ``COUNTRIES_IMAGE_DELIVERY`` the bytes are handed to
+the front proxy, served from a per-worker memory cache or streamed from disk.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .utils import get_cache_dir
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Bytes held by the per-worker memory cache before the least recently used
+# images are dropped; replaced image versions age out the same way
+DEFAULT_MEMORY_BYTES = 32 * 1024 * 1024
+
+_memory_lock = threading.Lock()
+# path -> (mtime_ns, bytes), least recently used first
+_memory = OrderedDict()
+_memory_size = 0
+
+
+def _cached_bytes(path):
+    global _memory_size
+
+    mtime = os.stat(path).st_mtime_ns
+    with _memory_lock:
+        entry = _memory.get(path)
+        if entry is not None and entry[0] == mtime:
+            _memory.move_to_end(path)
+            return entry[1]
+    with open(path, 'rb') as fh:
+        data = fh.read()
+
+    limit = getattr(settings, 'COUNTRIES_IMAGE_MEMORY_BYTES', DEFAULT_MEMORY_BYTES)
+    with _memory_lock:
+        previous = _memory.pop(path, None)
+        if previous is not None:
+            _memory_size -= len(previous[1])
+        _memory[path] = (mtime, data)
+        _memory_size += len(data)
+        while _memory_size > limit and len(_memory) > 1:
+            _, (_, evicted) = _memory.popitem(last=False)
+            _memory_size -= len(evicted)
+    return data
+
+
+def _body_response(path, content_type, filename):
+    delivery = (getattr(settings, 'COUNTRIES_IMAGE_DELIVERY', None) or '').lower()
+
+    if delivery in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        if delivery == 'x-accel-redirect':
+            cache_dir = get_cache_dir()
+            prefix = getattr(settings, 'COUNTRIES_IMAGE_ACCEL_PREFIX', '/protected/cache/')
+            relative = os.path.relpath(path, cache_dir).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative
+        else:
+            response['X-Sendfile'] = os.path.abspath(path)
+    elif delivery == 'memory':
+        response = HttpResponse(_cached_bytes(path), content_type=content_type)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
+
+
+def image_response(request, path, content_type, filename, etag, last_modified, version=None):
+    """
+    Serve the image at ``path``, answering 304 when the client's copy is current.
+
+    ``path`` may be a callable returning the path (or None for 404), so a
+    variant is only derived when a body is actually sent. ``etag`` must change
+    whenever the bytes do. When the request names the
+    current ``version`` with ``?v=`` the response may be cached indefinitely;
+    otherwise clients must revalidate on each use.
+    """
+    etag = f'"{etag}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is None:
+        if callable(path):
+            path = path()
+            if path is None:
+                raise FileNotFoundError('image is no longer available')
+        response = _body_response(path, content_type, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    if version is not None and request.GET.get('v') == version:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
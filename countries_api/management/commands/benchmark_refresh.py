@@ -0,0 +1,240 @@
+"""
+Benchmark the countries refresh pipeline without touching the real upstream APIs.
+
+A stub HTTP server on localhost serves synthetic (or recorded and replicated)
+countries and exchange-rate payloads, the settings are pointed at it, and
+the real ``refresh_countries_background`` runs against a throwaway test
+database for the configured engine. Each payload size is refreshed three
+times: into empty tables, again with the same payload, and with every rate
+changed, so the insert, unchanged and update paths are all measured.
+
+Run it once per engine by pointing DATABASE_URL at SQLite or Postgres.
+"""
+import itertools
+import json
+import platform
+import random
+import string
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from countries_api.models import Country, CountryAggregate, ExchangeRate, RefreshMetadata
+from countries_api.services import refresh_countries_background
+
+DEFAULT_SIZES = [250, 10_000, 100_000]
+REGIONS = ['Africa', 'Americas', 'Asia', 'Europe', 'Oceania', 'Polar']
+CURRENCY_COUNT = 170
+
+
+def synthetic_countries(size, rng):
+    """
+    Return ``size`` countries shaped like the REST Countries v2 payload, plus their currency codes
+    """
+    codes = [
+        ''.join(letters)
+        for letters in itertools.islice(itertools.product(string.ascii_uppercase, repeat=3), 0, None, 97)
+    ][:CURRENCY_COUNT]
+    countries = []
+    for i in range(size):
+        code = rng.choice(codes) if rng.random() > 0.02 else None
+        countries.append({
+            'name': f'Country {i:06d}',
+            'capital': f'Capital {i}',
+            'region': rng.choice(REGIONS),
+            'population': rng.randint(1_000, 1_500_000_000),
+            'flag': f'https://flagcdn.com/c{i}.svg',
+            'currencies': [{'code': code, 'name': code, 'symbol': '$'}] if code else [],
+        })
+    return countries, codes
+
+
+def replicate(template, size):
+    """
+    Repeat a recorded payload until it has ``size`` rows, suffixing names to keep them unique
+    """
+    countries = []
+    for i in range(size):
+        country = dict(template[i % len(template)])
+        copy = i // len(template)
+        if copy:
+            country['name'] = f"{country.get('name')} {copy}"
+        countries.append(country)
+    return countries
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.payloads.get(self.path.split('?', 1)[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubUpstream(ThreadingHTTPServer):
+    """
+    Serves ``payloads`` (path -> bytes) as JSON; the payloads can be swapped between runs.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        self.payloads = {}
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the countries refresh against a local stand-in for the upstream APIs and print JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+            help='Number of countries per benchmarked payload',
+        )
+        parser.add_argument(
+            '--countries-file',
+            help='Recorded REST Countries JSON to replicate instead of synthetic data',
+        )
+        parser.add_argument(
+            '--rates-file',
+            help='Recorded exchange-rate JSON ({"rates": {...}}) to serve with --countries-file',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        template, rates = self._load_recorded(options)
+
+        server = _StubUpstream()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+                COUNTRIES_API_URL=f'{server.base_url}/countries',
+                EXCHANGE_RATES_API_URL=f'{server.base_url}/rates',
+                EXCHANGE_RATES_FALLBACK_URL=f'{server.base_url}/rates',
+                COUNTRIES_BACKGROUND_JOBS=False,
+                COUNTRIES_CACHE_DIR=cache_dir,
+                COUNTRIES_SNAPSHOT_DIR=f'{cache_dir}/snapshots',
+                COUNTRIES_FLAG_DIR=f'{cache_dir}/flags',
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            ):
+                results = []
+                for size in options['sizes']:
+                    if template is None:
+                        countries, codes = synthetic_countries(size, rng)
+                        size_rates = {code: round(rng.uniform(0.1, 5000), 4) for code in codes}
+                    else:
+                        countries, size_rates = replicate(template, size), rates
+                    results.extend(self._benchmark_size(server, countries, size_rates, options['batch_size']))
+        finally:
+            server.shutdown()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = json.dumps({
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(report)
+        else:
+            self.stdout.write(report)
+
+    def _load_recorded(self, options):
+        if not options['countries_file']:
+            return None, None
+        try:
+            with open(options['countries_file']) as fh:
+                template = json.load(fh)
+            rates = {}
+            if options['rates_file']:
+                with open(options['rates_file']) as fh:
+                    rates = json.load(fh).get('rates', {})
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not load recorded payload: {exc}')
+        if not isinstance(template, list) or not template:
+            raise CommandError('--countries-file must contain a non-empty JSON list')
+        return template, rates
+
+    def _benchmark_size(self, server, countries, rates, batch_size):
+        for model in (Country, CountryAggregate, ExchangeRate, RefreshMetadata):
+            model.objects.all().delete()
+
+        changed_rates = {code: rate * 1.01 for code, rate in rates.items()}
+        server.payloads['/countries'] = json.dumps(countries).encode()
+
+        results = []
+        for scenario, scenario_rates in (('insert', rates), ('same_payload', rates), ('rates_changed', changed_rates)):
+            server.payloads['/rates'] = json.dumps({'rates': scenario_rates}).encode()
+            results.append(self._run(scenario, len(countries), batch_size))
+            self.stderr.write(
+                f"{len(countries):>7} countries  {scenario:<13} {results[-1]['seconds']:8.3f}s  "
+                f"{results[-1]['queries']:>6} queries"
+            )
+        return results
+
+    def _run(self, scenario, size, batch_size):
+        metadata = RefreshMetadata.objects.create(
+            total_countries=Country.objects.count(),
+            last_refreshed_at=timezone.now(),
+            refresh_status='in_progress',
+        )
+
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        tracemalloc.start()
+        try:
+            with connection.execute_wrapper(count_queries):
+                started = time.perf_counter()
+                refresh_countries_background(metadata.id, batch_size=batch_size)
+                elapsed = time.perf_counter() - started
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        metadata.refresh_from_db()
+        return {
+            'size': size,
+            'scenario': scenario,
+            'status': metadata.refresh_status,
+            'seconds': round(elapsed, 4),
+            'rows_per_second': round(size / elapsed, 1) if elapsed else None,
+            'queries': queries,
+            'peak_memory_bytes': peak_memory,
+            'bytes_downloaded': metadata.bytes_downloaded,
+            'rows_created': metadata.rows_created,
+            'rows_updated': metadata.rows_updated,
+            'rows_unchanged': metadata.rows_unchanged,
+            'stage_timings': metadata.stage_timings,
+        }
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0002_alter_country_estimated_gdp_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='bytes_downloaded',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='rows_created',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='rows_unchanged',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='rows_updated',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshmetadata',
+            name='stage_timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='refreshmetadata',
+            name='refresh_status',
+            field=models.CharField(choices=[('success', 'Success'), ('failed', 'Failed'), ('in_progress', 'In Progress'), ('fetching_countries', 'Fetching Countries'), ('fetching_rates', 'Fetching Rates'), ('processing', 'Processing')], default='success', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0003_refresh_instrumentation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='refreshmetadata',
+            name='refresh_status',
+            field=models.CharField(choices=[('success', 'Success'), ('failed', 'Failed'), ('in_progress', 'In Progress'), ('fetching_countries', 'Fetching Countries'), ('fetching_rates', 'Fetching Rates'), ('processing', 'Processing'), ('publishing', 'Publishing')], default='success', max_length=20),
+        ),
+    ]
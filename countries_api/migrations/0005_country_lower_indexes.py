@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:17
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0004_refresh_publishing_stage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='country',
+            name='currency_code',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='region',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='countries_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(django.db.models.functions.text.Lower('region'), name='countries_region_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(django.db.models.functions.text.Lower('currency_code'), name='countries_currency_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0005_country_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountryAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('region', 'Region'), ('currency', 'Currency')], max_length=10)),
+                ('key', models.CharField(blank=True, max_length=100, null=True)),
+                ('country_count', models.IntegerField(default=0)),
+                ('total_population', models.BigIntegerField(default=0)),
+                ('total_estimated_gdp', models.FloatField(default=0)),
+                ('rate_min', models.FloatField(blank=True, null=True)),
+                ('rate_max', models.FloatField(blank=True, null=True)),
+                ('rate_mean', models.FloatField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Country Aggregate',
+                'verbose_name_plural': 'Country Aggregates',
+                'db_table': 'country_aggregates',
+                'ordering': ['dimension', 'key'],
+                'indexes': [models.Index(fields=['dimension', 'key'], name='country_aggregates_dim_idx')],
+            },
+        ),
+    ]
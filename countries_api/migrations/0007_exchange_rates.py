@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0006_country_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency_code', models.CharField(max_length=10)),
+                ('rate', models.FloatField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('refresh', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exchange_rates', to='countries_api.refreshmetadata')),
+            ],
+            options={
+                'verbose_name': 'Exchange Rate',
+                'verbose_name_plural': 'Exchange Rates',
+                'db_table': 'exchange_rates',
+                'ordering': ['currency_code'],
+                'constraints': [models.UniqueConstraint(fields=('refresh', 'currency_code'), name='exchange_rates_refresh_currency_uniq')],
+            },
+        ),
+    ]
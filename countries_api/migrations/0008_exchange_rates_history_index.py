@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('countries_api', '0007_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exchangerate',
+            index=models.Index(fields=['currency_code', 'recorded_at', 'rate'], name='exchange_rates_history_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 
@@ -8,9 +9,9 @@ class Country(models.Model):
     """
     name = models.CharField(max_length=255, unique=True, db_index=True)
     capital = models.CharField(max_length=255, null=True, blank=True)
-    region = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    region = models.CharField(max_length=100, null=True, blank=True)
     population = models.BigIntegerField()
-    currency_code = models.CharField(max_length=10, null=True, blank=True, db_index=True)
+    currency_code = models.CharField(max_length=10, null=True, blank=True)
     exchange_rate = models.FloatField(null=True, blank=True)
     estimated_gdp = models.FloatField(null=True, blank=True)
     flag_url = models.URLField(max_length=500, null=True, blank=True)
@@ -23,11 +24,22 @@ class Country(models.Model):
         ordering = ['-last_refreshed_at']
         verbose_name = 'Country'
         verbose_name_plural = 'Countries'
+        # Case-insensitive lookups go through LOWER(), so index that expression
+        indexes = [
+            models.Index(Lower('name'), name='countries_name_lower_idx'),
+            models.Index(Lower('region'), name='countries_region_lower_idx'),
+            models.Index(Lower('currency_code'), name='countries_currency_lower_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+# Enables ``field__lower=...`` on the columns with a LOWER() index (and no others)
+for _field in ('name', 'region', 'currency_code'):
+    Country._meta.get_field(_field).register_lookup(Lower)
+
+
 class RefreshMetadata(models.Model):
     """
     Model to store metadata about the last refresh operation
@@ -39,10 +51,21 @@ class RefreshMetadata(models.Model):
         choices=[
             ('success', 'Success'),
             ('failed', 'Failed'),
-            ('in_progress', 'In Progress')
+            ('in_progress', 'In Progress'),
+            ('fetching_countries', 'Fetching Countries'),
+            ('fetching_rates', 'Fetching Rates'),
+            ('processing', 'Processing'),
+            ('publishing', 'Publishing'),
         ],
         default='success'
     )
+    # Seconds spent in each stage, keyed by stage name
+    stage_timings = models.JSONField(default=dict, blank=True)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_unchanged = models.IntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -54,3 +77,67 @@ class RefreshMetadata(models.Model):
 
     def __str__(self):
         return f"Refresh at {self.last_refreshed_at} - {self.total_countries} countries"
+
+
+class CountryAggregate(models.Model):
+    """
+    Model to store per-region and per-currency totals computed at refresh time
+    """
+    dimension = models.CharField(
+        max_length=10,
+        choices=[
+            ('region', 'Region'),
+            ('currency', 'Currency')
+        ]
+    )
+    # Null groups countries without a region or currency
+    key = models.CharField(max_length=100, null=True, blank=True)
+    country_count = models.IntegerField(default=0)
+    total_population = models.BigIntegerField(default=0)
+    total_estimated_gdp = models.FloatField(default=0)
+    rate_min = models.FloatField(null=True, blank=True)
+    rate_max = models.FloatField(null=True, blank=True)
+    rate_mean = models.FloatField(null=True, blank=True)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'country_aggregates'
+        ordering = ['dimension', 'key']
+        verbose_name = 'Country Aggregate'
+        verbose_name_plural = 'Country Aggregates'
+        indexes = [
+            models.Index(fields=['dimension', 'key'], name='country_aggregates_dim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.key}: {self.country_count} countries"
+
+
+class ExchangeRate(models.Model):
+    """
+    Model to store the USD-based exchange rates fetched by a refresh
+    """
+    refresh = models.ForeignKey(
+        RefreshMetadata,
+        on_delete=models.CASCADE,
+        related_name='exchange_rates'
+    )
+    currency_code = models.CharField(max_length=10)
+    rate = models.FloatField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'exchange_rates'
+        ordering = ['currency_code']
+        verbose_name = 'Exchange Rate'
+        verbose_name_plural = 'Exchange Rates'
+        constraints = [
+            models.UniqueConstraint(fields=['refresh', 'currency_code'], name='exchange_rates_refresh_currency_uniq'),
+        ]
+        # Covering index: history range scans never need to visit the table
+        indexes = [
+            models.Index(fields=['currency_code', 'recorded_at', 'rate'], name='exchange_rates_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency_code}={self.rate} ({self.recorded_at})"
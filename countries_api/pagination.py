@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .filters import SORT_FIELDS, sort_key
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _sort_name(sort_param):
+    """
+    Name the ordering a cursor belongs to; unknown sorts fall back to the default order
+    """
+    return sort_param if sort_param in SORT_FIELDS else 'default'
+
+
+def parse_limit(value):
+    """
+    Parse the ``limit`` query parameter; None means pagination is off
+    """
+    if value in (None, ''):
+        return None
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def encode_cursor(row, sort_param=None):
+    """
+    Build an opaque cursor pointing just after ``row`` for the given sort.
+
+    The sort is stored alongside the position, as a position only means
+    something in the ordering it was taken from.
+    """
+    field, _ = sort_key(sort_param)
+    value = row[field]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([_sort_name(sort_param), value, row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_param=None):
+    """
+    Return the (sort value, id) pair stored in a cursor issued for ``sort_param``
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise InvalidCursor("cursor is malformed")
+
+    if cursor_sort != _sort_name(sort_param):
+        raise InvalidCursor("cursor does not match the requested sort")
+    field, _ = sort_key(sort_param)
+    if field == 'last_refreshed_at':
+        value = parse_datetime(value) if isinstance(value, str) else None
+        if value is None:
+            raise InvalidCursor("cursor does not match the requested sort")
+    return value, pk
+
+
+def seek(queryset, sort_param, cursor_value):
+    """
+    Restrict an ordered queryset to the rows after ``cursor_value`` (keyset pagination)
+    """
+    field, descending = sort_key(sort_param)
+    value, pk = cursor_value
+    op = 'lt' if descending else 'gt'
+    return queryset.filter(
+        Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+    )
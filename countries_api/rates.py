@@ -0,0 +1,84 @@
+"""
+In-process cross-rate matrix built from the rates stored by the last refresh.
+
+Each worker loads the matrix once per data version and converts whole
+batches of (amount, from, to) triples with a single NumPy gather, so batch
+conversions never touch the database or the upstream rates API per item.
+"""
+import threading
+
+import numpy as np
+
+from .models import RefreshMetadata
+from .response_cache import data_version
+
+_lock = threading.Lock()
+_matrix = None
+_matrix_version = None
+
+
+class CrossRateMatrix:
+    """
+    ``matrix[i, j]`` converts one unit of ``codes[i]`` into ``codes[j]``.
+    """
+
+    def __init__(self, refresh_id, recorded_at, rates):
+        self.refresh_id = refresh_id
+        self.recorded_at = recorded_at
+        # Sorted so codes can be located with searchsorted
+        self.codes = np.array(sorted(rates), dtype=str)
+        usd_rates = np.array([rates[code] for code in self.codes.tolist()], dtype=np.float64)
+        self.matrix = np.outer(1.0 / usd_rates, usd_rates)
+
+    def indices(self, codes):
+        """
+        Return the matrix index of each code, or -1 for unknown codes
+        """
+        codes = np.char.upper(np.asarray(codes, dtype=str))
+        if not len(self.codes):
+            return np.full(len(codes), -1)
+        positions = np.searchsorted(self.codes, codes)
+        positions = np.minimum(positions, len(self.codes) - 1)
+        return np.where(self.codes[positions] == codes, positions, -1)
+
+    def convert(self, amounts, from_codes, to_codes):
+        """
+        Convert amounts between currencies; unknown currencies give NaN
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        source = self.indices(from_codes)
+        target = self.indices(to_codes)
+        known = (source >= 0) & (target >= 0)
+
+        converted = np.full(len(amounts), np.nan)
+        converted[known] = amounts[known] * self.matrix[source[known], target[known]]
+        return converted
+
+
+def _load():
+    refresh = (
+        RefreshMetadata.objects
+        .filter(refresh_status='success', exchange_rates__isnull=False)
+        .order_by('-last_refreshed_at', '-id')
+        .first()
+    )
+    if refresh is None:
+        return None
+    rates = dict(refresh.exchange_rates.values_list('currency_code', 'rate'))
+    return CrossRateMatrix(refresh.id, refresh.last_refreshed_at, rates)
+
+
+def get_matrix():
+    """
+    Return this worker's cross-rate matrix, reloading it when the data version changes
+    """
+    global _matrix, _matrix_version
+
+    version = data_version()
+    if version == _matrix_version:
+        return _matrix
+
+    with _lock:
+        if version != _matrix_version:
+            _matrix, _matrix_version = _load(), version
+        return _matrix
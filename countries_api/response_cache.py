@@ -0,0 +1,140 @@
+"""
+Refresh-versioned cache for the countries read endpoints.
+
+Cached responses are keyed by endpoint, normalised query parameters and the
+current data version. The version embeds the id of the latest successful
+refresh and is bumped whenever the data changes (refresh, upsert or edit), which
+invalidates every cached response at once without having to find them.
+
+The recompute lock and the hit/miss counters rely on ``cache.add`` and
+``cache.incr`` being atomic, which holds for Redis but not across processes
+for the file-based fallback; there they are best-effort.
+"""
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'countries'
+VERSION_KEY = f'{KEY_PREFIX}:data-version'
+STATS_KEYS = {
+    'hits': f'{KEY_PREFIX}:stats:hits',
+    'misses': f'{KEY_PREFIX}:stats:misses',
+    'coalesced': f'{KEY_PREFIX}:stats:coalesced',
+}
+
+RESPONSE_TIMEOUT = 60 * 60
+# How long a worker may hold the recompute lock, and how long others wait for it
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+# Parameters matched case-insensitively by the views
+CASE_INSENSITIVE_PARAMS = {'region', 'currency', 'name'}
+
+
+def data_version():
+    """
+    Return the current data version, seeding it from the database if the cache lost it
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        from .services import current_generation
+
+        cache.add(VERSION_KEY, f"{current_generation() or 0}:0", timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version(generation=None):
+    """
+    Invalidate every cached response by moving to a new data version
+    """
+    if generation is None:
+        from .services import current_generation
+
+        generation = current_generation()
+    cache.set(VERSION_KEY, f"{generation or 0}:{time.time_ns()}", timeout=None)
+
+
+def _record(stat):
+    key = STATS_KEYS[stat]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def cache_stats():
+    """
+    Return hit/miss counters and the hit rate of the response cache
+    """
+    values = cache.get_many(list(STATS_KEYS.values()))
+    stats = {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    stats['data_version'] = cache.get(VERSION_KEY)
+    return stats
+
+
+def make_key(endpoint, params):
+    """
+    Build the cache key for ``params``, a QueryDict or a plain mapping
+    """
+    items = params.lists() if hasattr(params, 'lists') else ((name, [value]) for name, value in params.items())
+    normalised = sorted(
+        (name, value.lower() if name in CASE_INSENSITIVE_PARAMS else value)
+        for name, values in items
+        for value in values
+    )
+    digest = hashlib.sha1(repr(normalised).encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:response:{endpoint}:{data_version()}:{digest}'
+
+
+def cached_response(endpoint, params, compute, timeout=RESPONSE_TIMEOUT):
+    """
+    Return a cached Response for (endpoint, params) or build it with ``compute``.
+
+    Only one worker recomputes a missing key: it takes a short-lived lock
+    while the others poll for its result, falling back to computing it
+    themselves if the lock holder does not finish in time. Only 200
+    responses are stored.
+    """
+    try:
+        key = make_key(endpoint, params)
+        data = cache.get(key)
+    except Exception:
+        logger.exception("Response cache unavailable, serving uncached")
+        return compute()
+
+    if data is not None:
+        _record('hits')
+        return Response(data, status=status.HTTP_200_OK)
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                _record('hits')
+                _record('coalesced')
+                return Response(data, status=status.HTTP_200_OK)
+        lock_key = None
+
+    _record('misses')
+    try:
+        response = compute()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=timeout)
+        return response
+    finally:
+        if lock_key is not None:
+            cache.delete(lock_key)
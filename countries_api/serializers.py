@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Country, RefreshMetadata
+from .models import Country, CountryAggregate, RefreshMetadata
 
 
 class CountrySerializer(serializers.ModelSerializer):
@@ -58,6 +58,31 @@ class CountrySerializer(serializers.ModelSerializer):
         return data
 
 
+class CountryBulkItemSerializer(CountrySerializer):
+    """
+    Validates one record of a bulk upsert. Existing names are updated rather
+    than rejected, so the unique check on name is left to the upsert itself.
+    """
+    name = serializers.CharField(max_length=255)
+
+
+class CountryBulkRequestSerializer(serializers.Serializer):
+    """
+    Serializer documenting the bulk upsert request body
+    """
+    countries = CountryBulkItemSerializer(many=True)
+
+
+class CountryBulkResponseSerializer(serializers.Serializer):
+    """
+    Serializer for bulk upsert responses
+    """
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.JSONField())
+
+
 class CountryListSerializer(serializers.ModelSerializer):
     """
     Simplified serializer for listing countries
@@ -78,6 +103,33 @@ class CountryListSerializer(serializers.ModelSerializer):
         ]
 
 
+class CountrySuggestionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for autocomplete suggestions
+    """
+    class Meta:
+        model = Country
+        fields = ['id', 'name', 'region', 'population', 'flag_url']
+
+
+class CountryAggregateSerializer(serializers.ModelSerializer):
+    """
+    Serializer for per-region / per-currency aggregates
+    """
+    class Meta:
+        model = CountryAggregate
+        fields = [
+            'key',
+            'country_count',
+            'total_population',
+            'total_estimated_gdp',
+            'rate_min',
+            'rate_max',
+            'rate_mean',
+            'computed_at'
+        ]
+
+
 class RefreshMetadataSerializer(serializers.ModelSerializer):
     """
     Serializer for RefreshMetadata model
@@ -87,12 +139,86 @@ class RefreshMetadataSerializer(serializers.ModelSerializer):
         fields = ['total_countries', 'last_refreshed_at', 'refresh_status']
 
 
+class RefreshProgressSerializer(serializers.ModelSerializer):
+    """
+    Serializer for exposing the progress of a single refresh job
+    """
+    class Meta:
+        model = RefreshMetadata
+        fields = [
+            'id',
+            'refresh_status',
+            'stage_timings',
+            'bytes_downloaded',
+            'rows_created',
+            'rows_updated',
+            'rows_unchanged',
+            'total_countries',
+            'last_refreshed_at',
+            'finished_at',
+            'created_at',
+        ]
+
+
 class StatusResponseSerializer(serializers.Serializer):
     """
     Serializer for status endpoint response
     """
     total_countries = serializers.IntegerField()
     last_refreshed_at = serializers.DateTimeField(allow_null=True)
+    refresh_id = serializers.IntegerField(allow_null=True)
+    refresh_status = serializers.CharField(allow_null=True)
+
+
+class CacheStatsSerializer(serializers.Serializer):
+    """
+    Serializer for response cache statistics
+    """
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    coalesced = serializers.IntegerField()
+    hit_rate = serializers.FloatField(allow_null=True)
+    data_version = serializers.CharField(allow_null=True)
+
+
+class CurrencyConversionRequestSerializer(serializers.Serializer):
+    """
+    Serializer documenting the batch conversion request body
+    """
+    conversions = serializers.ListField(
+        child=serializers.ListField(min_length=3, max_length=3),
+        help_text='List of [amount, from_currency, to_currency] triples'
+    )
+
+
+class CurrencyConversionResponseSerializer(serializers.Serializer):
+    """
+    Serializer for batch conversion responses
+    """
+    results = serializers.ListField(child=serializers.FloatField(allow_null=True))
+    errors = serializers.ListField(child=serializers.JSONField())
+    rates_refresh_id = serializers.IntegerField()
+    rates_as_of = serializers.DateTimeField()
+
+
+class RateHistoryPointSerializer(serializers.Serializer):
+    """
+    Serializer for one point of an exchange-rate history
+    """
+    timestamp = serializers.DateTimeField()
+    rate = serializers.FloatField()
+    rate_min = serializers.FloatField()
+    rate_max = serializers.FloatField()
+    samples = serializers.IntegerField()
+
+
+class RateHistoryResponseSerializer(serializers.Serializer):
+    """
+    Serializer for exchange-rate history responses
+    """
+    currency = serializers.CharField()
+    resolution = serializers.CharField()
+    points = RateHistoryPointSerializer(many=True)
 
 
 class ErrorResponseSerializer(serializers.Serializer):
@@ -110,4 +236,5 @@ class RefreshResponseSerializer(serializers.Serializer):
     Serializer for refresh endpoint response
     """
     message = serializers.CharField()
+    refresh_id = serializers.IntegerField()
     started_at = serializers.CharField()
@@ -1,10 +1,23 @@
+import hashlib
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.utils import timezone
-from .models import Country, RefreshMetadata
+from .models import Country, CountryAggregate, ExchangeRate, RefreshMetadata
+from .snapshot import write_snapshot
+from .flags import mirror_flags
+from .response_cache import bump_version
 from .utils import (
     fetch_countries_data,
     fetch_exchange_rates,
     calculate_estimated_gdp,
+    clean_rates,
+    compute_aggregates,
     extract_currency_code,
     generate_summary_image,
     ExternalAPIError,
@@ -13,12 +26,338 @@ from .utils import (
 logger = logging.getLogger(__name__)
 
 
+COUNTRY_DATA_FIELDS = [
+    'capital',
+    'region',
+    'population',
+    'currency_code',
+    'exchange_rate',
+    'estimated_gdp',
+    'flag_url',
+]
+
+
 def _chunks(iterable, size=100):
     for i in range(0, len(iterable), size):
         yield iterable[i:i + size]
 
 
-def refresh_countries_background(metadata_id: int, timestamp=None, batch_size: int = 100):
+def current_generation():
+    """
+    Return the id of the latest successful refresh.
+
+    A refresh publishes its rows and flips this pointer in the same
+    transaction, so the id identifies the dataset readers currently see.
+    """
+    return (
+        RefreshMetadata.objects
+        .filter(refresh_status='success')
+        .order_by('-last_refreshed_at', '-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+
+
+STATUS_KEY = 'countries:status'
+
+
+def build_status():
+    """
+    Read the status summary from the database: row count, last successful
+    refresh and the stage of the most recent refresh job.
+    """
+    last_success = (
+        RefreshMetadata.objects
+        .filter(refresh_status='success')
+        .order_by('-last_refreshed_at', '-id')
+        .values_list('last_refreshed_at', flat=True)
+        .first()
+    )
+    latest_job = RefreshMetadata.objects.order_by('-id').values('id', 'refresh_status').first()
+    data = {
+        'total_countries': Country.objects.count(),
+        'last_refreshed_at': last_success.strftime('%Y-%m-%dT%H:%M:%SZ') if last_success else None,
+        'refresh_id': latest_job['id'] if latest_job else None,
+        'refresh_status': latest_job['refresh_status'] if latest_job else None,
+    }
+    etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+    return {'data': data, 'etag': etag}
+
+
+def publish_status():
+    """
+    Store a fresh status summary in the shared cache for ``GET /status``.
+
+    Called whenever the data or a refresh job changes so that polling the
+    status endpoint never has to query the database. The summary is stamped
+    with the time it was read, and a summary read earlier never replaces one
+    read later, so a slow publisher cannot overwrite a fresher status.
+    """
+    generation = time.time_ns()
+    status = {**build_status(), 'generation': generation}
+    try:
+        published = cache.get(STATUS_KEY)
+        if published is None or published.get('generation', 0) < generation:
+            cache.set(STATUS_KEY, status, timeout=None)
+    except Exception:
+        logger.exception("Could not publish status snapshot")
+    return status
+
+
+def cached_status():
+    """
+    Return the published status summary, publishing one if the cache lost it
+    """
+    try:
+        status = cache.get(STATUS_KEY)
+    except Exception:
+        logger.exception("Status snapshot unavailable, reading the database")
+        return build_status()
+    return status if status is not None else publish_status()
+
+
+def publish_snapshot(generation=None):
+    """
+    Write a fresh columnar snapshot of the countries table for the read path.
+
+    Failures are logged rather than raised: without a snapshot the views
+    simply fall back to querying the database.
+    """
+    if generation is None:
+        generation = current_generation()
+    try:
+        write_snapshot(generation)
+    except Exception:
+        logger.exception("Failed to write countries snapshot")
+
+
+def publish_changes():
+    """
+    Bring every derived read path up to date after the countries table changed.
+
+    Rewrites the snapshot, moves the response cache to a new version and
+    republishes the status; the summary image and flag mirror are queued.
+    """
+    publish_snapshot()
+    bump_version()
+    publish_status()
+    schedule_summary_render()
+    schedule_flag_mirror()
+
+
+# Saves and deletes outside the bulk paths (admin, shell, ORM) reach the read
+# paths through the signals in countries_api.signals. Each queues this on
+# commit; only the last one queued in a thread actually runs, so a transaction
+# touching many rows republishes once.
+_edits = threading.local()
+
+
+def country_edited():
+    """
+    Queue a republish for when the current transaction commits.
+    """
+    count = _edits.count = getattr(_edits, 'count', 0) + 1
+
+    def republish():
+        if count != _edits.count:
+            return
+        with transaction.atomic():
+            rebuild_aggregates()
+        publish_changes()
+
+    transaction.on_commit(republish)
+
+
+def rebuild_aggregates():
+    """
+    Recompute the region and currency summary rows from the countries table.
+
+    Call inside the transaction that changed the countries so the summary is
+    replaced atomically with the data it describes.
+    """
+    rows = list(Country.objects.values_list(
+        'region', 'currency_code', 'population', 'exchange_rate', 'estimated_gdp'
+    ))
+    regions, currencies, population, exchange_rate, estimated_gdp = (
+        list(column) for column in zip(*rows)
+    ) if rows else ([], [], [], [], [])
+
+    computed_at = timezone.now()
+    aggregates = []
+    for dimension, keys in (('region', regions), ('currency', currencies)):
+        for values in compute_aggregates(keys, population, exchange_rate, estimated_gdp):
+            aggregates.append(CountryAggregate(dimension=dimension, computed_at=computed_at, **values))
+
+    CountryAggregate.objects.all().delete()
+    CountryAggregate.objects.bulk_create(aggregates)
+
+
+def upsert_countries(records, batch_size=500):
+    """
+    Insert or update validated country records in bulk.
+
+    Names are matched case-insensitively and rewritten to the stored spelling
+    so the upsert hits the unique name instead of adding a near-duplicate.
+    Records are grouped by the fields they supply and each group only
+    overwrites those fields. As in a refresh, the estimated GDP is
+    recomputed when the population or exchange rate changes, unless the
+    record supplies one. Aggregates are rebuilt in the same transaction.
+    Returns (created, updated).
+    """
+    keys = {record['name'].lower() for record in records}
+    existing = {}
+    for chunk in _chunks(list(keys), batch_size):
+        rows = Country.objects.filter(name__lower__in=chunk).values('name', 'population', 'exchange_rate', 'estimated_gdp')
+        existing.update((row['name'].lower(), row) for row in rows)
+
+    groups = {}
+    for record in records:
+        stored = existing.get(record['name'].lower())
+        record = {**record, 'name': stored['name'] if stored else record['name']}
+        if 'estimated_gdp' not in record and ('population' in record or 'exchange_rate' in record):
+            current = {**(stored or {}), **record}
+            if stored is None or stored['estimated_gdp'] is None or any(
+                current[field] != stored[field] for field in ('population', 'exchange_rate')
+            ):
+                record['estimated_gdp'] = calculate_estimated_gdp(current.get('population'), current.get('exchange_rate'))
+        fields = tuple(sorted(field for field in record if field != 'name'))
+        groups.setdefault(fields, []).append(Country(**record))
+
+    with transaction.atomic():
+        for fields, countries in groups.items():
+            Country.objects.bulk_create(
+                countries,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=[*fields, 'updated_at'],
+            )
+        rebuild_aggregates()
+
+    created = sum(1 for record in records if record['name'].lower() not in existing)
+    return created, len(records) - created
+
+
+# Post-publish jobs (summary image, flag mirror) each run on their own
+# background thread so they never delay a refresh. A job that is already
+# waiting absorbs later requests instead of piling up: it reads the data
+# when it starts, so one pending run covers every change made before it.
+_background_lock = threading.Lock()
+_background_executors = {}
+_background_queued = set()
+
+
+def _run_background(job):
+    with _background_lock:
+        _background_queued.discard(job.__name__)
+    try:
+        job()
+    except Exception:
+        logger.exception("Background job %s failed", job.__name__)
+    finally:
+        connection.close()
+
+
+def _schedule(job):
+    if not getattr(settings, 'COUNTRIES_BACKGROUND_JOBS', True):
+        return
+    name = job.__name__
+    with _background_lock:
+        if name in _background_queued:
+            return
+        _background_queued.add(name)
+        executor = _background_executors.get(name)
+        if executor is None:
+            executor = _background_executors[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+    executor.submit(_run_background, job)
+
+
+def render_summary_image():
+    """
+    Render the summary image from the currently published data.
+    """
+    latest = (
+        RefreshMetadata.objects
+        .filter(refresh_status='success')
+        .order_by('-last_refreshed_at', '-id')
+        .first()
+    )
+    top_5 = Country.objects.filter(estimated_gdp__isnull=False).order_by('-estimated_gdp')[:5].values('name', 'estimated_gdp')
+    generate_summary_image(
+        total_countries=Country.objects.count(),
+        top_5_countries=list(top_5),
+        timestamp=latest.last_refreshed_at if latest else timezone.now(),
+        generation=latest.id if latest else None,
+    )
+
+
+def mirror_country_flags():
+    """
+    Bring the local flag mirror up to date with the published countries.
+    """
+    flag_urls = Country.objects.exclude(flag_url__isnull=True).values_list('flag_url', flat=True)
+    stats = mirror_flags(list(flag_urls))
+    logger.info("Flag mirror updated: %s", stats)
+
+
+def schedule_summary_render():
+    """
+    Queue a summary image render unless one is already waiting to run.
+    """
+    _schedule(render_summary_image)
+
+
+def schedule_flag_mirror():
+    """
+    Queue a flag mirror update unless one is already waiting to run.
+    """
+    _schedule(mirror_country_flags)
+
+
+class _StageRecorder:
+    """
+    Move a RefreshMetadata record through its stages, timing each one.
+
+    Every transition only writes the columns it touches so that polling the
+    progress endpoint never races with a full-row save.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.stats = {'bytes_downloaded': 0}
+        self._stage = None
+        self._stage_started = None
+
+    def _close_stage(self):
+        if self._stage is not None:
+            elapsed = time.perf_counter() - self._stage_started
+            self.metadata.stage_timings[self._stage] = round(elapsed, 4)
+        self._stage = None
+
+    def enter(self, stage):
+        self._close_stage()
+        self._stage = stage
+        self._stage_started = time.perf_counter()
+        self.metadata.refresh_status = stage
+        self.metadata.bytes_downloaded = self.stats['bytes_downloaded']
+        self.metadata.save(update_fields=['refresh_status', 'stage_timings', 'bytes_downloaded'])
+        publish_status()
+
+    def finish(self, refresh_status, **fields):
+        self._close_stage()
+        for attr, value in fields.items():
+            setattr(self.metadata, attr, value)
+        self.metadata.refresh_status = refresh_status
+        self.metadata.bytes_downloaded = self.stats['bytes_downloaded']
+        self.metadata.finished_at = timezone.now()
+        self.metadata.save(update_fields=[
+            'refresh_status', 'stage_timings', 'bytes_downloaded', 'finished_at', *fields,
+        ])
+        # The final state may be saved inside the publish transaction
+        transaction.on_commit(publish_status)
+
+
+def refresh_countries_background(metadata_id: int, timestamp=None, batch_size: int = 500):
     """
     Background worker that refreshes countries and updates the provided
     RefreshMetadata record as it progresses.
@@ -35,121 +374,128 @@ def refresh_countries_background(metadata_id: int, timestamp=None, batch_size: i
         logger.warning("RefreshMetadata id=%s not found, aborting refresh", metadata_id)
         return
 
-    try:
-        # indicate we've fetched countries
-        metadata.refresh_status = 'in_progress'
-        metadata.last_refreshed_at = timestamp
-        metadata.save()
+    recorder = _StageRecorder(metadata)
+    metadata.stage_timings = {}
 
+    try:
         # Fetch external data
-        countries = fetch_countries_data()
-        metadata.refresh_status = 'fetched_countries'
-        metadata.save()
+        recorder.enter('fetching_countries')
+        countries = fetch_countries_data(stats=recorder.stats)
 
-        rates = fetch_exchange_rates()
-        metadata.refresh_status = 'fetched_rates'
-        metadata.save()
+        recorder.enter('fetching_rates')
+        rates = fetch_exchange_rates(stats=recorder.stats) or {}
 
     except ExternalAPIError as exc:
         logger.exception("External API failure during refresh: %s", exc)
-        metadata.refresh_status = 'failed'
-        metadata.last_refreshed_at = timezone.now()
-        metadata.save()
+        recorder.finish('failed', last_refreshed_at=timezone.now())
+        bump_version()
         return
 
     try:
-        metadata.refresh_status = 'processing'
-        metadata.save()
+        recorder.enter('processing')
+
+        existing_map = {c.name.lower(): c for c in Country.objects.all()}
+
+        # Stage the complete dataset in memory before touching the table so the
+        # publish step below is a short, write-only transaction.
+        staged = {}
+        unchanged_ids = []
+
+        for country_data in countries:
+            name = (country_data.get('name') or '').strip()
+            if not name:
+                continue
 
-        existing_qs = Country.objects.all()
-        existing_map = {c.name.lower(): c for c in existing_qs}
+            capital = country_data.get('capital') or None
+            region = country_data.get('region') or None
+            population = country_data.get('population') or 0
+            flag_url = country_data.get('flag') or None
+            currencies = country_data.get('currencies') or []
 
-        to_create = []
-        to_update = []
+            currency_code = extract_currency_code(currencies)
 
-        for chunk in _chunks(countries, batch_size):
-            to_create.clear()
-            to_update.clear()
+            exchange_rate = None
+            if currency_code:
+                rate_val = rates.get(currency_code) or rates.get(currency_code.upper())
+                if rate_val is not None:
+                    try:
+                        exchange_rate = float(rate_val)
+                    except Exception:
+                        exchange_rate = None
 
-            for country_data in chunk:
-                name = (country_data.get('name') or '').strip()
-                if not name:
+            # Fields taken from the upstream payload. The estimated GDP carries
+            # a random multiplier, so it is only recomputed when one of these
+            # changes (or was never computed); otherwise the stored value stands.
+            values = {
+                'capital': capital,
+                'region': region,
+                'population': population or 0,
+                'currency_code': currency_code,
+                'exchange_rate': exchange_rate,
+                'flag_url': flag_url,
+            }
+
+            key = name.lower()
+            existing = existing_map.get(key)
+            if existing is not None:
+                if all(getattr(existing, field) == value for field, value in values.items()) and (
+                    existing.estimated_gdp is not None or not exchange_rate
+                ):
+                    unchanged_ids.append(existing.pk)
                     continue
+                # Keep the stored spelling so the upsert hits the unique name
+                name = existing.name
+
+            values['estimated_gdp'] = calculate_estimated_gdp(population, exchange_rate)
+            staged[key] = Country(name=name, last_refreshed_at=timestamp, **values)
+
+        rows_created = sum(1 for key in staged if key not in existing_map)
+        rows_updated = len(staged) - rows_created
+
+        recorder.enter('publishing')
+
+        # Publish everything, including the job's success status which acts as
+        # the generation pointer, in one transaction: readers keep seeing the
+        # previous snapshot until commit and never wait on row locks.
+        with transaction.atomic():
+            Country.objects.bulk_create(
+                list(staged.values()),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=COUNTRY_DATA_FIELDS + ['last_refreshed_at'],
+            )
+
+            # Unchanged rows only need their refresh timestamp bumped
+            for chunk in _chunks(unchanged_ids, batch_size):
+                Country.objects.filter(pk__in=chunk).update(last_refreshed_at=timestamp)
+
+            rebuild_aggregates()
+
+            ExchangeRate.objects.bulk_create(
+                [
+                    ExchangeRate(refresh=metadata, currency_code=code, rate=rate, recorded_at=timestamp)
+                    for code, rate in clean_rates(rates).items()
+                ],
+                batch_size=batch_size,
+            )
+
+            total_countries = Country.objects.count()
+            recorder.finish(
+                'success',
+                total_countries=total_countries,
+                last_refreshed_at=timestamp,
+                rows_created=rows_created,
+                rows_updated=rows_updated,
+                rows_unchanged=len(unchanged_ids),
+            )
 
-                capital = country_data.get('capital') or None
-                region = country_data.get('region') or None
-                population = country_data.get('population') or 0
-                flag_url = country_data.get('flag') or None
-                currencies = country_data.get('currencies') or []
-
-                currency_code = extract_currency_code(currencies)
-
-                exchange_rate = None
-                estimated_gdp = None
-
-                if currency_code:
-                    rate_val = rates.get(currency_code) or rates.get(currency_code.upper())
-                    if rate_val is not None:
-                        try:
-                            exchange_rate = float(rate_val)
-                        except Exception:
-                            exchange_rate = None
-                        estimated_gdp = calculate_estimated_gdp(population, exchange_rate)
-
-                key = name.lower()
-                if key in existing_map:
-                    inst = existing_map[key]
-                    inst.capital = capital
-                    inst.region = region
-                    inst.population = population or 0
-                    inst.currency_code = currency_code
-                    inst.exchange_rate = exchange_rate
-                    inst.estimated_gdp = estimated_gdp
-                    inst.flag_url = flag_url
-                    inst.last_refreshed_at = timestamp
-                    to_update.append(inst)
-                else:
-                    inst = Country(
-                        name=name,
-                        capital=capital,
-                        region=region,
-                        population=population or 0,
-                        currency_code=currency_code,
-                        exchange_rate=exchange_rate,
-                        estimated_gdp=estimated_gdp,
-                        flag_url=flag_url,
-                        last_refreshed_at=timestamp,
-                    )
-                    to_create.append(inst)
-
-            if to_create:
-                Country.objects.bulk_create(to_create, batch_size=len(to_create))
-                for c in to_create:
-                    existing_map[c.name.lower()] = c
-
-            if to_update:
-                Country.objects.bulk_update(
-                    to_update,
-                    ['capital', 'region', 'population', 'currency_code', 'exchange_rate', 'estimated_gdp', 'flag_url', 'last_refreshed_at'],
-                    batch_size=len(to_update)
-                )
-
-        # success
-        total_countries = Country.objects.count()
-        metadata.total_countries = total_countries
-        metadata.last_refreshed_at = timestamp
-        metadata.refresh_status = 'success'
-        metadata.save()
-
-        # Generate image summarising results
-        top_5 = Country.objects.filter(estimated_gdp__isnull=False).order_by('-estimated_gdp')[:5].values('name', 'estimated_gdp')
-        try:
-            generate_summary_image(total_countries=total_countries, top_5_countries=list(top_5), timestamp=timestamp)
-        except Exception:
-            logger.exception("Failed to generate summary image")
+        publish_snapshot(metadata.id)
+        bump_version(metadata.id)
+        schedule_summary_render()
+        schedule_flag_mirror()
 
     except Exception as exc:
         logger.exception("Error during processing refresh: %s", exc)
-        metadata.refresh_status = 'failed'
-        metadata.last_refreshed_at = timezone.now()
-        metadata.save()
+        recorder.finish('failed', last_refreshed_at=timezone.now())
+        bump_version()
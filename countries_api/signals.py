@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import services
+from .models import Country
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def republish_on_country_change(sender, **kwargs):
+    """
+    Keep the snapshot, response cache and status in step with single-row edits.
+
+    Refresh and bulk upsert write with bulk_create, which sends no signals,
+    and publish their changes themselves.
+    """
+    services.country_edited()
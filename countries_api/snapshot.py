@@ -0,0 +1,291 @@
+"""
+Columnar, memory-mapped snapshot of the countries table.
+
+After every refresh the table is written to disk as one NumPy array per
+numeric column plus small interned string tables, and a ``CURRENT`` pointer
+file is swapped atomically to publish it. Every worker memory-maps the arrays
+of the current snapshot so ``GET /countries`` can filter and sort without a
+database query; workers notice a new snapshot by the pointer file changing.
+
+Snapshots live on local disk (``BASE_DIR/cache/snapshots`` unless
+``COUNTRIES_SNAPSHOT_DIR`` is set) and are written by whichever process made
+the change. Every host serving the API must therefore see the same directory:
+with several hosts, point ``COUNTRIES_SNAPSHOT_DIR`` at shared storage, or a
+host keeps serving the last snapshot it wrote itself.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from .filters import SORT_OPTIONS, sort_countries
+from .models import Country
+
+logger = logging.getLogger(__name__)
+
+POINTER_NAME = 'CURRENT'
+DEFAULT_ORDER = 'default'
+
+# Columns stored as row-aligned string lists rather than interned tables
+STRING_COLUMNS = ['name', 'capital', 'flag_url']
+# Low-cardinality columns stored as int32 codes into an interned table
+INTERNED_COLUMNS = ['region', 'currency_code', 'last_refreshed_at']
+NUMERIC_COLUMNS = {
+    'id': np.int64,
+    'population': np.int64,
+    'exchange_rate': np.float64,
+    'estimated_gdp': np.float64,
+}
+
+_lock = threading.Lock()
+_loaded = None
+_loaded_key = None
+
+
+def get_snapshot_dir():
+    return getattr(
+        settings,
+        'COUNTRIES_SNAPSHOT_DIR',
+        os.path.join(settings.BASE_DIR, 'cache', 'snapshots'),
+    )
+
+
+def _intern(values):
+    """Return (codes, table) where table[codes[i]] == values[i] and None maps to -1."""
+    table = []
+    index = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(table)
+            table.append(value)
+        codes[i] = code
+    return codes, table
+
+
+def _read_consistent(fields):
+    """
+    Read the rows (ordered by id) and the id order of every sort option from one view of the table.
+
+    All reads share a transaction; on PostgreSQL it is REPEATABLE READ so a
+    concurrent refresh, upsert or delete cannot land between them. (SQLite
+    transactions and MySQL's default isolation already give that guarantee.)
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        rows = list(Country.objects.order_by('id').values_list(*fields))
+        orders = {
+            sort_param: list(sort_countries(Country.objects.all(), sort_param).values_list('id', flat=True))
+            for sort_param in [DEFAULT_ORDER] + SORT_OPTIONS
+        }
+    return rows, orders
+
+
+def _positions(ids, ordered_ids, sort_param):
+    """Map ids in sort order to row positions, refusing ids that are not among the rows"""
+    ordered = np.asarray(ordered_ids, dtype=np.int64)
+    positions = np.searchsorted(ids, ordered)
+    if ordered.size and (
+        not ids.size or positions.max() >= ids.size or not np.array_equal(ids[positions], ordered)
+    ):
+        raise ValueError(f"Sort order {sort_param!r} does not match the snapshot rows")
+    return positions.astype(np.int32)
+
+
+def write_snapshot(generation):
+    """
+    Dump the countries table into a new snapshot directory and publish it.
+
+    Sort permutations are taken from the database itself so the snapshot
+    orders rows exactly like the equivalent ORM query, collation included.
+    """
+    snapshot_dir = get_snapshot_dir()
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    fields = list(NUMERIC_COLUMNS) + STRING_COLUMNS + INTERNED_COLUMNS
+    rows, orders = _read_consistent(fields)
+    columns = dict(zip(fields, zip(*rows))) if rows else {field: () for field in fields}
+
+    ids = np.asarray(columns['id'], dtype=np.int64)
+    # Validate every order before anything is written
+    positions = {sort_param: _positions(ids, ordered_ids, sort_param) for sort_param, ordered_ids in orders.items()}
+
+    name = f"{generation}-{time.time_ns()}"
+    path = os.path.join(snapshot_dir, name)
+    os.makedirs(path)
+
+    for field, dtype in NUMERIC_COLUMNS.items():
+        values = [np.nan if value is None else value for value in columns[field]]
+        np.save(os.path.join(path, f'{field}.npy'), np.asarray(values, dtype=dtype))
+
+    for sort_param, order in positions.items():
+        np.save(os.path.join(path, f'order_{sort_param}.npy'), order)
+
+    tables = {}
+    datetime_field = serializers.DateTimeField()
+    for field in INTERNED_COLUMNS:
+        values = columns[field]
+        if field == 'last_refreshed_at':
+            values = [datetime_field.to_representation(value) for value in values]
+        codes, tables[field] = _intern(values)
+        np.save(os.path.join(path, f'{field}.npy'), codes)
+
+    with open(os.path.join(path, 'strings.json'), 'w', encoding='utf-8') as fh:
+        json.dump({
+            'generation': generation,
+            'count': len(rows),
+            'columns': {field: list(columns[field]) for field in STRING_COLUMNS},
+            'tables': tables,
+        }, fh)
+
+    pointer_tmp = os.path.join(snapshot_dir, f'{POINTER_NAME}.{name}.tmp')
+    with open(pointer_tmp, 'w') as fh:
+        fh.write(name)
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, POINTER_NAME))
+
+    _prune(snapshot_dir, keep={name})
+    return path
+
+
+def _prune(snapshot_dir, keep, retain=2):
+    """Remove old snapshot directories; workers that still map them keep their open files."""
+    candidates = sorted(
+        (entry for entry in os.scandir(snapshot_dir) if entry.is_dir() and entry.name not in keep),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in candidates[retain - len(keep):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class CountrySnapshot:
+    """
+    A loaded snapshot: memory-mapped columns plus the string tables.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'strings.json'), encoding='utf-8') as fh:
+            strings = json.load(fh)
+
+        self.generation = strings['generation']
+        self.count = strings['count']
+        self.strings = strings['columns']
+        self.tables = strings['tables']
+
+        self.columns = {
+            field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r')
+            for field in list(NUMERIC_COLUMNS) + INTERNED_COLUMNS
+        }
+        self.orders = {
+            sort_param: np.load(os.path.join(path, f'order_{sort_param}.npy'), mmap_mode='r')
+            for sort_param in [DEFAULT_ORDER] + SORT_OPTIONS
+        }
+
+        # Case-folded value -> codes, so filters match like __iexact
+        self._folded = {}
+        for field in ('region', 'currency_code'):
+            folded = {}
+            for code, value in enumerate(self.tables[field]):
+                folded.setdefault(value.lower(), []).append(code)
+            self._folded[field] = folded
+
+    def _mask(self, field, value):
+        codes = self._folded[field].get(value.lower(), [])
+        return np.isin(self.columns[field], codes)
+
+    def query(self, region=None, currency=None, sort_param=None):
+        """
+        Return row positions matching the filters, in the requested order.
+        """
+        order = self.orders.get(sort_param) if sort_param else None
+        if order is None:
+            order = self.orders[DEFAULT_ORDER]
+
+        mask = None
+        if region:
+            mask = self._mask('region', region)
+        if currency:
+            currency_mask = self._mask('currency_code', currency)
+            mask = currency_mask if mask is None else mask & currency_mask
+
+        if mask is None:
+            return np.asarray(order)
+        return order[mask[order]]
+
+    def seek(self, positions, after_id):
+        """
+        Return the positions that follow the row with id ``after_id``, or None
+        when that row is not part of the result (e.g. it has since been deleted).
+        """
+        match = np.flatnonzero(self.columns['id'][positions] == after_id)
+        if not match.size:
+            return None
+        return positions[match[0] + 1:]
+
+    def rows(self, positions, fields):
+        """
+        Build response dicts for the given row positions, in CountryListSerializer form.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        values = {}
+        for field in fields:
+            if field in NUMERIC_COLUMNS:
+                column = self.columns[field][positions]
+                if column.dtype.kind == 'f':
+                    values[field] = [None if value != value else value for value in column.tolist()]
+                else:
+                    values[field] = column.tolist()
+            elif field in INTERNED_COLUMNS:
+                table = self.tables[field]
+                values[field] = [table[code] if code >= 0 else None for code in self.columns[field][positions].tolist()]
+            else:
+                column = self.strings[field]
+                values[field] = [column[i] for i in positions.tolist()]
+
+        return [dict(zip(fields, row)) for row in zip(*(values[field] for field in fields))]
+
+
+def get_snapshot():
+    """
+    Return the current snapshot for this worker, reloading it when the pointer
+    file has been replaced. Returns None when no usable snapshot exists.
+    """
+    global _loaded, _loaded_key
+
+    pointer = os.path.join(get_snapshot_dir(), POINTER_NAME)
+    try:
+        stat = os.stat(pointer)
+    except OSError:
+        return None
+
+    key = (stat.st_ino, stat.st_mtime_ns)
+    if key == _loaded_key:
+        return _loaded
+
+    with _lock:
+        if key == _loaded_key:
+            return _loaded
+        try:
+            with open(pointer) as fh:
+                name = fh.read().strip()
+            snapshot = CountrySnapshot(os.path.join(get_snapshot_dir(), name))
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not load countries snapshot from %s", pointer)
+            return None
+        _loaded, _loaded_key = snapshot, key
+        return snapshot
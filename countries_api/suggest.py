@@ -0,0 +1,172 @@
+"""
+Per-worker prefix index for country name autocompletion.
+
+Names are normalised (accents stripped, case folded) and inserted into a
+trie once for the full name and once for every later word, so "kingdom"
+finds "United Kingdom". Each node keeps its best matches by population, so
+a prefix lookup is a walk of len(query) nodes. When the exact prefix matches
+nothing, a walk with a small edit budget tolerates typos.
+The index is rebuilt from the columnar snapshot whenever its generation
+changes, so suggestions never query the database.
+"""
+import re
+import threading
+import unicodedata
+
+from .snapshot import get_snapshot
+
+MAX_RESULTS = 10
+
+_lock = threading.Lock()
+# (snapshot path, SuggestIndex), swapped as one object
+_state = (None, None)
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """
+    Fold text for matching: strip accents, case fold and collapse punctuation to spaces
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', stripped.casefold()).strip()
+
+
+def max_typos(query):
+    """
+    Edits tolerated for a query; short prefixes are too ambiguous to correct
+    """
+    if len(query) < 4:
+        return 0
+    if len(query) < 8:
+        return 1
+    return 2
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        # Row positions of the best matches below this node, by population
+        self.top = []
+
+
+class SuggestIndex:
+    """
+    Prefix trie over country names ranked by population.
+    """
+
+    def __init__(self, names, populations):
+        self.root = _Node()
+        self.populations = populations
+        order = sorted(range(len(names)), key=lambda i: populations[i], reverse=True)
+        for position in order:
+            normalized = normalize(names[position])
+            words = normalized.split(' ')
+            keys = {' '.join(words[i:]) for i in range(len(words))}
+            for key in keys:
+                self._insert(key, position)
+
+    def _insert(self, key, position):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+            # Rows arrive by descending population, so the first ones are the best
+            if len(node.top) < MAX_RESULTS and position not in node.top:
+                node.top.append(position)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Return up to ``limit`` row positions matching ``query``
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        results = []
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                break
+        else:
+            results = list(node.top[:limit])
+
+        # Widen the edit budget one step at a time; most typos are a single edit
+        distance = 1
+        while not results and distance <= max_typos(query):
+            results = self._fuzzy(query, distance)[:limit]
+            distance += 1
+        return results
+
+    def _fuzzy(self, query, max_distance):
+        """
+        Positions whose indexed prefix is within ``max_distance`` edits
+        (insert, delete, substitute, transpose) of ``query``, closest first,
+        then by population
+        """
+        best = {}
+        seen = set()
+        stack = [(self.root, 0, max_distance)]
+        while stack:
+            node, i, budget = stack.pop()
+            state = (id(node), i, budget)
+            if state in seen:
+                continue
+            seen.add(state)
+
+            if i == len(query):
+                distance = max_distance - budget
+                for position in node.top:
+                    if distance < best.get(position, max_distance + 1):
+                        best[position] = distance
+                continue
+
+            char = query[i]
+            child = node.children.get(char)
+            if child is not None:
+                stack.append((child, i + 1, budget))
+            if not budget:
+                continue
+
+            # Deletion: the query has an extra character
+            stack.append((node, i + 1, budget - 1))
+            for other, other_child in node.children.items():
+                if other != char:
+                    # Substitution
+                    stack.append((other_child, i + 1, budget - 1))
+                # Insertion: the query is missing a character
+                stack.append((other_child, i, budget - 1))
+            # Transposition of the next two characters
+            if i + 1 < len(query):
+                swapped = node.children.get(query[i + 1])
+                swapped = swapped.children.get(char) if swapped is not None else None
+                if swapped is not None:
+                    stack.append((swapped, i + 2, budget - 1))
+
+        return sorted(best, key=lambda position: (best[position], -self.populations[position]))
+
+
+def get_index():
+    """
+    Return (snapshot, index) for this worker, rebuilding the index when a new snapshot is published
+    """
+    global _state
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None, None
+
+    path, index = _state
+    if path == snapshot.path:
+        return snapshot, index
+
+    with _lock:
+        path, index = _state
+        if path != snapshot.path:
+            populations = snapshot.columns['population'].tolist()
+            index = SuggestIndex(snapshot.strings['name'], populations)
+            _state = (snapshot.path, index)
+        return snapshot, index
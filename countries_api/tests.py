@@ -1,3 +1,968 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from . import flags, image_delivery, rates, services, snapshot, utils
+from .filters import filter_countries, iexact
+from .management.commands import benchmark_refresh
+from .models import Country, ExchangeRate, RefreshMetadata
+from .serializers import CountrySerializer
+from .utils import ExternalAPIError
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'countries-tests'}
+}
+
+UPSTREAM_COUNTRIES = [
+    {'name': 'Nigeria', 'capital': 'Abuja', 'region': 'Africa', 'population': 200,
+     'flag': 'https://flagcdn.com/ng.svg', 'currencies': [{'code': 'NGN'}]},
+    {'name': 'Ghana', 'capital': 'Accra', 'region': 'Africa', 'population': 30,
+     'flag': 'https://flagcdn.com/gh.svg', 'currencies': [{'code': 'GHS'}]},
+    {'name': 'France', 'capital': 'Paris', 'region': 'Europe', 'population': 60,
+     'flag': 'https://flagcdn.com/fr.svg', 'currencies': [{'code': 'EUR'}]},
+]
+UPSTREAM_RATES = {'USD': 1.0, 'NGN': 1600.0, 'GHS': 12.0, 'EUR': 0.9}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COUNTRIES_BACKGROUND_JOBS=False)
+class EndpointTestCase(TestCase):
+    """
+    Endpoint tests with an empty response cache and private cache directories
+    """
+
+    def setUp(self):
+        cache.clear()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        settings_override = override_settings(
+            COUNTRIES_CACHE_DIR=self.cache_dir,
+            COUNTRIES_SNAPSHOT_DIR=os.path.join(self.cache_dir, 'snapshots'),
+            COUNTRIES_FLAG_DIR=os.path.join(self.cache_dir, 'flags'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # A new directory may reuse the previous pointer file's inode and mtime
+        snapshot._loaded = snapshot._loaded_key = None
+        # Per-worker state keyed by a data version a cleared cache can hand out again
+        rates._matrix = rates._matrix_version = None
+        flags._manifest = flags._manifest_key = None
+
+    def refresh(self, countries=UPSTREAM_COUNTRIES, rates=UPSTREAM_RATES):
+        """
+        Run a refresh against the given upstream payloads and return its RefreshMetadata
+        """
+        def fetch(payload, size):
+            def fetch(stats=None):
+                stats['bytes_downloaded'] += size
+                return payload
+            return fetch
+
+        metadata = RefreshMetadata.objects.create(refresh_status='in_progress')
+        with mock.patch.object(services, 'fetch_countries_data', fetch(countries, 1000)), \
+                mock.patch.object(services, 'fetch_exchange_rates', fetch(rates, 100)), \
+                self.captureOnCommitCallbacks(execute=True):
+            services.refresh_countries_background(metadata.id)
+        metadata.refresh_from_db()
+        return metadata
+
+
+class CaseInsensitiveLookupPlanTests(TestCase):
+    """
+    Case-insensitive lookups must be answered from the LOWER() functional indexes
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Country.objects.bulk_create([
+            Country(name=f'Country {i}', region=['Africa', 'Europe', 'Asia'][i % 3],
+                    currency_code=['NGN', 'EUR', 'JPY'][i % 3], population=i)
+            for i in range(300)
+        ])
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Tiny tables are cheaper to scan; force the planner to show index usage
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_region_filter_uses_index(self):
+        queryset = filter_countries(Country.objects.all(), region='africa')
+        self.assertUsesIndex(queryset, 'countries_region_lower_idx')
+        self.assertEqual(queryset.count(), 100)
+
+    def test_currency_filter_uses_index(self):
+        queryset = filter_countries(Country.objects.all(), currency='ngn')
+        self.assertUsesIndex(queryset, 'countries_currency_lower_idx')
+        self.assertEqual(queryset.count(), 100)
+
+    def test_name_lookup_uses_index(self):
+        queryset = Country.objects.filter(**iexact('name', 'COUNTRY 7'))
+        self.assertUsesIndex(queryset, 'countries_name_lower_idx')
+        self.assertEqual(queryset.get().name, 'Country 7')
+
+    def test_lower_lookup_is_scoped_to_indexed_fields(self):
+        with self.assertRaises(FieldError):
+            Country.objects.filter(capital__lower='abuja').exists()
+
+
+class CountrySerializerTests(TestCase):
+
+    def setUp(self):
+        self.country = Country.objects.create(name='Ghana', population=100)
+
+    def test_full_update_requires_population(self):
+        serializer = CountrySerializer(self.country, data={'name': 'Ghana'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('population', serializer.errors)
+
+
+class CountryPaginationTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Country.objects.bulk_create([
+            Country(name=f'Country {i}', region='Africa', currency_code='NGN',
+                    population=i * 1000, estimated_gdp=float(10 - i))
+            for i in range(1, 6)
+        ])
+
+    def names(self, sort, limit=2):
+        names = []
+        params = {'sort': sort, 'limit': limit}
+        while True:
+            response = self.client.get('/countries', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            names += [row['name'] for row in response.json()['results']]
+            if response.json()['next_cursor'] is None:
+                return names
+            params['cursor'] = response.json()['next_cursor']
+
+    def first_cursor(self, sort):
+        return self.client.get('/countries', {'sort': sort, 'limit': 2}).json()['next_cursor']
+
+    def assertCursorRejected(self, params):
+        response = self.client.get('/countries', params)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Validation failed')
+        self.assertIn('cursor', response.json()['details'])
+
+    def test_pages_cover_every_row_in_order(self):
+        self.assertEqual(self.names('population_desc'), [f'Country {i}' for i in range(5, 0, -1)])
+
+    def test_pages_from_the_snapshot_cover_every_row_in_order(self):
+        services.publish_snapshot()
+        self.assertIsNotNone(snapshot.get_snapshot())
+        self.assertEqual(self.names('population_asc'), [f'Country {i}' for i in range(1, 6)])
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        cursor = self.first_cursor('name_asc')
+        self.assertCursorRejected({'sort': 'population_desc', 'limit': 2, 'cursor': cursor})
+
+    def test_cursor_from_another_sort_is_rejected_on_the_snapshot(self):
+        services.publish_snapshot()
+        cursor = self.first_cursor('gdp_desc')
+        self.assertCursorRejected({'sort': 'gdp_asc', 'limit': 2, 'cursor': cursor})
+        self.assertCursorRejected({'limit': 2, 'cursor': cursor})
+
+    def test_malformed_cursor_is_rejected(self):
+        self.assertCursorRejected({'limit': 2, 'cursor': 'not-a-cursor'})
+
+
+class CountrySnapshotTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Country.objects.bulk_create([
+            Country(name='Nigeria', region='Africa', currency_code='NGN', population=200, estimated_gdp=5.0),
+            Country(name='Ghana', region='Africa', currency_code='GHS', population=30, estimated_gdp=2.0),
+            Country(name='France', region='Europe', currency_code='EUR', population=60, estimated_gdp=9.0),
+        ])
+
+    def get(self, **params):
+        response = self.client.get('/countries', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def population(self, name):
+        return next(row['population'] for row in self.get() if row['name'] == name)
+
+    def test_reads_come_from_the_published_snapshot(self):
+        services.publish_snapshot()
+        # A write that bypasses the model signals is not visible until the next publish
+        Country.objects.filter(name='Ghana').update(population=31)
+        self.assertEqual(self.population('Ghana'), 30)
+
+    def test_snapshot_answers_like_the_database(self):
+        queries = [
+            {'region': 'AFRICA', 'sort': 'population_asc'},
+            {'currency': 'eur'},
+            {'sort': 'gdp_desc', 'fields': 'name,estimated_gdp'},
+            {'sort': 'name_desc', 'limit': 2},
+        ]
+        expected = [self.get(**params) for params in queries]
+        services.publish_snapshot()
+        cache.clear()
+        self.assertIsNotNone(snapshot.get_snapshot())
+        self.assertEqual([self.get(**params) for params in queries], expected)
+
+    def test_model_save_republishes_snapshot_and_cache(self):
+        services.publish_snapshot()
+        self.assertEqual(self.population('Ghana'), 30)
+        country = Country.objects.get(name='Ghana')
+        country.population = 31
+        with self.captureOnCommitCallbacks(execute=True):
+            country.save()
+        self.assertEqual(self.population('Ghana'), 31)
+
+    def test_model_delete_republishes_snapshot_and_cache(self):
+        services.publish_snapshot()
+        self.assertEqual(len(self.get()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Country.objects.filter(region='Africa').delete()
+        self.assertEqual([row['name'] for row in self.get()], ['France'])
+
+    def test_transaction_republishes_once(self):
+        with mock.patch.object(services, 'publish_changes') as publish_changes:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for country in Country.objects.all():
+                        country.population += 1
+                        country.save()
+        publish_changes.assert_called_once_with()
+
+
+class CountryBulkUpsertTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ghana = Country.objects.create(name='Ghana', population=100, exchange_rate=10.0, estimated_gdp=15000.0)
+
+    def post(self, *countries):
+        return self.client.post('/countries/bulk', {'countries': list(countries)}, content_type='application/json')
+
+    def test_creates_and_updates_by_case_insensitive_name(self):
+        response = self.post(
+            {'name': 'GHANA', 'population': 200},
+            {'name': 'Togo', 'population': 50, 'exchange_rate': 500.0},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'created': 1, 'updated': 1, 'failed': 0, 'errors': []})
+        self.assertEqual(sorted(Country.objects.values_list('name', flat=True)), ['Ghana', 'Togo'])
+        self.assertIsNotNone(Country.objects.get(name='Togo').estimated_gdp)
+
+    def test_population_change_recomputes_estimated_gdp(self):
+        self.post({'name': 'Ghana', 'population': 200})
+        self.ghana.refresh_from_db()
+        # population * multiplier (1000-2000) / exchange rate
+        self.assertTrue(20000 <= self.ghana.estimated_gdp <= 40000, self.ghana.estimated_gdp)
+
+    def test_unchanged_population_keeps_estimated_gdp(self):
+        self.post({'name': 'Ghana', 'population': 100, 'capital': 'Accra'})
+        self.ghana.refresh_from_db()
+        self.assertEqual(self.ghana.capital, 'Accra')
+        self.assertEqual(self.ghana.estimated_gdp, 15000.0)
+
+    def test_supplied_estimated_gdp_wins(self):
+        self.post({'name': 'Ghana', 'population': 200, 'estimated_gdp': 1.0})
+        self.ghana.refresh_from_db()
+        self.assertEqual(self.ghana.estimated_gdp, 1.0)
+
+    def test_invalid_rows_are_reported_without_aborting_the_batch(self):
+        response = self.post(
+            {'name': 'Togo', 'population': -1},
+            {'name': 'Benin', 'population': 10},
+            {'name': 'benin', 'population': 11},
+        )
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (1, 2))
+        self.assertEqual([error['index'] for error in body['errors']], [0, 2])
+        self.assertIn('population', body['errors'][0]['details'])
+
+
+class RefreshProgressTests(EndpointTestCase):
+
+    def test_reports_stages_and_row_counts(self):
+        metadata = self.refresh()
+        response = self.client.get(f'/countries/refresh/{metadata.id}')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['refresh_status'], 'success')
+        self.assertEqual(
+            list(body['stage_timings']),
+            ['fetching_countries', 'fetching_rates', 'processing', 'publishing'],
+        )
+        self.assertEqual(body['bytes_downloaded'], 1100)
+        self.assertEqual((body['rows_created'], body['rows_updated'], body['rows_unchanged']), (3, 0, 0))
+        self.assertEqual(body['total_countries'], 3)
+        self.assertIsNotNone(body['finished_at'])
+
+    def test_second_refresh_counts_unchanged_and_updated_rows(self):
+        self.refresh()
+        countries = [dict(UPSTREAM_COUNTRIES[0], population=201), *UPSTREAM_COUNTRIES[1:]]
+        metadata = self.refresh(countries)
+        body = self.client.get(f'/countries/refresh/{metadata.id}').json()
+        self.assertEqual((body['rows_created'], body['rows_updated'], body['rows_unchanged']), (0, 1, 2))
+
+    def test_failed_upstream_is_reported(self):
+        metadata = RefreshMetadata.objects.create(refresh_status='in_progress')
+        with mock.patch.object(services, 'fetch_countries_data', side_effect=ExternalAPIError('down')), \
+                self.captureOnCommitCallbacks(execute=True):
+            services.refresh_countries_background(metadata.id)
+        body = self.client.get(f'/countries/refresh/{metadata.id}').json()
+        self.assertEqual(body['refresh_status'], 'failed')
+        self.assertEqual(list(body['stage_timings']), ['fetching_countries'])
+
+    def test_unknown_refresh_is_404(self):
+        response = self.client.get('/countries/refresh/999')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Refresh not found'})
+
+
+class RefreshPublishTests(EndpointTestCase):
+
+    def names_and_populations(self):
+        return {row['name']: row['population'] for row in self.client.get('/countries').json()}
+
+    def test_successful_refresh_becomes_the_current_generation(self):
+        first = self.refresh()
+        self.assertEqual(services.current_generation(), first.id)
+        second = self.refresh([dict(UPSTREAM_COUNTRIES[0], population=201)])
+        self.assertEqual(services.current_generation(), second.id)
+        self.assertEqual(self.names_and_populations()['Nigeria'], 201)
+
+    def test_failed_publish_leaves_the_previous_refresh_in_place(self):
+        first = self.refresh()
+        countries = [dict(country, population=1) for country in UPSTREAM_COUNTRIES]
+        with mock.patch.object(services, 'rebuild_aggregates', side_effect=RuntimeError('boom')):
+            failed = self.refresh(countries)
+
+        self.assertEqual(failed.refresh_status, 'failed')
+        self.assertEqual(services.current_generation(), first.id)
+        self.assertEqual(self.names_and_populations(), {'Nigeria': 200, 'Ghana': 30, 'France': 60})
+        self.assertFalse(failed.exchange_rates.exists())
+        status = self.client.get('/status').json()
+        self.assertEqual((status['refresh_id'], status['refresh_status']), (failed.id, 'failed'))
+        self.assertEqual(status['last_refreshed_at'], first.last_refreshed_at.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        self.assertEqual(status['total_countries'], 3)
+
+
+class ResponseCacheTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.refresh()
+
+    def stats(self):
+        return self.client.get('/status/cache').json()
+
+    def test_repeated_query_is_a_hit_without_queries(self):
+        first = self.client.get('/countries', {'region': 'Africa', 'sort': 'name_asc'}).json()
+        with self.assertNumQueries(0):
+            second = self.client.get('/countries', {'sort': 'name_asc', 'region': 'AFRICA'}).json()
+        self.assertEqual(first, second)
+        stats = self.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_country_detail_is_cached_case_insensitively(self):
+        self.assertEqual(self.client.get('/countries/ghana').json()['capital'], 'Accra')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/countries/GHANA').json()['capital'], 'Accra')
+
+    def test_refresh_invalidates_cached_responses(self):
+        version = self.stats()['data_version']
+        self.assertEqual(self.client.get('/countries/nigeria').json()['population'], 200)
+        self.refresh([dict(UPSTREAM_COUNTRIES[0], population=201)])
+        self.assertNotEqual(self.stats()['data_version'], version)
+        self.assertEqual(self.client.get('/countries/nigeria').json()['population'], 201)
+
+    def test_delete_invalidates_cached_responses(self):
+        self.assertEqual(len(self.client.get('/countries').json()), 3)
+        self.assertEqual(self.client.get('/countries/ghana').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete('/countries/GHANA').status_code, 204)
+        self.assertEqual(len(self.client.get('/countries').json()), 2)
+        self.assertEqual(self.client.get('/countries/ghana').status_code, 404)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/countries/atlantis').status_code, 404)
+        Country.objects.create(name='Atlantis', population=1)
+        self.assertEqual(self.client.get('/countries/atlantis').status_code, 200)
+
+
+class AggregateTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Country.objects.bulk_create([
+            Country(name='Nigeria', region='Africa', currency_code='NGN', population=200, exchange_rate=1600.0, estimated_gdp=300.0),
+            Country(name='Ghana', region='Africa', currency_code='GHS', population=30, exchange_rate=12.0, estimated_gdp=4000.0),
+            Country(name='France', region='Europe', currency_code='EUR', population=60, exchange_rate=0.9, estimated_gdp=100000.0),
+            Country(name='Nowhere', region='Europe', currency_code=None, population=5),
+        ])
+        services.rebuild_aggregates()
+
+    def get(self, by):
+        response = self.client.get('/countries/aggregates', {'by': by})
+        self.assertEqual(response.status_code, 200)
+        return {row['key']: row for row in response.json()}
+
+    def test_groups_by_region(self):
+        africa = self.get('region')['Africa']
+        self.assertEqual((africa['country_count'], africa['total_population']), (2, 230))
+        self.assertEqual(africa['total_estimated_gdp'], 4300.0)
+        self.assertEqual((africa['rate_min'], africa['rate_max'], africa['rate_mean']), (12.0, 1600.0, 806.0))
+
+    def test_groups_without_a_currency_under_null(self):
+        groups = self.get('currency')
+        self.assertEqual(set(groups), {None, 'EUR', 'GHS', 'NGN'})
+        self.assertEqual(groups[None]['country_count'], 1)
+        self.assertIsNone(groups[None]['rate_mean'])
+
+    def test_refresh_rebuilds_the_aggregates(self):
+        self.refresh()
+        europe = self.get('region')['Europe']
+        self.assertEqual((europe['country_count'], europe['total_population']), (2, 65))
+        self.assertEqual(self.get('currency')['NGN']['rate_mean'], 1600.0)
+
+    def test_requires_a_known_dimension(self):
+        response = self.client.get('/countries/aggregates', {'by': 'capital'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('by', response.json()['details'])
+
+
+class CurrencyConversionTests(EndpointTestCase):
+
+    def convert(self, conversions):
+        return self.client.post('/currency/convert', {'conversions': conversions}, content_type='application/json')
+
+    def test_converts_through_the_refreshed_rates(self):
+        metadata = self.refresh()
+        response = self.convert([[10, 'usd', 'NGN'], [1600, 'NGN', 'EUR'], [12, 'GHS', 'GHS']])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['errors'], [])
+        self.assertEqual(body['rates_refresh_id'], metadata.id)
+        for value, expected in zip(body['results'], [16000.0, 0.9, 12.0]):
+            self.assertAlmostEqual(value, expected)
+
+    def test_bad_items_are_reported_by_index(self):
+        self.refresh()
+        body = self.convert([[1, 'XYZ', 'USD'], ['1', 'USD', 'EUR'], [True, 'USD', 'EUR'], [2, 'USD', 'USD']]).json()
+        self.assertEqual(body['results'], [None, None, None, 2.0])
+        self.assertEqual(body['errors'], [
+            {'index': 0, 'error': 'unknown currency'},
+            {'index': 1, 'error': 'expected [amount, from, to]'},
+            {'index': 2, 'error': 'expected [amount, from, to]'},
+        ])
+
+    def test_uses_the_rates_of_the_latest_refresh(self):
+        self.refresh()
+        self.assertAlmostEqual(self.convert([[1, 'USD', 'NGN']]).json()['results'][0], 1600.0)
+        self.refresh(rates={**UPSTREAM_RATES, 'NGN': 1500.0})
+        self.assertAlmostEqual(self.convert([[1, 'USD', 'NGN']]).json()['results'][0], 1500.0)
+
+    def test_without_rates_is_unavailable(self):
+        response = self.convert([[1, 'USD', 'NGN']])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['error'], 'Exchange rates unavailable')
+
+    def test_requires_a_list(self):
+        response = self.client.post('/currency/convert', {'conversions': 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('conversions', response.json()['details'])
+
+
+class RateHistoryTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for recorded_at, rate in (
+            (datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc), 1500.0),
+            (datetime(2026, 1, 1, 14, tzinfo=dt_timezone.utc), 1600.0),
+            (datetime(2026, 1, 2, 9, tzinfo=dt_timezone.utc), 1700.0),
+        ):
+            refresh = RefreshMetadata.objects.create(last_refreshed_at=recorded_at)
+            ExchangeRate.objects.create(refresh=refresh, currency_code='NGN', rate=rate, recorded_at=recorded_at)
+            ExchangeRate.objects.create(refresh=refresh, currency_code='EUR', rate=0.9, recorded_at=recorded_at)
+
+    def history(self, code='NGN', **params):
+        response = self.client.get(f'/currency/{code}/history', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_raw_points_in_time_order(self):
+        body = self.history('ngn')
+        self.assertEqual((body['currency'], body['resolution']), ('NGN', 'raw'))
+        self.assertEqual([point['rate'] for point in body['points']], [1500.0, 1600.0, 1700.0])
+        self.assertEqual(body['points'][0]['timestamp'], '2026-01-01T10:00:00Z')
+
+    def test_range_bounds_include_whole_days(self):
+        self.assertEqual(len(self.history(**{'from': '2026-01-02'})['points']), 1)
+        self.assertEqual(len(self.history(to='2026-01-01')['points']), 2)
+        self.assertEqual(len(self.history(**{'from': '2026-01-01T12:00:00Z', 'to': '2026-01-01'})['points']), 1)
+
+    def test_daily_resolution_downsamples(self):
+        points = self.history(resolution='day')['points']
+        self.assertEqual(len(points), 2)
+        self.assertEqual(
+            (points[0]['rate'], points[0]['rate_min'], points[0]['rate_max'], points[0]['samples']),
+            (1550.0, 1500.0, 1600.0, 2),
+        )
+        self.assertEqual(points[1]['samples'], 1)
+
+    def test_unknown_currency_has_no_points(self):
+        self.assertEqual(self.history('XYZ')['points'], [])
+
+    def test_invalid_parameters_are_rejected(self):
+        response = self.client.get('/currency/NGN/history', {'from': 'yesterday', 'resolution': 'year'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['details']), {'from', 'resolution'})
+
+
+class SuggestTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Country.objects.bulk_create([
+            Country(name='Nigeria', region='Africa', population=206),
+            Country(name='Niger', region='Africa', population=24),
+            Country(name="Côte d'Ivoire", region='Africa', population=26),
+            Country(name='United Kingdom', region='Europe', population=67),
+            Country(name='United States of America', region='Americas', population=331),
+        ])
+        services.publish_snapshot()
+
+    def suggest(self, q, **params):
+        response = self.client.get('/countries/suggest', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['name'] for row in response.json()]
+
+    def test_prefix_matches_rank_by_population(self):
+        self.assertEqual(self.suggest('ni'), ['Nigeria', 'Niger'])
+        self.assertEqual(self.suggest('uni', limit=1), ['United States of America'])
+
+    def test_matches_later_words_accents_and_typos(self):
+        self.assertEqual(self.suggest('kingd'), ['United Kingdom'])
+        self.assertEqual(self.suggest('cote'), ["Côte d'Ivoire"])
+        self.assertEqual(self.suggest('nigera')[0], 'Nigeria')
+
+    def test_returns_the_suggestion_fields(self):
+        response = self.client.get('/countries/suggest', {'q': 'niger'})
+        self.assertEqual(set(response.json()[0]), {'id', 'name', 'region', 'population', 'flag_url'})
+
+    def test_follows_the_published_snapshot(self):
+        Country.objects.bulk_create([Country(name='Nicaragua', population=500)])
+        self.assertNotIn('Nicaragua', self.suggest('nic'))
+        services.publish_snapshot()
+        self.assertEqual(self.suggest('nic'), ['Nicaragua'])
+
+    def test_limit_is_validated(self):
+        response = self.client.get('/countries/suggest', {'q': 'ni', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit', response.json()['details'])
+
+    def test_without_a_snapshot_is_unavailable(self):
+        snapshot._loaded = snapshot._loaded_key = None
+        with override_settings(COUNTRIES_SNAPSHOT_DIR=os.path.join(self.cache_dir, 'none')):
+            self.assertEqual(self.client.get('/countries/suggest', {'q': 'ni'}).status_code, 503)
+
+
+class SummaryImageTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metadata = self.refresh()
+
+    def get_image(self, **params):
+        response = self.client.get('/countries/image', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def summary_files(self):
+        return sorted(name for name in os.listdir(self.cache_dir) if name.startswith('summary-'))
+
+    def test_missing_before_the_first_render(self):
+        response = self.client.get('/countries/image')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Summary image not found'})
+
+    def test_refresh_queues_a_render(self):
+        with mock.patch.object(services, 'schedule_summary_render') as schedule:
+            self.refresh()
+        schedule.assert_called_once_with()
+
+    def test_render_is_versioned_by_generation(self):
+        services.render_summary_image()
+        metadata = utils.get_summary_image_metadata()
+        self.assertEqual(metadata['generation'], self.metadata.id)
+        self.assertTrue(metadata['version'].startswith(f'{self.metadata.id}.'))
+        response, body = self.get_image()
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(body)).size, (800, 600))
+
+    def test_variants_are_derived_once_and_reused(self):
+        services.render_summary_image()
+        response, body = self.get_image(type='webp', width=200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(Image.open(io.BytesIO(body)).width, 200)
+        variants = self.summary_files()
+        self.assertEqual(len(variants), 2)
+        with mock.patch.object(Image, 'open', side_effect=AssertionError('variant re-derived')):
+            self.get_image(type='webp', width=200)
+
+    def test_only_the_current_and_previous_versions_are_kept(self):
+        versions = []
+        for _ in range(3):
+            services.render_summary_image()
+            versions.append(utils.get_summary_image_metadata()['version'])
+            time.sleep(0.002)
+        self.assertEqual(self.summary_files(), sorted(f'summary-{version}.png' for version in versions[1:]))
+
+    def test_invalid_type_and_width_are_rejected(self):
+        response = self.client.get('/countries/image', {'type': 'gif', 'width': 300})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['details']), {'type', 'width'})
+
+
+def clear_image_memory():
+    image_delivery._memory.clear()
+    image_delivery._memory_size = 0
+
+
+class ImageMemoryCacheTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        clear_image_memory()
+        self.addCleanup(clear_image_memory)
+
+    def write(self, name, size):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fh:
+            fh.write(b'x' * size)
+        return path
+
+    @override_settings(COUNTRIES_IMAGE_MEMORY_BYTES=250)
+    def test_least_recently_used_images_are_evicted(self):
+        first, second, third = (self.write(name, 100) for name in ('a.png', 'b.png', 'c.png'))
+        image_delivery._cached_bytes(first)
+        image_delivery._cached_bytes(second)
+        image_delivery._cached_bytes(first)
+        image_delivery._cached_bytes(third)
+        self.assertEqual(list(image_delivery._memory), [first, third])
+        self.assertEqual(image_delivery._memory_size, 200)
+
+    def test_rewritten_file_replaces_its_entry(self):
+        path = self.write('a.png', 100)
+        image_delivery._cached_bytes(path)
+        self.write('a.png', 10)
+        os.utime(path, ns=(1, 1))
+        self.assertEqual(image_delivery._cached_bytes(path), b'x' * 10)
+        self.assertEqual(image_delivery._memory_size, 10)
+
+
+class SummaryImageDeliveryTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.refresh()
+        services.render_summary_image()
+        self.version = utils.get_summary_image_metadata()['version']
+
+    def test_etag_revalidates_with_304(self):
+        response = self.client.get('/countries/image', {'type': 'webp'})
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response['Last-Modified'])
+        revalidated = self.client.get('/countries/image', {'type': 'webp'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_each_variant_has_its_own_etag(self):
+        png = self.client.get('/countries/image')['ETag']
+        webp = self.client.get('/countries/image', {'type': 'webp'})['ETag']
+        self.assertNotEqual(png, webp)
+        self.assertEqual(self.client.get('/countries/image', {'type': 'webp'}, HTTP_IF_NONE_MATCH=png).status_code, 200)
+
+    def test_new_render_invalidates_the_etag(self):
+        etag = self.client.get('/countries/image')['ETag']
+        time.sleep(0.002)
+        services.render_summary_image()
+        self.assertEqual(self.client.get('/countries/image', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_versioned_url_is_immutable(self):
+        response = self.client.get('/countries/image', {'width': 400})
+        self.assertEqual(response['Content-Location'], f'/countries/image?width=400&v={self.version}')
+        versioned = self.client.get(response['Content-Location'])
+        self.assertIn('immutable', versioned['Cache-Control'])
+        self.assertIn('max-age=31536000', versioned['Cache-Control'])
+        stale = self.client.get('/countries/image', {'v': 'old'})
+        self.assertIn('no-cache', stale['Cache-Control'])
+
+    @override_settings(COUNTRIES_IMAGE_DELIVERY='x-accel-redirect', COUNTRIES_IMAGE_ACCEL_PREFIX='/protected/cache/')
+    def test_x_accel_redirect_hands_the_file_to_nginx(self):
+        response = self.client.get('/countries/image')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/cache/summary-{self.version}.png')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(COUNTRIES_IMAGE_DELIVERY='x-sendfile')
+    def test_x_sendfile_hands_the_file_to_the_server(self):
+        response = self.client.get('/countries/image')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.cache_dir, f'summary-{self.version}.png'))
+
+    @override_settings(COUNTRIES_IMAGE_DELIVERY='memory')
+    def test_memory_delivery_sends_the_bytes(self):
+        self.addCleanup(clear_image_memory)
+        response = self.client.get('/countries/image')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+
+
+def png_bytes(size=(320, 160), color=(200, 0, 0)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class FakeFlagResponse:
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+
+class FlagMirrorTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Country.objects.create(name='Nigeria', population=1, flag_url='https://flagcdn.com/ng.svg')
+        self.requests = []
+        self.flag, self.etag = png_bytes(), '"v1"'
+
+    def fake_get(self, url, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        if 'zz' in url:
+            return FakeFlagResponse(500)
+        if (headers or {}).get('If-None-Match') == self.etag:
+            return FakeFlagResponse(304)
+        return FakeFlagResponse(200, self.flag, {'ETag': self.etag})
+
+    def mirror(self, *urls):
+        with mock.patch('requests.Session.get', self.fake_get):
+            return flags.mirror_flags(list(urls) or ['https://flagcdn.com/ng.svg'])
+
+    def test_downloads_raster_renditions_and_revalidates(self):
+        stats = self.mirror('https://flagcdn.com/ng.svg', 'https://flagcdn.com/zz.svg', 'https://example.com/x.svg')
+        self.assertEqual(stats, {'fetched': 1, 'unchanged': 0, 'failed': 1})
+        self.assertEqual(self.requests[0], ('https://flagcdn.com/w320/ng.png', {}))
+
+        self.requests.clear()
+        self.assertEqual(self.mirror(), {'fetched': 0, 'unchanged': 1, 'failed': 0})
+        self.assertEqual(self.requests[0][1], {'If-None-Match': '"v1"'})
+
+    def test_serves_thumbnails_by_type_and_width(self):
+        self.mirror()
+        response = self.client.get('/countries/NIGERIA/flag', {'type': 'webp', 'width': 80})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(Image.open(io.BytesIO(b''.join(response.streaming_content))).size, (80, 40))
+        versioned = self.client.get(response['Content-Location'])
+        self.assertIn('immutable', versioned['Cache-Control'])
+        self.assertEqual(
+            self.client.get('/countries/nigeria/flag', {'type': 'webp', 'width': 80}, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            304,
+        )
+
+    def test_changed_flag_replaces_the_old_thumbnails(self):
+        self.mirror()
+        old = set(os.listdir(flags.get_flag_dir()))
+        self.flag, self.etag = png_bytes(color=(0, 200, 0)), '"v2"'
+        self.assertEqual(self.mirror(), {'fetched': 1, 'unchanged': 0, 'failed': 0})
+        new = set(os.listdir(flags.get_flag_dir()))
+        self.assertEqual(len(new), len(old))
+        self.assertEqual(old & new, {flags.MANIFEST_NAME})
+
+    def test_missing_flags_and_bad_parameters(self):
+        self.assertEqual(self.client.get('/countries/nigeria/flag').status_code, 404)
+        self.assertEqual(self.client.get('/countries/atlantis/flag').status_code, 404)
+        response = self.client.get('/countries/nigeria/flag', {'width': 7, 'type': 'gif'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['details']), {'type', 'width'})
+
+
+class BenchmarkRefreshTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = benchmark_refresh._StubUpstream()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_synthetic_payload_looks_like_rest_countries(self):
+        countries, codes = benchmark_refresh.synthetic_countries(50, random.Random(0))
+        self.assertEqual(len({country['name'] for country in countries}), 50)
+        self.assertEqual(len(codes), benchmark_refresh.CURRENCY_COUNT)
+        self.assertTrue(all(
+            currency['code'] in codes for country in countries for currency in country['currencies']
+        ))
+
+    def test_replicated_payload_keeps_names_unique(self):
+        countries = benchmark_refresh.replicate([{'name': 'Ghana'}, {'name': 'Togo'}], 5)
+        self.assertEqual([country['name'] for country in countries], ['Ghana', 'Togo', 'Ghana 1', 'Togo 1', 'Ghana 2'])
+
+    def test_measures_the_insert_unchanged_and_update_paths(self):
+        countries, codes = benchmark_refresh.synthetic_countries(20, random.Random(0))
+        rates = {code: 2.0 for code in codes}
+        with override_settings(
+            COUNTRIES_API_URL=f'{self.server.base_url}/countries',
+            EXCHANGE_RATES_API_URL=f'{self.server.base_url}/rates',
+        ):
+            results = benchmark_refresh.Command(stderr=io.StringIO())._benchmark_size(self.server, countries, rates, 500)
+
+        self.assertEqual([result['scenario'] for result in results], ['insert', 'same_payload', 'rates_changed'])
+        self.assertTrue(all(result['status'] == 'success' and result['queries'] > 0 for result in results))
+        self.assertGreater(results[0]['bytes_downloaded'], 0)
+        with_rate = sum(1 for country in countries if country['currencies'])
+        self.assertEqual(
+            [(result['rows_created'], result['rows_updated'], result['rows_unchanged']) for result in results],
+            [(20, 0, 0), (0, 0, 20), (0, with_rate, 20 - with_rate)],
+        )
+
+    def test_recorded_payload_must_be_a_list(self):
+        path = os.path.join(self.cache_dir, 'countries.json')
+        with open(path, 'w') as fh:
+            fh.write('{}')
+        with self.assertRaises(CommandError):
+            call_command('benchmark_refresh', countries_file=path, sizes=[1])
+
+
+class StatusTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metadata = self.refresh()
+
+    def test_reports_the_published_status(self):
+        response = self.client.get('/status')
+        self.assertEqual(response.json(), {
+            'total_countries': 3,
+            'last_refreshed_at': self.metadata.last_refreshed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'refresh_id': self.metadata.id,
+            'refresh_status': 'success',
+        })
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_polling_is_answered_without_queries(self):
+        etag = self.client.get('/status')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/status', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_publish_a_new_etag(self):
+        etag = self.client.get('/status')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/countries/ghana')
+        response = self.client.get('/status', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_countries'], 2)
+
+    def test_refresh_in_progress_is_reported(self):
+        seen = []
+
+        def fetch_countries(stats=None):
+            seen.append(self.client.get('/status').json()['refresh_status'])
+            return UPSTREAM_COUNTRIES
+
+        metadata = RefreshMetadata.objects.create(refresh_status='in_progress')
+        with mock.patch.object(services, 'fetch_countries_data', fetch_countries), \
+                mock.patch.object(services, 'fetch_exchange_rates', return_value=UPSTREAM_RATES), \
+                self.captureOnCommitCallbacks(execute=True):
+            services.refresh_countries_background(metadata.id)
+        self.assertEqual(seen, ['fetching_countries'])
+        self.assertEqual(self.client.get('/status').json()['refresh_status'], 'success')
+
+    def test_fresh_reads_the_database(self):
+        Country.objects.bulk_create([Country(name='Togo', population=8)])
+        self.assertEqual(self.client.get('/status').json()['total_countries'], 3)
+        self.assertEqual(self.client.get('/status', {'fresh': 1}).json()['total_countries'], 4)
+        self.assertEqual(self.client.get('/status').json()['total_countries'], 4)
+
+    def test_older_status_never_replaces_a_newer_one(self):
+        newer = services.publish_status()
+        with mock.patch.object(services.time, 'time_ns', return_value=newer['generation'] - 1), \
+                mock.patch.object(services, 'build_status', return_value={'data': {}, 'etag': 'old'}):
+            services.publish_status()
+        self.assertEqual(services.cached_status()['etag'], newer['etag'])
+
+
+class ExportTests(EndpointTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.refresh()
+
+    def export(self, **params):
+        headers = {}
+        if 'accept_encoding' in params:
+            headers['HTTP_ACCEPT_ENCODING'] = params.pop('accept_encoding')
+        response = self.client.get('/countries/export', params, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_with_filters(self):
+        response, body = self.export(format='csv', region='AFRICA')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="countries.csv"')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(list(rows[0]), list(CountrySerializer.Meta.fields))
+        self.assertEqual(sorted(row['name'] for row in rows), ['Ghana', 'Nigeria'])
+
+    def test_ndjson_rows_hold_every_field(self):
+        _, body = self.export(format='ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        expected = list(Country.objects.order_by('id').values(*CountrySerializer.Meta.fields))
+        for row in expected:
+            row['last_refreshed_at'] = row['last_refreshed_at'].isoformat()
+        self.assertEqual(rows, expected)
+
+    def test_gzip_when_accepted(self):
+        response, body = self.export(format='ndjson', accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(gzip.decompress(body).splitlines()), 3)
+
+        response, body = self.export(accept_encoding='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(len(body.decode().splitlines()), 4)
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get('/countries/export', {'format': 'xml'}).status_code, 404)
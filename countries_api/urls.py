@@ -3,8 +3,17 @@ from . import views
 
 urlpatterns = [
     path('countries/refresh', views.refresh_countries, name='refresh_countries'),
+    path('countries/refresh/<int:refresh_id>', views.get_refresh_progress, name='refresh_progress'),
     path('countries/image', views.get_summary_image, name='get_summary_image'),
+    path('countries/aggregates', views.get_aggregates, name='get_aggregates'),
+    path('countries/suggest', views.suggest_countries, name='suggest_countries'),
+    path('countries/export', views.export_countries, name='export_countries'),
+    path('countries/bulk', views.bulk_upsert_countries, name='bulk_upsert_countries'),
+    path('countries/<str:name>/flag', views.get_country_flag, name='country_flag'),
     path('countries/<str:name>', views.delete_country, name='country_detail'),
     path('countries', views.get_countries, name='get_countries'),
+    path('currency/convert', views.convert_currency, name='convert_currency'),
+    path('currency/<str:code>/history', views.get_rate_history, name='rate_history'),
     path('status', views.get_status, name='get_status'),
+    path('status/cache', views.get_cache_stats, name='get_cache_stats'),
 ]
@@ -1,9 +1,13 @@
 import requests
 import random
+import numpy as np
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timezone as dt_timezone
 from PIL import Image, ImageDraw, ImageFont
 import os
+import json
+import functools
+import tempfile
 from django.conf import settings
 
 
@@ -11,12 +15,23 @@ class ExternalAPIError(Exception):
     pass
 
 
-def fetch_countries_data():
-    url = "https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies"
+def _record_download(stats, response):
+    """Add the size of a response body to an optional stats mapping."""
+    if stats is not None:
+        stats['bytes_downloaded'] = stats.get('bytes_downloaded', 0) + len(response.content)
+
+
+def fetch_countries_data(stats=None):
+    url = getattr(
+        settings,
+        'COUNTRIES_API_URL',
+        "https://restcountries.com/v2/all?fields=name,capital,region,population,flag,currencies",
+    )
 
     try:
         response = requests.get(url, timeout=30)
         response.raise_for_status()
+        _record_download(stats, response)
         return response.json()
     except requests.exceptions.Timeout:
         raise ExternalAPIError("Request to REST Countries API timed out")
@@ -24,14 +39,15 @@ def fetch_countries_data():
         raise ExternalAPIError(f"Could not fetch data from REST Countries API: {str(e)}")
 
 
-def fetch_exchange_rates():
-    primary = "https://open.er-api.com/v6/latest/USD"
-    fallback = "https://api.exchangerate.host/latest?base=USD"
+def fetch_exchange_rates(stats=None):
+    primary = getattr(settings, 'EXCHANGE_RATES_API_URL', "https://open.er-api.com/v6/latest/USD")
+    fallback = getattr(settings, 'EXCHANGE_RATES_FALLBACK_URL', "https://api.exchangerate.host/latest?base=USD")
 
     # Try primary endpoint first, then fallback. If both fail return a small static map
     try:
         response = requests.get(primary, timeout=10)
         response.raise_for_status()
+        _record_download(stats, response)
         data = response.json()
         rates = data.get('rates', {})
         if rates:
@@ -40,6 +56,7 @@ def fetch_exchange_rates():
         try:
             response = requests.get(fallback, timeout=10)
             response.raise_for_status()
+            _record_download(stats, response)
             data = response.json()
             rates = data.get('rates', {})
             if rates:
@@ -54,6 +71,21 @@ def fetch_exchange_rates():
             }
 
 
+def clean_rates(rates):
+    """
+    Return the usable entries of a rates mapping: upper-cased codes with positive float rates
+    """
+    cleaned = {}
+    for code, rate in (rates or {}).items():
+        try:
+            rate = float(rate)
+        except (TypeError, ValueError):
+            continue
+        if code and rate > 0 and rate != float('inf'):
+            cleaned[str(code).upper()] = rate
+    return cleaned
+
+
 def calculate_estimated_gdp(population, exchange_rate):
     if population is None or exchange_rate is None:
         return None
@@ -79,12 +111,100 @@ def extract_currency_code(currencies):
     return first_currency.get('code', None)
 
 
-def generate_summary_image(total_countries, top_5_countries, timestamp):
-    # Ensure cache directory exists
-    cache_dir = os.path.join(settings.BASE_DIR, 'cache')
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
+def compute_aggregates(keys, population, exchange_rate, estimated_gdp):
+    """
+    Group countries by ``keys`` in one vectorised pass.
+
+    ``keys`` may contain None; numeric sequences may contain None for missing
+    values. Returns one dict per distinct key with counts, population and GDP
+    totals and min/max/mean exchange rate.
+    """
+    if not keys:
+        return []
+
+    labels = np.array(['' if key is None else key for key in keys], dtype=object)
+    groups, inverse = np.unique(labels, return_inverse=True)
+    size = len(groups)
+
+    population = np.asarray(population, dtype=np.float64)
+    rate = np.array([np.nan if value is None else value for value in exchange_rate], dtype=np.float64)
+    gdp = np.array([np.nan if value is None else value for value in estimated_gdp], dtype=np.float64)
+
+    counts = np.bincount(inverse, minlength=size)
+    population_totals = np.bincount(inverse, weights=population, minlength=size)
+    gdp_totals = np.bincount(inverse, weights=np.nan_to_num(gdp), minlength=size)
+
+    has_rate = ~np.isnan(rate)
+    rate_counts = np.bincount(inverse[has_rate], minlength=size)
+    rate_sums = np.bincount(inverse[has_rate], weights=rate[has_rate], minlength=size)
+    rate_min = np.full(size, np.inf)
+    rate_max = np.full(size, -np.inf)
+    np.minimum.at(rate_min, inverse[has_rate], rate[has_rate])
+    np.maximum.at(rate_max, inverse[has_rate], rate[has_rate])
+
+    results = []
+    for i, group in enumerate(groups.tolist()):
+        with_rate = rate_counts[i] > 0
+        results.append({
+            'key': group or None,
+            'country_count': int(counts[i]),
+            'total_population': int(population_totals[i]),
+            'total_estimated_gdp': round(float(gdp_totals[i]), 2),
+            'rate_min': float(rate_min[i]) if with_rate else None,
+            'rate_max': float(rate_max[i]) if with_rate else None,
+            'rate_mean': float(rate_sums[i] / rate_counts[i]) if with_rate else None,
+        })
+    return results
+
+
+IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+SUMMARY_IMAGE_WIDTHS = (200, 400, 800)
+
+
+def get_cache_dir():
+    cache_dir = getattr(settings, 'COUNTRIES_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache'))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+@functools.lru_cache(maxsize=1)
+def _load_fonts():
+    """
+    Load the summary fonts once per process; TrueType parsing is the slow part of a render
+    """
+    try:
+        font_path = os.path.join(settings.BASE_DIR, 'countries_api/static/fonts/arial.ttf')
+        return {
+            'title': ImageFont.truetype(font_path, 32),
+            'header': ImageFont.truetype(font_path, 24),
+            'text': ImageFont.truetype(font_path, 18),
+            'small': ImageFont.truetype(font_path, 14),
+        }
+    except IOError:
+        # Fallback to default font
+        default = ImageFont.load_default()
+        return {'title': default, 'header': default, 'text': default, 'small': default}
+
+
+def save_image_atomic(image, path, image_format):
+    """
+    Write an image next to ``path`` and rename it into place so readers never see a partial file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            image.save(fh, image_format)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
+
+def generate_summary_image(total_countries, top_5_countries, timestamp, generation=None):
     # Image dimensions
     width = 800
     height = 600
@@ -96,19 +216,11 @@ def generate_summary_image(total_countries, top_5_countries, timestamp):
     image = Image.new('RGB', (width, height), background_color)
     draw = ImageDraw.Draw(image)
 
-    # Try to use a nice font, fall back to default if not available
-    try:
-        font_path = os.path.join(settings.BASE_DIR, 'countries_api/static/fonts/arial.ttf')
-        title_font = ImageFont.truetype(font_path, 32)
-        header_font = ImageFont.truetype(font_path, 24)
-        text_font = ImageFont.truetype(font_path, 18)
-        small_font = ImageFont.truetype(font_path, 14)
-    except IOError:
-        # Fallback to default font
-        title_font = ImageFont.load_default()
-        header_font = ImageFont.load_default()
-        text_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
+    fonts = _load_fonts()
+    title_font = fonts['title']
+    header_font = fonts['header']
+    text_font = fonts['text']
+    small_font = fonts['small']
 
     # Draw title
     title = "Country Currency & Exchange Summary"
@@ -146,21 +258,85 @@ def generate_summary_image(total_countries, top_5_countries, timestamp):
     timestamp_str = timestamp.strftime("%Y-%m-%d %H:%M:%S UTC") if timestamp else "N/A"
     draw.text((50, y_position), f"Last Refreshed: {timestamp_str}", fill=text_color, font=text_font)
 
-    # Save image
-    cache_dir = os.path.join(settings.BASE_DIR, 'cache')
-    os.makedirs(cache_dir, exist_ok=True)
+    # The PNG is written under its version and only then published by
+    # replacing the sidecar, so the sidecar always names complete bytes
+    cache_dir = get_cache_dir()
+    previous = get_summary_image_metadata()
+    rendered_at = datetime.now(dt_timezone.utc)
+    metadata = {
+        'generation': generation,
+        'rendered_at': rendered_at.isoformat(),
+        'version': f"{generation or 0}.{int(rendered_at.timestamp() * 1000)}",
+    }
+    image_path = os.path.join(cache_dir, f"summary-{metadata['version']}.png")
+    save_image_atomic(image, image_path, 'PNG')
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(metadata, fh)
+        os.replace(tmp_path, os.path.join(cache_dir, 'summary.json'))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.remove(image_path)
+        raise
+
+    # Keep the previous version for requests that read its sidecar just before the swap
+    _remove_summary_versions(cache_dir, keep={metadata['version'], previous and previous['version']})
+    return image_path
 
-    image_path = os.path.join(cache_dir, 'summary.png')
-    image.save(image_path, 'PNG')
 
-    return image_path
+def _remove_summary_versions(cache_dir, keep):
+    for name in os.listdir(cache_dir):
+        if not name.startswith('summary-') or name.endswith('.tmp'):
+            continue
+        # summary-<version>.png or summary-<version>-<width>.<format>
+        version = os.path.splitext(name)[0][len('summary-'):].split('-', 1)[0]
+        if version not in keep:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def get_summary_image_metadata():
+    """
+    Return the sidecar written with the summary image: the refresh generation it
+    shows, when it was rendered and its version string. None if never rendered.
+    """
+    try:
+        with open(os.path.join(get_cache_dir(), 'summary.json')) as fh:
+            metadata = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    metadata['rendered_at'] = datetime.fromisoformat(metadata['rendered_at'])
+    return metadata
 
 
-def get_summary_image_path():
-    cache_dir = os.path.join(settings.BASE_DIR, 'cache')
-    image_path = os.path.join(cache_dir, 'summary.png')
+def get_summary_image_path(version, image_format='png', width=None):
+    """
+    Return the path of summary image ``version`` in the requested format and width.
 
-    if os.path.exists(image_path):
-        return image_path
+    Each version's files never change once written, so a variant is derived
+    from its PNG on first request and reused after that. Returns None when the
+    version is no longer on disk.
+    """
+    cache_dir = get_cache_dir()
+    image_path = os.path.join(cache_dir, f"summary-{version}.png")
+    if image_format == 'png' and width is None:
+        return image_path if os.path.exists(image_path) else None
 
-    return None
+    variant_path = os.path.join(cache_dir, f"summary-{version}-{width or 'full'}.{image_format}")
+    if os.path.exists(variant_path):
+        return variant_path
+
+    try:
+        with Image.open(image_path) as source:
+            variant = source.copy()
+    except FileNotFoundError:
+        return None
+    if width is not None and width < variant.width:
+        variant = variant.resize((width, round(variant.height * width / variant.width)), Image.LANCZOS)
+    save_image_atomic(variant, variant_path, IMAGE_FORMATS[image_format][0])
+    return variant_path
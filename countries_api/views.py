@@ -1,26 +1,80 @@
 import logging
-from rest_framework import status
-from rest_framework.decorators import api_view
+import os
+import numpy as np
+from rest_framework import serializers, status
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from django.utils import timezone
-from django.http import FileResponse
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_date, parse_datetime
 import threading
+from datetime import datetime, timezone as dt_timezone
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import Country, RefreshMetadata
+from .models import Country, CountryAggregate, ExchangeRate, RefreshMetadata
 from .serializers import (
     CountrySerializer,
     CountryListSerializer,
+    CountrySuggestionSerializer,
+    CountryBulkItemSerializer,
+    CountryBulkRequestSerializer,
+    CountryBulkResponseSerializer,
+    CountryAggregateSerializer,
+    RefreshProgressSerializer,
     StatusResponseSerializer,
+    CacheStatsSerializer,
+    CurrencyConversionRequestSerializer,
+    CurrencyConversionResponseSerializer,
+    RateHistoryResponseSerializer,
     ErrorResponseSerializer,
     RefreshResponseSerializer,
 )
-from .utils import get_summary_image_path, ExternalAPIError
+from .utils import (
+    IMAGE_FORMATS,
+    SUMMARY_IMAGE_WIDTHS,
+    get_summary_image_metadata,
+    get_summary_image_path,
+    ExternalAPIError,
+)
+from .image_delivery import image_response
+from .export import (
+    EXPORT_FIELDS,
+    CSVRenderer,
+    NDJSONRenderer,
+    accepts_gzip,
+    csv_chunks,
+    gzip_chunks,
+    ndjson_chunks,
+)
+from .flags import DEFAULT_FLAG_WIDTH, FLAG_WIDTHS, flag_path, load_manifest
+from .filters import filter_countries, iexact, sort_countries, sort_key
+from .pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    parse_limit,
+    seek,
+)
+from .snapshot import get_snapshot
+from .rates import get_matrix
+from .suggest import MAX_RESULTS as MAX_SUGGESTIONS, get_index as get_suggest_index
+from .response_cache import bump_version, cache_stats, cached_response
 from . import services
 
 logger = logging.getLogger(__name__)
 
+LIST_FIELDS = CountryListSerializer.Meta.fields
+MAX_CONVERSIONS = 100000
+MAX_BULK_COUNTRIES = 10000
+HISTORY_RESOLUTIONS = ['raw', 'hour', 'day', 'week', 'month']
+
 
 @swagger_auto_schema(
     method='post',
@@ -48,6 +102,8 @@ def refresh_countries(request):
             last_refreshed_at=started_at,
             refresh_status='in_progress',
         )
+        bump_version()
+        services.publish_status()
 
         # Start background thread that delegates to services.refresh_countries_background
         thread = threading.Thread(target=services.refresh_countries_background, args=(metadata.id, started_at), daemon=True)
@@ -55,6 +111,7 @@ def refresh_countries(request):
 
         return Response({
             'message': 'Refresh started',
+            'refresh_id': metadata.id,
             'started_at': started_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
         }, status=status.HTTP_202_ACCEPTED)
 
@@ -66,6 +123,32 @@ def refresh_countries(request):
         return Response({'error': 'Internal server error', 'details': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@swagger_auto_schema(
+    method='get',
+    operation_description='Show the stage, timings and row counts of a refresh job',
+    responses={
+        200: RefreshProgressSerializer,
+        404: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+def get_refresh_progress(request, refresh_id):
+    """
+    GET /countries/refresh/:id
+    Show the progress of a refresh job
+    """
+    try:
+        metadata = RefreshMetadata.objects.get(pk=refresh_id)
+    except RefreshMetadata.DoesNotExist:
+        return Response({
+            'error': 'Refresh not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = RefreshProgressSerializer(metadata)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='get',
     operation_description='Get all countries from the database with optional filters and sorting',
@@ -88,6 +171,24 @@ def refresh_countries(request):
             description='Sort by gdp_desc, gdp_asc, population_desc, population_asc, name_asc, name_desc',
             type=openapi.TYPE_STRING
         ),
+        openapi.Parameter(
+            'fields',
+            openapi.IN_QUERY,
+            description='Comma-separated subset of fields to return (e.g., name,flag_url)',
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'limit',
+            openapi.IN_QUERY,
+            description=f'Page size (1-{MAX_LIMIT}); when set the response is {{"results": [...], "next_cursor": ...}}',
+            type=openapi.TYPE_INTEGER
+        ),
+        openapi.Parameter(
+            'cursor',
+            openapi.IN_QUERY,
+            description='Opaque cursor returned as next_cursor by the previous page',
+            type=openapi.TYPE_STRING
+        ),
     ],
     responses={
         200: CountryListSerializer(many=True),
@@ -101,38 +202,139 @@ def get_countries(request):
     GET /countries
     Get all countries from the database with optional filters and sorting
     """
+    region = request.query_params.get('region', None)
+    currency = request.query_params.get('currency', None)
+    sort_param = request.query_params.get('sort', None)
+
+    # Validate projection and pagination parameters
+    errors = {}
+    fields = LIST_FIELDS
+    fields_param = request.query_params.get('fields', None)
+    if fields_param:
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in LIST_FIELDS]
+        if unknown or not fields:
+            errors['fields'] = f"must be a comma-separated subset of {', '.join(LIST_FIELDS)}"
+
     try:
-        queryset = Country.objects.all()
+        limit = parse_limit(request.query_params.get('limit', None))
+    except ValueError as e:
+        errors['limit'] = str(e)
+        limit = None
 
-        # Filter by region
-        region = request.query_params.get('region', None)
-        if region:
-            queryset = queryset.filter(region__iexact=region)
+    cursor_value = None
+    cursor = request.query_params.get('cursor', None)
+    if cursor:
+        try:
+            cursor_value = decode_cursor(cursor, sort_param)
+        except InvalidCursor as e:
+            errors['cursor'] = str(e)
+        if limit is None:
+            limit = DEFAULT_LIMIT
 
-        # Filter by currency
-        currency = request.query_params.get('currency', None)
-        if currency:
-            queryset = queryset.filter(currency_code__iexact=currency)
-
-        # Sorting
-        sort_param = request.query_params.get('sort', None)
-        if sort_param:
-            if sort_param == 'gdp_desc':
-                queryset = queryset.exclude(estimated_gdp__isnull=True).order_by('-estimated_gdp')
-            elif sort_param == 'gdp_asc':
-                queryset = queryset.exclude(estimated_gdp__isnull=True).order_by('estimated_gdp')
-            elif sort_param == 'population_desc':
-                queryset = queryset.order_by('-population')
-            elif sort_param == 'population_asc':
-                queryset = queryset.order_by('population')
-            elif sort_param == 'name_asc':
-                queryset = queryset.order_by('name')
-            elif sort_param == 'name_desc':
-                queryset = queryset.order_by('-name')
-
-        serializer = CountryListSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    if errors:
+        return Response({
+            'error': 'Validation failed',
+            'details': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return cached_response(
+        'countries',
+        request.query_params,
+        lambda: _list_countries(region, currency, sort_param, fields, limit, cursor_value),
+    )
+
+
+def _list_countries(region, currency, sort_param, fields, limit, cursor_value):
+    # Cursors need the sort key and id of the last row even if not projected
+    sort_field, _ = sort_key(sort_param)
+    fetch_fields = list(dict.fromkeys(fields + (['id', sort_field] if limit else [])))
+
+    try:
+        rows = None
+
+        # Serve from the memory-mapped snapshot when one has been published
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            positions = snapshot.query(region=region, currency=currency, sort_param=sort_param)
+            if cursor_value is not None:
+                positions = snapshot.seek(positions, cursor_value[1])
+            if positions is not None:
+                if limit:
+                    positions = positions[:limit + 1]
+                rows = snapshot.rows(positions, fetch_fields)
+
+        if rows is None:
+            queryset = filter_countries(Country.objects.all(), region=region, currency=currency)
+            queryset = sort_countries(queryset, sort_param)
+            if cursor_value is not None:
+                queryset = seek(queryset, sort_param, cursor_value)
+            if limit:
+                queryset = queryset[:limit + 1]
+            rows = list(queryset.values(*fetch_fields))
+
+        if not limit:
+            return Response(rows, status=status.HTTP_200_OK)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1], sort_param)
+        if fetch_fields != fields:
+            rows = [{field: row[field] for field in fields} for row in rows]
+
+        return Response({
+            'results': rows,
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description='Get population, GDP and exchange rate totals grouped by region or currency',
+    manual_parameters=[
+        openapi.Parameter(
+            'by',
+            openapi.IN_QUERY,
+            description='Group by region or currency',
+            type=openapi.TYPE_STRING,
+            enum=['region', 'currency'],
+            required=True
+        ),
+    ],
+    responses={
+        200: CountryAggregateSerializer(many=True),
+        400: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+def get_aggregates(request):
+    """
+    GET /countries/aggregates?by=region|currency
+    Serve the aggregates materialized by the last refresh
+    """
+    by = request.query_params.get('by', None)
+    if by not in ('region', 'currency'):
+        return Response({
+            'error': 'Validation failed',
+            'details': {'by': 'must be region or currency'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return cached_response('aggregates', {'by': by}, lambda: _aggregates(by))
 
+
+def _aggregates(by):
+    try:
+        queryset = CountryAggregate.objects.filter(dimension=by)
+        serializer = CountryAggregateSerializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({
             'error': 'Internal server error',
@@ -140,6 +342,60 @@ def get_countries(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@swagger_auto_schema(
+    method='get',
+    operation_description='Suggest country names for a partial, accent- and typo-tolerant query',
+    manual_parameters=[
+        openapi.Parameter(
+            'q',
+            openapi.IN_QUERY,
+            description='What the user has typed so far',
+            type=openapi.TYPE_STRING,
+            required=True
+        ),
+        openapi.Parameter(
+            'limit',
+            openapi.IN_QUERY,
+            description=f'Number of suggestions (1-{MAX_SUGGESTIONS}, default 5)',
+            type=openapi.TYPE_INTEGER
+        ),
+    ],
+    responses={
+        200: CountrySuggestionSerializer(many=True),
+        400: ErrorResponseSerializer,
+        503: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+def suggest_countries(request):
+    """
+    GET /countries/suggest?q=
+    Autocomplete country names, ranked by population
+    """
+    query = request.query_params.get('q', '')
+    try:
+        limit = int(request.query_params.get('limit', 5))
+        if limit < 1 or limit > MAX_SUGGESTIONS:
+            raise ValueError
+    except ValueError:
+        return Response({
+            'error': 'Validation failed',
+            'details': {'limit': f'must be an integer between 1 and {MAX_SUGGESTIONS}'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    snapshot, index = get_suggest_index()
+    if index is None:
+        return Response({
+            'error': 'Suggestions unavailable',
+            'details': 'Run POST /countries/refresh first'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    positions = index.search(query, limit=limit)
+    data = snapshot.rows(positions, CountrySuggestionSerializer.Meta.fields)
+    return Response(data, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='get',
     operation_description='Get a single country by name',
@@ -155,8 +411,12 @@ def get_country_by_name(request, name):
     GET /countries/:name
     Get one country by name
     """
+    return cached_response('country', {'name': name}, lambda: _country_detail(name))
+
+
+def _country_detail(name):
     try:
-        country = Country.objects.get(name__iexact=name)
+        country = Country.objects.get(**iexact('name', name))
         serializer = CountrySerializer(country)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Country.DoesNotExist:
@@ -170,6 +430,124 @@ def get_country_by_name(request, name):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@swagger_auto_schema(
+    method='get',
+    operation_description='Stream the countries table as CSV or NDJSON, gzip-compressed when the client accepts it',
+    manual_parameters=[
+        openapi.Parameter('format', openapi.IN_QUERY, description='Export format', type=openapi.TYPE_STRING, enum=['csv', 'ndjson']),
+        openapi.Parameter('region', openapi.IN_QUERY, description='Filter by region', type=openapi.TYPE_STRING),
+        openapi.Parameter('currency', openapi.IN_QUERY, description='Filter by currency code', type=openapi.TYPE_STRING),
+    ],
+    responses={
+        200: openapi.Response(
+            description='Country rows',
+            schema=openapi.Schema(
+                type=openapi.TYPE_FILE
+            )
+        ),
+        500: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def export_countries(request):
+    """
+    GET /countries/export?format=csv|ndjson
+    Stream every country matching the region/currency filters
+    """
+    try:
+        region = request.query_params.get('region', None)
+        currency = request.query_params.get('currency', None)
+
+        queryset = filter_countries(Country.objects.all(), region, currency)
+        # iterator() reads through a server-side cursor where the database supports one
+        rows = queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=2000)
+
+        export_format = request.accepted_renderer.format
+        chunks = ndjson_chunks(rows) if export_format == 'ndjson' else csv_chunks(rows)
+        compress = accepts_gzip(request)
+        if compress:
+            chunks = gzip_chunks(chunks)
+
+        response = StreamingHttpResponse(chunks, content_type=f'{request.accepted_renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="countries.{export_format}"'
+        response['Vary'] = 'Accept-Encoding'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_description='Create or update many countries at once; invalid rows are reported and skipped',
+    request_body=CountryBulkRequestSerializer,
+    responses={
+        200: CountryBulkResponseSerializer,
+        400: ErrorResponseSerializer,
+        500: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['POST'])
+def bulk_upsert_countries(request):
+    """
+    POST /countries/bulk
+    Validate a list of country records and upsert the valid ones by name
+    """
+    records = request.data.get('countries') if isinstance(request.data, dict) else None
+    if not isinstance(records, list):
+        return Response({
+            'error': 'Validation failed',
+            'details': {'countries': 'must be a list of country records'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > MAX_BULK_COUNTRIES:
+        return Response({
+            'error': 'Validation failed',
+            'details': {'countries': f'at most {MAX_BULK_COUNTRIES} items per request'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    # One serializer instance validates every row; errors are collected per row
+    serializer = CountryBulkItemSerializer()
+    valid, errors, seen = [], [], {}
+    for index, record in enumerate(records):
+        try:
+            data = serializer.run_validation(record)
+        except serializers.ValidationError as exc:
+            errors.append({'index': index, 'details': exc.detail})
+            continue
+        key = data['name'].lower()
+        if key in seen:
+            errors.append({'index': index, 'details': {'name': [f'duplicates row {seen[key]}']}})
+            continue
+        seen[key] = index
+        valid.append(data)
+
+    try:
+        created, updated = services.upsert_countries(valid) if valid else (0, 0)
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if valid:
+        services.publish_changes()
+
+    return Response({
+        'created': created,
+        'updated': updated,
+        'failed': len(errors),
+        'errors': errors,
+    }, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(
     method='delete',
     operation_description='Delete a country record by name',
@@ -194,24 +572,15 @@ def delete_country(request, name):
     Delete a country record
     """
     if request.method == 'GET':
-        try:
-            country = Country.objects.get(name__iexact=name)
-            serializer = CountrySerializer(country)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Country.DoesNotExist:
-            return Response({
-                'error': 'Country not found'
-            }, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({
-                'error': 'Internal server error',
-                'details': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return cached_response('country', {'name': name}, lambda: _country_detail(name))
 
     # DELETE
     try:
-        country = Country.objects.get(name__iexact=name)
-        country.delete()
+        country = Country.objects.get(**iexact('name', name))
+        # The post_delete signal republishes the read paths on commit
+        with transaction.atomic():
+            country.delete()
+            services.rebuild_aggregates()
         return Response(status=status.HTTP_204_NO_CONTENT)
     except Country.DoesNotExist:
         return Response({
@@ -226,9 +595,13 @@ def delete_country(request, name):
 
 @swagger_auto_schema(
     method='get',
-    operation_description='Show total countries and last refresh timestamp',
+    operation_description='Show total countries, the last successful refresh and the current refresh stage',
+    manual_parameters=[
+        openapi.Parameter('fresh', openapi.IN_QUERY, description='Read the database instead of the published snapshot', type=openapi.TYPE_BOOLEAN),
+    ],
     responses={
         200: StatusResponseSerializer,
+        304: 'Not modified',
         404: ErrorResponseSerializer
     },
     tags=['Countries']
@@ -240,30 +613,50 @@ def get_status(request):
     Show total countries and last refresh timestamp
     """
     try:
-        total_countries = Country.objects.count()
-
-        # Get last refresh metadata
-        try:
-            last_refresh = RefreshMetadata.objects.latest('last_refreshed_at')
-            last_refreshed_at = last_refresh.last_refreshed_at.strftime('%Y-%m-%dT%H:%M:%SZ')
-        except RefreshMetadata.DoesNotExist:
-            last_refreshed_at = None
-
-        return Response({
-            'total_countries': total_countries,
-            'last_refreshed_at': last_refreshed_at
-        }, status=status.HTTP_200_OK)
-
+        if request.query_params.get('fresh', '').lower() in ('1', 'true', 'yes'):
+            snapshot = services.publish_status()
+        else:
+            snapshot = services.cached_status()
     except Exception as e:
         return Response({
             'error': 'Internal server error',
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    etag = f'"status-{snapshot["etag"]}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(snapshot['data'], status=status.HTTP_200_OK)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description='Show hit/miss counters of the countries response cache',
+    responses={
+        200: CacheStatsSerializer,
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+def get_cache_stats(request):
+    """
+    GET /status/cache
+    Show response cache hit-rate statistics
+    """
+    return Response(cache_stats(), status=status.HTTP_200_OK)
+
 
 @swagger_auto_schema(
     method='get',
     operation_description='Serve the generated summary image',
+    manual_parameters=[
+        openapi.Parameter('type', openapi.IN_QUERY, description='Image type', type=openapi.TYPE_STRING, enum=list(IMAGE_FORMATS)),
+        openapi.Parameter('width', openapi.IN_QUERY, description='Thumbnail width in pixels', type=openapi.TYPE_INTEGER, enum=list(SUMMARY_IMAGE_WIDTHS)),
+        openapi.Parameter('v', openapi.IN_QUERY, description='Image version from Content-Location; current versions are cached for a year', type=openapi.TYPE_STRING),
+    ],
     responses={
         200: openapi.Response(
             description='Summary image',
@@ -271,6 +664,8 @@ def get_status(request):
                 type=openapi.TYPE_FILE
             )
         ),
+        304: 'Not modified',
+        400: ErrorResponseSerializer,
         404: ErrorResponseSerializer
     },
     tags=['Countries']
@@ -278,23 +673,317 @@ def get_status(request):
 @api_view(['GET'])
 def get_summary_image(request):
     """
-    GET /countries/image
+    GET /countries/image?type=png|webp&width=200|400|800
     Serve the generated summary image
     """
-    try:
-        image_path = get_summary_image_path()
+    # ``format`` is reserved by DRF for renderer selection, hence ``type``
+    image_format = request.query_params.get('type', 'png').lower()
+    width = request.query_params.get('width')
+    errors = {}
+    if image_format not in IMAGE_FORMATS:
+        errors['type'] = f"must be one of: {', '.join(IMAGE_FORMATS)}"
+    if width is not None:
+        width = int(width) if width.isdigit() else None
+        if width not in SUMMARY_IMAGE_WIDTHS:
+            errors['width'] = f"must be one of: {', '.join(map(str, SUMMARY_IMAGE_WIDTHS))}"
+    if errors:
+        return Response({
+            'error': 'Validation failed',
+            'details': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
 
-        if image_path is None:
+    try:
+        metadata = get_summary_image_metadata()
+        if metadata is None:
             return Response({
                 'error': 'Summary image not found'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        return FileResponse(
-            open(image_path, 'rb'),
-            content_type='image/png',
-            as_attachment=False,
-            filename='summary.png'
+        version = metadata['version']
+        response = image_response(
+            request,
+            # Derived only after the 304 check, for clients without the current version
+            lambda: get_summary_image_path(version, image_format, width),
+            content_type=IMAGE_FORMATS[image_format][1],
+            filename=f'summary.{image_format}',
+            etag=f"summary-{version}-{image_format}-{width or 'full'}",
+            last_modified=metadata['rendered_at'],
+            version=version,
+        )
+        # Where this exact rendering can be fetched with long-lived caching
+        params = request.query_params.copy()
+        params['v'] = version
+        response['Content-Location'] = f"{request.path}?{params.urlencode()}"
+        return response
+
+    except FileNotFoundError:
+        # Replaced by two newer renders while this request was being served
+        return Response({
+            'error': 'Summary image not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description='Serve a country flag from the local mirror',
+    manual_parameters=[
+        openapi.Parameter('type', openapi.IN_QUERY, description='Image type', type=openapi.TYPE_STRING, enum=list(IMAGE_FORMATS)),
+        openapi.Parameter('width', openapi.IN_QUERY, description=f'Width in pixels (default {DEFAULT_FLAG_WIDTH})', type=openapi.TYPE_INTEGER, enum=list(FLAG_WIDTHS)),
+        openapi.Parameter('v', openapi.IN_QUERY, description='Flag version from Content-Location; current versions are cached for a year', type=openapi.TYPE_STRING),
+    ],
+    responses={
+        200: openapi.Response(
+            description='Flag image',
+            schema=openapi.Schema(
+                type=openapi.TYPE_FILE
+            )
+        ),
+        304: 'Not modified',
+        400: ErrorResponseSerializer,
+        404: ErrorResponseSerializer
+    },
+    tags=['Countries']
+)
+@api_view(['GET'])
+def get_country_flag(request, name):
+    """
+    GET /countries/:name/flag?type=png|webp&width=80|160|320
+    Serve a country's flag from the local mirror
+    """
+    image_format = request.query_params.get('type', 'png').lower()
+    width = request.query_params.get('width', str(DEFAULT_FLAG_WIDTH))
+    errors = {}
+    if image_format not in IMAGE_FORMATS:
+        errors['type'] = f"must be one of: {', '.join(IMAGE_FORMATS)}"
+    width = int(width) if width.isdigit() else None
+    if width not in FLAG_WIDTHS:
+        errors['width'] = f"must be one of: {', '.join(map(str, FLAG_WIDTHS))}"
+    if errors:
+        return Response({
+            'error': 'Validation failed',
+            'details': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        flag_url = Country.objects.filter(**iexact('name', name)).values_list('flag_url', flat=True).first()
+        entry = load_manifest().get(flag_url) if flag_url else None
+        path = flag_path(entry['sha1'], image_format, width) if entry else None
+
+        if path is None or not os.path.exists(path):
+            return Response({
+                'error': 'Flag not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        version = entry['sha1']
+        response = image_response(
+            request,
+            path,
+            content_type=IMAGE_FORMATS[image_format][1],
+            filename=f'flag.{image_format}',
+            etag=f'flag-{version}-{image_format}-{width}',
+            last_modified=datetime.fromtimestamp(os.path.getmtime(path), tz=dt_timezone.utc),
+            version=version,
         )
+        params = request.query_params.copy()
+        params['v'] = version
+        response['Content-Location'] = f"{request.path}?{params.urlencode()}"
+        return response
+
+    except Exception as e:
+        return Response({
+            'error': 'Internal server error',
+            'details': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@swagger_auto_schema(
+    method='post',
+    operation_description='Convert a batch of [amount, from, to] triples using the rates of the last refresh',
+    request_body=CurrencyConversionRequestSerializer,
+    responses={
+        200: CurrencyConversionResponseSerializer,
+        400: ErrorResponseSerializer,
+        503: ErrorResponseSerializer
+    },
+    tags=['Currency']
+)
+@api_view(['POST'])
+def convert_currency(request):
+    """
+    POST /currency/convert
+    Convert many amounts between currencies in one vectorised operation
+    """
+    conversions = request.data.get('conversions') if isinstance(request.data, dict) else None
+    if not isinstance(conversions, list):
+        return Response({
+            'error': 'Validation failed',
+            'details': {'conversions': 'must be a list of [amount, from, to] triples'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(conversions) > MAX_CONVERSIONS:
+        return Response({
+            'error': 'Validation failed',
+            'details': {'conversions': f'at most {MAX_CONVERSIONS} items per request'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    matrix = get_matrix()
+    if matrix is None:
+        return Response({
+            'error': 'Exchange rates unavailable',
+            'details': 'Run POST /countries/refresh first'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    amounts, sources, targets, errors = [], [], [], []
+    for index, item in enumerate(conversions):
+        if (
+            isinstance(item, (list, tuple)) and len(item) == 3
+            and isinstance(item[0], (int, float)) and not isinstance(item[0], bool)
+            and isinstance(item[1], str) and isinstance(item[2], str)
+        ):
+            amount, source, target = item
+        else:
+            errors.append({'index': index, 'error': 'expected [amount, from, to]'})
+            amount, source, target = 0, '', ''
+        amounts.append(amount)
+        sources.append(source)
+        targets.append(target)
+
+    converted = matrix.convert(amounts, sources, targets)
+
+    invalid = {error['index'] for error in errors}
+    for index in np.flatnonzero(np.isnan(converted)).tolist():
+        if index not in invalid:
+            errors.append({'index': index, 'error': 'unknown currency'})
+    errors.sort(key=lambda error: error['index'])
+
+    return Response({
+        'results': [None if value != value else value for value in converted.tolist()],
+        'errors': errors,
+        'rates_refresh_id': matrix.refresh_id,
+        'rates_as_of': matrix.recorded_at,
+    }, status=status.HTTP_200_OK)
+
+
+def _parse_history_bound(value, end_of_day=False):
+    """
+    Parse a from/to bound given as an ISO datetime or date
+    """
+    # Dates first: parse_datetime also accepts a bare date, as midnight
+    day = parse_date(value)
+    if day is not None:
+        parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError("must be an ISO 8601 date or datetime")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description='Exchange-rate history of one currency, optionally downsampled',
+    manual_parameters=[
+        openapi.Parameter(
+            'from',
+            openapi.IN_QUERY,
+            description='Start of the range (ISO date or datetime)',
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'to',
+            openapi.IN_QUERY,
+            description='End of the range (ISO date or datetime)',
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'resolution',
+            openapi.IN_QUERY,
+            description='raw (default), hour, day, week or month',
+            type=openapi.TYPE_STRING,
+            enum=HISTORY_RESOLUTIONS
+        ),
+    ],
+    responses={
+        200: RateHistoryResponseSerializer,
+        400: ErrorResponseSerializer
+    },
+    tags=['Currency']
+)
+@api_view(['GET'])
+def get_rate_history(request, code):
+    """
+    GET /currency/:code/history
+    Serve the stored rates of a currency over a time range
+    """
+    errors = {}
+    bounds = {}
+    for param, end_of_day in (('from', False), ('to', True)):
+        value = request.query_params.get(param, None)
+        if value:
+            try:
+                bounds[param] = _parse_history_bound(value, end_of_day)
+            except ValueError as e:
+                errors[param] = str(e)
+
+    resolution = request.query_params.get('resolution', None) or 'raw'
+    if resolution not in HISTORY_RESOLUTIONS:
+        errors['resolution'] = f"must be one of {', '.join(HISTORY_RESOLUTIONS)}"
+
+    if errors:
+        return Response({
+            'error': 'Validation failed',
+            'details': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    params = {'code': code.upper(), 'resolution': resolution}
+    params.update({param: value.isoformat() for param, value in bounds.items()})
+    return cached_response(
+        'rate_history',
+        params,
+        lambda: _rate_history(code.upper(), bounds.get('from'), bounds.get('to'), resolution),
+    )
+
+
+def _rate_history(code, start, end, resolution):
+    try:
+        queryset = ExchangeRate.objects.filter(currency_code=code)
+        if start is not None:
+            queryset = queryset.filter(recorded_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(recorded_at__lte=end)
+
+        if resolution == 'raw':
+            points = [
+                {'timestamp': recorded_at, 'rate': rate, 'rate_min': rate, 'rate_max': rate, 'samples': 1}
+                for recorded_at, rate in queryset.order_by('recorded_at').values_list('recorded_at', 'rate')
+            ]
+        else:
+            points = [
+                {
+                    'timestamp': row['bucket'],
+                    'rate': row['rate_mean'],
+                    'rate_min': row['rate_min'],
+                    'rate_max': row['rate_max'],
+                    'samples': row['samples'],
+                }
+                for row in queryset
+                .annotate(bucket=Trunc('recorded_at', resolution))
+                .values('bucket')
+                .annotate(rate_mean=Avg('rate'), rate_min=Min('rate'), rate_max=Max('rate'), samples=Count('rate'))
+                .order_by('bucket')
+            ]
+
+        return Response({
+            'currency': code,
+            'resolution': resolution,
+            'points': points,
+        }, status=status.HTTP_200_OK)
 
     except Exception as e:
         return Response({
@@ -15,6 +15,29 @@ DEBUG = os.getenv("DEBUG")
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Background tasks: worker threads, unfinished tasks accepted before answering busy, and seconds
+# after which a task still working (lost to a restart) is reported as failed
+EDUSIMPLIFY_WORKERS = int(os.getenv("EDUSIMPLIFY_WORKERS", "4"))
+EDUSIMPLIFY_MAX_PENDING = int(os.getenv("EDUSIMPLIFY_MAX_PENDING", "32"))
+EDUSIMPLIFY_TASK_TIMEOUT = int(os.getenv("EDUSIMPLIFY_TASK_TIMEOUT", "600"))
+
+# LLM gateway: "genai" or "fake" (local answers for tests), per-model limits and deadline in seconds
+EDUSIMPLIFY_LLM_BACKEND = os.getenv("EDUSIMPLIFY_LLM_BACKEND", "genai")
+EDUSIMPLIFY_LLM_CONCURRENCY = {"default": int(os.getenv("EDUSIMPLIFY_LLM_CONCURRENCY", "8"))}
+EDUSIMPLIFY_LLM_TIMEOUT = float(os.getenv("EDUSIMPLIFY_LLM_TIMEOUT", "60"))
+
+# Prompt cache: answers are reused for this many seconds, and at most this many are kept in the database
+EDUSIMPLIFY_PROMPT_CACHE = os.getenv("EDUSIMPLIFY_PROMPT_CACHE", "1") not in ("0", "false", "False")
+EDUSIMPLIFY_PROMPT_CACHE_TTL = int(os.getenv("EDUSIMPLIFY_PROMPT_CACHE_TTL", str(7 * 24 * 60 * 60)))
+EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("EDUSIMPLIFY_PROMPT_CACHE_MAX_ENTRIES", "10000"))
+
+# Conversation history in prompts: at most this many recent messages within this many tokens
+EDUSIMPLIFY_HISTORY_MESSAGES = int(os.getenv("EDUSIMPLIFY_HISTORY_MESSAGES", "10"))
+EDUSIMPLIFY_HISTORY_TOKEN_BUDGET = int(os.getenv("EDUSIMPLIFY_HISTORY_TOKEN_BUDGET", "1500"))
+
+# archive_conversations moves conversations idle for this many days out of the database
+EDUSIMPLIFY_RETENTION_DAYS = int(os.getenv("EDUSIMPLIFY_RETENTION_DAYS", "90"))
+
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS").split(",")
 
 CSRF_TRUSTED_ORIGINS = os.getenv("CSRF_TRUSTED_ORIGINS").split(",")
@@ -106,6 +129,37 @@ else:
     }
 
 
+# Cache
+# Shared by all workers: Redis when REDIS_URL is set, otherwise files on local disk
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "cache" / "django",
+        }
+    }
+
+# Generated images (summary, flags) can be handed off to the front proxy:
+# "x-accel-redirect" (nginx, with an internal location aliased to BASE_DIR/cache),
+# "x-sendfile" (Apache/lighttpd), "memory" to serve bytes cached in the worker
+# (least recently used images dropped beyond COUNTRIES_IMAGE_MEMORY_BYTES, 32 MB
+# by default), or unset to stream the file from Django
+COUNTRIES_IMAGE_DELIVERY = os.getenv("COUNTRIES_IMAGE_DELIVERY")
+COUNTRIES_IMAGE_ACCEL_PREFIX = os.getenv("COUNTRIES_IMAGE_ACCEL_PREFIX", "/protected/cache/")
+
+# Memory-mapped snapshot of the countries table, written by whichever worker
+# changes the data; must be storage shared by every host serving the API
+COUNTRIES_SNAPSHOT_DIR = os.getenv("COUNTRIES_SNAPSHOT_DIR", str(BASE_DIR / "cache" / "snapshots"))
+
+
 # Static files
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"